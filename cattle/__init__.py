@@ -6,7 +6,63 @@ from uuid import uuid4
 
 from cattle.utils import memoize
 
-CONFIG_OVERRIDE = {}
+
+class ConfigSnapshot(object):
+    '''
+    Config values resolved from CONFIG_OVERRIDE and the environment,
+    keyed by accessor.  Values stay until reload(), which happens on any
+    CONFIG_OVERRIDE write or an explicit Config.reload().
+    '''
+
+    def __init__(self):
+        self._values = {}
+
+    def get(self, key, resolve):
+        try:
+            return self._values[key]
+        except KeyError:
+            value = resolve()
+            self._values[key] = value
+            return value
+
+    def reload(self):
+        self._values = {}
+
+
+_SNAPSHOT = ConfigSnapshot()
+
+
+class _ConfigOverride(dict):
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        _SNAPSHOT.reload()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        _SNAPSHOT.reload()
+
+    def clear(self):
+        dict.clear(self)
+        _SNAPSHOT.reload()
+
+    def pop(self, *args):
+        try:
+            return dict.pop(self, *args)
+        finally:
+            _SNAPSHOT.reload()
+
+    def setdefault(self, key, default=None):
+        try:
+            return dict.setdefault(self, key, default)
+        finally:
+            _SNAPSHOT.reload()
+
+    def update(self, *args, **kw):
+        dict.update(self, *args, **kw)
+        _SNAPSHOT.reload()
+
+
+CONFIG_OVERRIDE = _ConfigOverride()
 
 
 try:
@@ -24,6 +80,23 @@ def default_value(name, default):
     return result
 
 
+def config_value(function):
+    '''
+    Resolve a config accessor once and serve it from the snapshot until
+    the next reload.
+    '''
+    key = (function.__module__, function.__name__)
+
+    def wrapper(*args, **kw):
+        if kw:
+            return function(*args, **kw)
+        return _SNAPSHOT.get(key + args, lambda: function(*args))
+
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
 _SCHEMAS = '/schemas'
 
 
@@ -41,6 +114,10 @@ class Config:
     def __init__(self):
         pass
 
+    @staticmethod
+    def reload():
+        _SNAPSHOT.reload()
+
     @staticmethod
     @memoize
     def _get_uuid_from_file(uuid_file):
@@ -60,10 +137,12 @@ class Config:
         return uuid
 
     @staticmethod
+    @config_value
     def state_dir():
         return default_value('STATE_DIR', Config.home())
 
     @staticmethod
+    @config_value
     def physical_host_uuid_file():
         def_value = '{0}/.physical_host_uuid'.format(Config.state_dir())
         return default_value('PHYSICAL_HOST_UUID_FILE', def_value)
@@ -75,10 +154,12 @@ class Config:
                                          force_write=force_write)
 
     @staticmethod
+    @config_value
     def setup_logger():
         return default_value('LOGGER', 'true') == 'true'
 
     @staticmethod
+    @config_value
     def do_ping():
         return default_value('PING_ENABLED', 'true') == 'true'
 
@@ -100,6 +181,7 @@ class Config:
         return default_value('HOSTNAME', socket.gethostname())
 
     @staticmethod
+    @config_value
     def workers():
         return int(default_value('WORKERS', '50'))
 
@@ -108,6 +190,7 @@ class Config:
         CONFIG_OVERRIDE['SECRET_KEY'] = value
 
     @staticmethod
+    @config_value
     def secret_key():
         return default_value('SECRET_KEY', 'adminpass')
 
@@ -116,6 +199,7 @@ class Config:
         CONFIG_OVERRIDE['ACCESS_KEY'] = value
 
     @staticmethod
+    @config_value
     def access_key():
         return default_value('ACCESS_KEY', 'admin')
 
@@ -124,14 +208,17 @@ class Config:
         CONFIG_OVERRIDE['URL'] = value
 
     @staticmethod
+    @config_value
     def api_url(default=None):
         return _strip_schemas(default_value('URL', default))
 
     @staticmethod
+    @config_value
     def api_auth():
         return Config.access_key(), Config.secret_key()
 
     @staticmethod
+    @config_value
     def config_url():
         ret = default_value('CONFIG_URL', None)
         if ret is None:
@@ -140,14 +227,17 @@ class Config:
             return ret
 
     @staticmethod
+    @config_value
     def is_multi_proc():
         return Config.multi_style() == 'proc'
 
     @staticmethod
+    @config_value
     def is_multi_thread():
         return Config.multi_style() == 'thread'
 
     @staticmethod
+    @config_value
     def is_eventlet():
         if 'eventlet' not in globals():
             return False
@@ -160,38 +250,85 @@ class Config:
         return False
 
     @staticmethod
+    @config_value
     def multi_style():
         return default_value('AGENT_MULTI', 'proc')
 
     @staticmethod
+    @config_value
     def queue_depth():
         return int(default_value('QUEUE_DEPTH', 5))
 
     @staticmethod
+    @config_value
     def stop_timeout():
         return int(default_value('STOP_TIMEOUT', 60))
 
     @staticmethod
+    @config_value
+    def process_max_backoff():
+        return float(default_value('PROCESS_MAX_BACKOFF', '60'))
+
+    @staticmethod
+    @config_value
+    def process_crash_loop_restarts():
+        return int(default_value('PROCESS_CRASH_LOOP_RESTARTS', '5'))
+
+    @staticmethod
+    @config_value
+    def process_crash_loop_window():
+        return float(default_value('PROCESS_CRASH_LOOP_WINDOW', '120'))
+
+    @staticmethod
+    @config_value
     def log():
         return default_value('AGENT_LOG_FILE', 'agent.log')
 
     @staticmethod
+    @config_value
+    def log_format():
+        # json or text
+        return default_value('LOG_FORMAT', 'text')
+
+    @staticmethod
+    @config_value
+    def log_queue_size():
+        return int(default_value('LOG_QUEUE_SIZE', '10000'))
+
+    @staticmethod
+    @config_value
+    def log_payload_max():
+        # Request and response JSON over this many bytes is cut, 0 for never
+        return int(default_value('LOG_PAYLOAD_MAX', '4096'))
+
+    @staticmethod
+    @config_value
+    def log_payload_sample():
+        # Fraction of payloads over the max logged in full
+        return float(default_value('LOG_PAYLOAD_SAMPLE', '0.01'))
+
+    @staticmethod
+    @config_value
     def debug():
         return default_value('DEBUG', 'false') == 'true'
 
     @staticmethod
+    @config_value
     def home():
         return default_value('HOME', '/var/lib/cattle')
 
     @staticmethod
+    @config_value
     def agent_ip():
         return default_value('AGENT_IP', None)
 
     @staticmethod
+    @config_value
     def agent_port():
         return default_value('AGENT_PORT', None)
 
     @staticmethod
+    @config_value
     def config_sh():
         return default_value('CONFIG_SCRIPT',
                              '{0}/config.sh'.format(Config.home()))
@@ -206,106 +343,297 @@ class Config:
         }
 
     @staticmethod
+    @config_value
     def api_proxy_listen_port():
         return int(default_value('API_PROXY_LISTEN_PORT', '9342'))
 
     @staticmethod
+    @config_value
     def api_proxy_listen_host():
         return default_value('API_PROXY_LISTEN_HOST', '0.0.0.0')
 
     @staticmethod
+    @config_value
     def agent_instance_cattle_home():
         return default_value('AGENT_INSTANCE_CATTLE_HOME', '/var/lib/cattle')
 
     @staticmethod
+    @config_value
     def container_state_dir():
         return path.join(Config.state_dir(), 'containers')
 
     @staticmethod
+    @config_value
     def lock_dir():
         return default_value('LOCK_DIR', os.path.join(Config.home(), 'locks'))
 
     @staticmethod
+    @config_value
     def client_certs_dir():
         client_dir = default_value('CLIENT_CERTS_DIR',
                                    os.path.join(Config.home(), 'client_certs'))
         return client_dir
 
     @staticmethod
+    @config_value
     def builds():
         return default_value('BUILD_DIR', os.path.join(Config.home(),
                                                        'builds'))
 
     @staticmethod
+    @config_value
     def stamp():
         return default_value('STAMP_FILE', os.path.join(Config.home(),
                                                         '.pyagent-stamp'))
 
     @staticmethod
+    @config_value
     def config_update_pyagent():
         return default_value('CONFIG_UPDATE_PYAGENT', 'true') == 'true'
 
     @staticmethod
+    @config_value
     def max_dropped_requests():
         return int(default_value('MAX_DROPPED_REQUESTS', '1000'))
 
     @staticmethod
+    @config_value
     def max_dropped_ping():
         return int(default_value('MAX_DROPPED_PING', '10'))
 
     @staticmethod
+    @config_value
     def cadvisor_port():
         return int(default_value('CADVISOR_PORT', '9344'))
 
     @staticmethod
+    @config_value
     def cadvisor_ip():
         return default_value('CADVISOR_IP', '127.0.0.1')
 
     @staticmethod
+    @config_value
     def cadvisor_interval():
         return default_value('CADVISOR_INTERVAL', '1s')
 
     @staticmethod
     def cadvisor_docker_root():
-        from cattle.plugins.docker import docker_client
-        return docker_client().info().get("DockerRootDir", None)
+        from cattle.plugins.docker import docker_info
+        return docker_info().get("DockerRootDir", None)
 
     @staticmethod
+    @config_value
     def cadvisor_opts():
         return default_value('CADVISOR_OPTS', None)
 
     @staticmethod
+    @config_value
+    def host_info_ttl(tier):
+        # Seconds to cache host info of a tier, negative caches forever
+        defaults = {'static': '-1', 'slow': '300', 'live': '0'}
+        return float(default_value('HOST_INFO_{0}_TTL'.format(tier.upper()),
+                                   defaults[tier]))
+
+    @staticmethod
+    @config_value
+    def host_info_backend():
+        # cadvisor or native
+        return default_value('HOST_INFO_BACKEND', 'cadvisor')
+
+    @staticmethod
+    @config_value
+    def native_proc_root():
+        default = '/host/proc' if os.path.exists('/host/proc/1') else '/proc'
+        return default_value('NATIVE_PROC_ROOT', default)
+
+    @staticmethod
+    @config_value
+    def native_cgroup_root():
+        # The host's cgroups, not the agent container's own
+        default = '/host/sys/fs/cgroup' \
+            if os.path.exists('/host/sys/fs/cgroup') else '/sys/fs/cgroup'
+        return default_value('NATIVE_CGROUP_ROOT', default)
+
+    @staticmethod
+    @config_value
+    def native_stats_interval():
+        return float(default_value('NATIVE_STATS_INTERVAL', '1'))
+
+    @staticmethod
+    @config_value
+    def native_stats_samples():
+        return int(default_value('NATIVE_STATS_SAMPLES', '60'))
+
+    @staticmethod
+    @config_value
+    def host_info_cpu_window():
+        return float(default_value('HOST_INFO_CPU_WINDOW', '60'))
+
+    @staticmethod
+    @config_value
+    def host_info_watch_interval():
+        # Seconds between checks for changes to files host info loads
+        return float(default_value('HOST_INFO_WATCH_INTERVAL', '10'))
+
+    @staticmethod
+    @config_value
+    def iops_state_dir():
+        # Where fio, or the built in benchmark, leaves read and write.json
+        return default_value('IOPS_STATE_DIR', '/var/lib/rancher/state')
+
+    @staticmethod
+    @config_value
+    def disk_bench_on_startup():
+        return default_value('DISK_BENCH_ON_STARTUP', 'false') == 'true'
+
+    @staticmethod
+    @config_value
+    def disk_bench_file():
+        default = path.join(Config.iops_state_dir(), '.disk-bench')
+        return default_value('DISK_BENCH_FILE', default)
+
+    @staticmethod
+    @config_value
+    def disk_bench_size():
+        # Megabytes of scratch file
+        return int(default_value('DISK_BENCH_SIZE', '64')) * 1024 * 1024
+
+    @staticmethod
+    @config_value
+    def disk_bench_duration():
+        # Seconds each of the read and write runs take
+        return float(default_value('DISK_BENCH_DURATION', '2'))
+
+    @staticmethod
+    @config_value
+    def host_info_deadline():
+        return float(default_value('HOST_INFO_DEADLINE', '4'))
+
+    @staticmethod
+    @config_value
+    def host_info_timeout(key_name):
+        default = default_value('HOST_INFO_TIMEOUT', '3')
+        name = 'HOST_INFO_{0}_TIMEOUT'.format(key_name.upper())
+        return float(default_value(name, default))
+
+    @staticmethod
+    @config_value
+    def container_stats_limit():
+        # Most containers a ping's containerStats may report on
+        return int(default_value('CONTAINER_STATS_LIMIT', '20'))
+
+    @staticmethod
+    @config_value
+    def host_metrics_enabled():
+        return default_value('HOST_METRICS_ENABLED', 'false') == 'true'
+
+    @staticmethod
+    @config_value
+    def host_metrics_interval():
+        return float(default_value('HOST_METRICS_INTERVAL', '10'))
+
+    @staticmethod
+    @config_value
+    def host_metrics_ping_window():
+        # Seconds of history sent when a ping asks for hostMetrics: true
+        return float(default_value('HOST_METRICS_PING_WINDOW', '300'))
+
+    @staticmethod
+    @config_value
     def host_api_ip():
         return default_value('HOST_API_IP', '0.0.0.0')
 
     @staticmethod
+    @config_value
     def host_api_port():
         return int(default_value('HOST_API_PORT', '9345'))
 
     @staticmethod
+    @config_value
+    def metrics_ip():
+        return default_value('METRICS_IP', '127.0.0.1')
+
+    @staticmethod
+    @config_value
+    def metrics_port():
+        # 0 turns the metrics endpoint off
+        return int(default_value('METRICS_PORT', '9347'))
+
+    @staticmethod
+    @config_value
     def console_agent_port():
         return int(default_value('CONSOLE_AGENT_PORT', '9346'))
 
     @staticmethod
+    @config_value
     def jwt_public_key_file():
         value = os.path.join(Config.home(), 'etc', 'cattle', 'api.crt')
         return default_value('CONSOLE_HOST_API_PUBLIC_KEY', value)
 
     @staticmethod
+    @config_value
     def host_api_config_file():
         default_path = os.path.join(Config.home(), 'etc', 'cattle',
                                     'host-api.conf')
         return default_value('HOST_API_CONFIG_FILE', default_path)
 
     @staticmethod
+    @config_value
     def host_proxy():
         return default_value('HOST_API_PROXY', None)
 
     @staticmethod
+    @config_value
+    def trace_file():
+        # JSON lines of event traces, not written when empty
+        return default_value('TRACE_FILE', '')
+
+    @staticmethod
+    @config_value
+    def trace_sample():
+        # Fraction of events traced
+        return float(default_value('TRACE_SAMPLE', '1'))
+
+    @staticmethod
+    @config_value
+    def trace_ping_sample():
+        return float(default_value('TRACE_PING_SAMPLE', '0.01'))
+
+    @staticmethod
+    @config_value
+    def profile_dir():
+        return default_value('PROFILE_DIR',
+                             os.path.join(Config.home(), 'profile'))
+
+    @staticmethod
+    @config_value
+    def profile_interval():
+        # Seconds between stack samples
+        return float(default_value('PROFILE_INTERVAL', '0.01'))
+
+    @staticmethod
+    @config_value
+    def profile_duration():
+        return float(default_value('PROFILE_DURATION', '30'))
+
+    @staticmethod
+    @config_value
+    def profile_max_duration():
+        return float(default_value('PROFILE_MAX_DURATION', '300'))
+
+    @staticmethod
+    @config_value
+    def profile_signal():
+        # Signal that starts profiling, none when empty
+        return default_value('PROFILE_SIGNAL', 'SIGUSR2')
+
+    @staticmethod
+    @config_value
     def event_read_timeout():
         return int(default_value('EVENT_READ_TIMEOUT', '60'))
 
     @staticmethod
+    @config_value
     def eventlet_backdoor():
         val = default_value('EVENTLET_BACKDOOR', None)
         if val:
@@ -314,6 +642,7 @@ class Config:
             return None
 
     @staticmethod
+    @config_value
     def cadvisor_wrapper():
         return default_value('CADVISOR_WRAPPER', '')
 
@@ -7,6 +7,12 @@ import websocket
 import base64
 
 from cattle import Config
+from cattle import liveness
+from cattle import logs
+from cattle import metrics
+from cattle import profiler
+from cattle import startup_profile
+from cattle import trace
 from cattle import type_manager
 from cattle import utils
 from cattle.agent import Agent
@@ -16,7 +22,23 @@ from cattle.concurrency import Queue, Full, Empty, run, spawn
 
 
 log = logging.getLogger("agent")
-_STAMP_TS = None
+
+QUEUES = (utils.WORK, utils.PING)
+
+RECEIVED = metrics.counter('cattle_events_received_total',
+                           'Events read from the websocket', 'queue', QUEUES)
+DROPPED = metrics.counter('cattle_events_dropped_total',
+                          'Events dropped because the queue was full',
+                          'queue', QUEUES)
+QUEUED = metrics.gauge('cattle_queue_depth',
+                       'Events waiting for a worker', 'queue', QUEUES)
+WORKERS = metrics.gauge('cattle_workers', 'Worker count', 'queue', QUEUES)
+BUSY = metrics.gauge('cattle_workers_busy', 'Workers handling an event',
+                     'queue', QUEUES)
+BUSY_SECONDS = metrics.counter('cattle_worker_busy_seconds_total',
+                               'Time workers spent handling events, divide '
+                               'its rate by cattle_workers for utilization',
+                               'queue', QUEUES)
 
 
 def _get_event_suffix(agent_id):
@@ -41,28 +63,28 @@ def _events_query_string(events, agent_id):
     return qs
 
 
-def _check_ts():
-    stamp_file = Config.stamp()
-    if not os.path.exists(stamp_file):
-        return True
-
-    ts = os.path.getmtime(stamp_file)
-    global _STAMP_TS
-
-    if _STAMP_TS is None:
-        _STAMP_TS = ts
+def _parse(marshaller, line):
+    # Parsed once, on the reader, which needs the kind to pick a queue.
+    # Workers take the request as it is.
+    try:
+        return marshaller.from_string(line)
+    except ValueError:
+        log.error('Dropping request that is not JSON: %s', line)
+        return None
 
-    return _STAMP_TS == ts
 
+def _on_liveness_event(event, value):
+    if event == liveness.STAMP_CHANGED:
+        log.info('Stamp file %s changed', value)
+        Config.reload()
+    elif event == liveness.PROCESS_EXITED:
+        log.info('Parent process %s exited', value)
 
-def _should_run(pid):
-    if not _check_ts():
-        return False
 
-    if pid is None:
-        return True
-    else:
-        return os.path.exists('/proc/%s' % pid)
+def _liveness(pid):
+    watcher = liveness.watch(Config.stamp(), pid)
+    watcher.add_listener(_on_liveness_event)
+    return watcher
 
 
 def _worker(worker_name, queue, ppid):
@@ -72,27 +94,39 @@ def _worker(worker_name, queue, ppid):
         log.exception('%s : Exiting Exception', worker_name)
     finally:
         log.error('%s : Exiting', worker_name)
+        logs.flush(timeout=5)
 
 
 def _worker_main(worker_name, queue, ppid):
+    label = utils.PING if worker_name == 'ping' else utils.WORK
+    profiler.watch(worker_name)
     agent = Agent()
-    marshaller = type_manager.get_type(type_manager.MARSHALLER)
+    watcher = _liveness(ppid)
     publisher = type_manager.get_type(type_manager.PUBLISHER)
     while True:
         try:
             req = None
-            line = queue.get(True, 5)
+            busy = None
+            received, parse, req, line = queue.get(True, 5)
+            busy = time.time()
+            QUEUED.dec(label=label)
+            BUSY.inc(label=label)
 
-            req = marshaller.from_string(line)
+            t = trace.begin(received)
+            t.add('parse', parse)
+            t.add('queue', busy - received - parse)
+            t.id = req.id
+            t.name = req.name
 
-            utils.log_request(req, log, 'Request: %s', line)
+            utils.log_request(req, log, 'Request: %s', logs.Payload(line))
 
             id = req.id
             start = time.time()
             try:
                 utils.log_request(req, log, '%s : Starting request %s for %s',
                                   worker_name, id, req.name)
-                resp = agent.execute(req)
+                with trace.span('handler'):
+                    resp = agent.execute(req)
                 if resp is not None:
                     publisher.publish(resp)
             finally:
@@ -101,18 +135,18 @@ def _worker_main(worker_name, queue, ppid):
                                   '%s : Done request %s for %s [%s] seconds',
                                   worker_name, id, req.name, duration)
         except Empty:
-            if not _should_run(ppid):
+            if not watcher.alive():
                 break
         except FailedToLock as e:
             log.info("%s for %s", e, req.name)
-            if not _should_run(ppid):
+            if not watcher.alive():
                 break
         except Exception as e:
             if id is not None:
                 log.exception('Error in request : %s', id)
             else:
                 log.exception("Unknown error")
-            if not _should_run(ppid):
+            if not watcher.alive():
                 break
 
             resp = utils.reply(req)
@@ -120,6 +154,11 @@ def _worker_main(worker_name, queue, ppid):
                 resp["transitioning"] = "error"
                 resp["transitioningInternalMessage"] = "{0}".format(e)
                 publisher.publish(resp)
+        finally:
+            if busy is not None:
+                BUSY.dec(label=label)
+                BUSY_SECONDS.inc(time.time() - busy, label=label)
+            trace.end()
 
 
 class EventClient:
@@ -140,6 +179,8 @@ class EventClient:
 
     def _start_children(self):
         pid = os.getpid()
+        WORKERS.set(self._workers, label=utils.WORK)
+        WORKERS.set(1, label=utils.PING)
         for i in range(self._workers):
             p = spawn(target=_worker, args=('worker{0}'.format(i),
                                             self._queue, pid))
@@ -149,11 +190,17 @@ class EventClient:
         self._children.append(p)
 
     def run(self, events):
-        _check_ts()
+        # Record the stamp and create shared metrics before workers fork
+        _liveness(None)
+        trace.init(events)
+        profiler.init()
+        profiler.install_signal()
+        profiler.watch('agent')
         run(self._run, events)
 
     def _run(self, events):
         ppid = os.environ.get("AGENT_PARENT_PID")
+        watcher = _liveness(ppid)
         headers = []
 
         if self._auth is not None:
@@ -165,6 +212,8 @@ class EventClient:
         query_string = _events_query_string(events, self._agent_id)
         subscribe_url = subscribe_url + '?' + query_string
 
+        marshaller = type_manager.get_type(type_manager.MARSHALLER)
+
         try:
             drops = {
                 'drop_count': 0,
@@ -173,24 +222,32 @@ class EventClient:
             self._start_children()
 
             def on_message(ws, message):
+                received = time.time()
                 line = message.strip()
+                req = _parse(marshaller, line) if len(line) > 0 else None
+                kind = utils.classify(req)
                 try:
-                    ping = '"ping' in line
-                    if len(line) > 0:
-                        # TODO Need a better approach here
-                        if ping:
-                            self._ping_queue.put(line, block=False)
+                    if req is not None:
+                        item = (received, time.time() - received, req, line)
+                        RECEIVED.inc(label=kind)
+                        # Count before the put so a worker never takes
+                        # the depth below zero
+                        QUEUED.inc(label=kind)
+                        if kind == utils.PING:
+                            self._ping_queue.put(item, block=False)
                             drops['ping_drop'] = 0
                         else:
-                            self._queue.put(line, block=False)
+                            self._queue.put(item, block=False)
                 except Full:
                     log.info("Dropping request %s" % line)
+                    QUEUED.dec(label=kind)
+                    DROPPED.inc(label=kind)
                     drops['drop_count'] += 1
                     drop_max = Config.max_dropped_requests()
                     drop_type = 'overall'
                     drop_test = drops['drop_count']
 
-                    if ping:
+                    if kind == utils.PING:
                         drops['ping_drop'] += 1
                         drop_type = 'ping'
                         drop_test = drops['ping_drop']
@@ -201,7 +258,7 @@ class EventClient:
                                   drop_max, drop_type)
                         ws.close()
 
-                if not _should_run(ppid):
+                if not watcher.alive():
                     log.info("Parent process has died or stamp changed,"
                              " exiting")
                     ws.close()
@@ -214,14 +271,28 @@ class EventClient:
 
             def on_open(ws):
                 log.info('Websocket connection opened')
+                if startup_profile.enabled():
+                    startup_profile.record('phase', 'websocket', connect,
+                                           time.time() - connect)
+                    startup_profile.finish()
 
             websocket.setdefaulttimeout(Config.event_read_timeout())
+            connect = time.time()
             ws = websocket.WebSocketApp(subscribe_url,
                                         header=headers,
                                         on_message=on_message,
                                         on_error=on_error,
                                         on_close=on_close,
                                         on_open=on_open)
+
+            def on_liveness(event, value):
+                # Don't wait for the next message to notice
+                if not watcher.alive():
+                    log.info("Parent process has died or stamp changed,"
+                             " closing websocket")
+                    ws.close()
+
+            watcher.add_listener(on_liveness)
             ws.run_forever(ping_interval=5, ping_timeout=4)
 
         finally:
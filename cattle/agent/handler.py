@@ -34,6 +34,22 @@ class BaseHandler(object):
             return method(req=req, **req.data.__dict__)
 
     def _get_method_for(self, req):
+        # Subclasses don't always call BaseHandler.__init__, so create the
+        # cache on first use.  Keyed on the full event name since that is a
+        # small, fixed set per agent.
+        try:
+            methods = self._methods
+        except AttributeError:
+            methods = self._methods = {}
+
+        try:
+            return methods[req.name]
+        except KeyError:
+            method = self._find_method_for(req)
+            methods[req.name] = method
+            return method
+
+    def _find_method_for(self, req):
         prefix = ''
         category = self._get_handler_category(req)
         if len(category) > 0:
@@ -111,20 +127,65 @@ class KindBasedMixin(object):
         ["instancePull", "kind"]
     ]
 
+    # Where the kind lives for each event a kind based driver handles.
+    # Drivers handling other events can extend this; anything not listed is
+    # resolved by probing CHECK_PATHS once per event name.
+    KIND_PATHS = {
+        'storage.image.activate': CHECK_PATHS[0],
+        'compute.instance.activate': CHECK_PATHS[1],
+        'compute.instance.deactivate': CHECK_PATHS[1],
+        'compute.instance.remove': CHECK_PATHS[1],
+        'compute.instance.force.stop': CHECK_PATHS[2],
+        'compute.instance.inspect': CHECK_PATHS[3],
+        'compute.instance.pull': CHECK_PATHS[4],
+    }
+
+    _RESOLVED_PATHS = {}
+
     def __init__(self, kind=None):
         super(KindBasedMixin, self).__init__()
         self._kind = kind
 
     def _check_supports(self, req):
+        path = self._get_kind_path(req)
+        if path is None:
+            return False
+
+        return _get_path(req.data, path) == self._kind
+
+    def _get_kind_path(self, req):
+        name = req.name.split(';', 1)[0]
+
+        try:
+            return self.KIND_PATHS[name]
+        except KeyError:
+            pass
+
+        try:
+            return KindBasedMixin._RESOLVED_PATHS[name]
+        except KeyError:
+            pass
+
         for check in KindBasedMixin.CHECK_PATHS:
-            val = req.data
-            try:
-                for part in check:
-                    val = val[part]
+            kind = _get_path(req.data, check)
+            if kind is _MISSING:
+                continue
+            # Only remember a path that actually held a kind, a partial
+            # payload shouldn't decide it for every later event
+            if kind is not None:
+                KindBasedMixin._RESOLVED_PATHS[name] = check
+            return check
+
+        return None
+
+
+_MISSING = object()
 
-                if val == self._kind:
-                    return True
-            except KeyError:
-                pass
 
-        return False
+def _get_path(obj, path):
+    try:
+        for part in path:
+            obj = obj[part]
+        return obj
+    except (KeyError, TypeError):
+        return _MISSING
@@ -0,0 +1,300 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import signal
+import struct
+import time
+from threading import Thread, Lock
+
+log = logging.getLogger('liveness')
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_STAMP_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT_HEADER = struct.Struct('iIII')
+
+# pidfd_open uses the same number on every architecture (Linux 5.3+)
+_NR_PIDFD_OPEN = 434
+_PR_SET_PDEATHSIG = 1
+_PR_GET_PDEATHSIG = 2
+
+STAMP_CHANGED = 'stamp'
+PROCESS_EXITED = 'exit'
+
+try:
+    _LIBC = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+except:
+    _LIBC = None
+
+
+def _check_call(result):
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+def inotify_init():
+    return _check_call(_LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+
+def inotify_add_watch(fd, path, mask):
+    return _check_call(_LIBC.inotify_add_watch(fd, path, mask))
+
+
+def pidfd_open(pid):
+    return _check_call(_LIBC.syscall(_NR_PIDFD_OPEN, int(pid), 0))
+
+
+def set_pdeathsig(sig=signal.SIGTERM):
+    '''
+    Ask the kernel to send sig to this process when the thread that forked
+    it exits.  Returns False if the platform doesn't support it.
+    '''
+    try:
+        _check_call(_LIBC.prctl(_PR_SET_PDEATHSIG, sig, 0, 0, 0))
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def pdeathsig_supported():
+    try:
+        sig = ctypes.c_int()
+        _check_call(_LIBC.prctl(_PR_GET_PDEATHSIG, ctypes.byref(sig), 0, 0,
+                                0))
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _pid_exists(pid):
+    return os.path.exists('/proc/{0}'.format(pid))
+
+
+class Liveness(object):
+    '''
+    Watches the agent stamp file and a set of pids from a background thread
+    and turns changes into STAMP_CHANGED and PROCESS_EXITED events for the
+    registered listeners.  alive() only reads flags, so it is cheap enough
+    to call on every message.
+
+    The stamp file is watched with inotify and pids with pidfds.  Anything
+    that can't be watched that way (old kernels, missing stamp directory,
+    non Linux) falls back to polling every interval seconds.
+    '''
+
+    def __init__(self, stamp_file=None, pid=None, stamp_ts=None,
+                 interval=2):
+        self.stamp_file = stamp_file
+        self.pid = pid
+        self.stamp_ts = stamp_ts
+        self.stamp_changed = False
+        self.parent_exited = False
+        self.interval = interval
+        self._listeners = []
+        self._lock = Lock()
+        self._pidfds = {}
+        self._polled = {}
+        self._inotify = None
+        self._wd = None
+        self._wake_r, self._wake_w = os.pipe()
+
+        if self.stamp_ts is None and self.stamp_file is not None:
+            self.stamp_ts = _mtime(self.stamp_file)
+
+    def alive(self):
+        return not (self.stamp_changed or self.parent_exited)
+
+    def add_listener(self, listener):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def start(self):
+        if self.stamp_file is not None:
+            self._watch_stamp()
+
+        if self.pid is not None:
+            self.watch_pid(self.pid)
+
+        t = Thread(target=self._run, name='liveness')
+        t.setDaemon(True)
+        t.start()
+        return self
+
+    def watch_pid(self, pid, check=None):
+        '''
+        Emit PROCESS_EXITED for pid once it exits.  check is used instead of
+        /proc/<pid> when polling, for example Popen.poll for children that
+        would otherwise linger as zombies.
+        '''
+        try:
+            fd = pidfd_open(pid)
+            with self._lock:
+                self._pidfds[fd] = pid
+        except (AttributeError, OSError):
+            if check is None:
+                def check():
+                    return _pid_exists(pid)
+            with self._lock:
+                self._polled[pid] = check
+
+        os.write(self._wake_w, 'x')
+
+    def _watch_stamp(self):
+        try:
+            self._inotify = inotify_init()
+            self._wd = inotify_add_watch(self._inotify,
+                                         os.path.dirname(self.stamp_file),
+                                         _STAMP_MASK)
+        except (AttributeError, OSError):
+            log.info('Polling %s for changes', self.stamp_file)
+            if self._inotify is not None:
+                os.close(self._inotify)
+            self._inotify = None
+
+    def _run(self):
+        while True:
+            try:
+                self._wait()
+            except:
+                log.exception('Error watching liveness')
+                time.sleep(self.interval)
+
+    def _wait(self):
+        with self._lock:
+            fds = [self._wake_r] + self._pidfds.keys()
+            polling = len(self._polled) > 0
+
+        if self._inotify is not None:
+            fds.append(self._inotify)
+        elif self.stamp_file is not None:
+            polling = True
+
+        timeout = self.interval if polling else None
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+
+        for fd in readable:
+            if fd == self._wake_r:
+                os.read(fd, 4096)
+            elif fd == self._inotify:
+                self._read_inotify()
+            else:
+                self._pidfd_exited(fd)
+
+        if polling:
+            self._poll()
+
+    def _read_inotify(self):
+        try:
+            buf = os.read(self._inotify, 4096)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+
+        name = os.path.basename(self.stamp_file)
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            _, _, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            event_name = buf[offset:offset + length].rstrip('\0')
+            offset += length
+            if event_name == name:
+                self._check_stamp()
+
+    def _check_stamp(self):
+        ts = _mtime(self.stamp_file)
+        if ts is None:
+            return
+
+        if self.stamp_ts is None:
+            self.stamp_ts = ts
+        elif ts != self.stamp_ts and not self.stamp_changed:
+            self.stamp_changed = True
+            self._fire(STAMP_CHANGED, self.stamp_file)
+
+    def _pidfd_exited(self, fd):
+        with self._lock:
+            pid = self._pidfds.pop(fd, None)
+        os.close(fd)
+        if pid is not None:
+            self._exited(pid)
+
+    def _poll(self):
+        if self._inotify is None and self.stamp_file is not None:
+            self._check_stamp()
+
+        with self._lock:
+            polled = self._polled.items()
+
+        for pid, check in polled:
+            if not check():
+                with self._lock:
+                    self._polled.pop(pid, None)
+                self._exited(pid)
+
+    def _exited(self, pid):
+        if pid == self.pid:
+            self.parent_exited = True
+        self._fire(PROCESS_EXITED, pid)
+
+    def _fire(self, event, value):
+        for listener in self._listeners:
+            try:
+                listener(event, value)
+            except:
+                log.exception('Error in liveness listener')
+
+
+_WATCHERS = {}
+_WATCHERS_PID = [None]
+_STAMP_TS = {}
+
+
+def watch(stamp_file, pid=None):
+    '''
+    Return the started Liveness for stamp_file and pid in this process.
+    Watcher threads don't survive a fork, so a forked worker starts its own,
+    comparing against the stamp time first seen before the fork.
+    '''
+    if pid is not None:
+        pid = int(pid)
+
+    if _WATCHERS_PID[0] != os.getpid():
+        _WATCHERS.clear()
+        _WATCHERS_PID[0] = os.getpid()
+
+    key = (stamp_file, pid)
+    try:
+        return _WATCHERS[key]
+    except KeyError:
+        pass
+
+    watcher = Liveness(stamp_file, pid=pid,
+                       stamp_ts=_STAMP_TS.get(stamp_file))
+    if watcher.stamp_ts is not None:
+        _STAMP_TS.setdefault(stamp_file, watcher.stamp_ts)
+
+    _WATCHERS[key] = watcher.start()
+    return watcher
@@ -1,6 +1,13 @@
 import portalocker
 import os
+import time
 from cattle import Config
+from cattle import metrics
+from cattle import trace
+
+ACQUIRED = metrics.counter('cattle_locks_total', 'Resource locks taken')
+FAILED = metrics.counter('cattle_lock_failures_total',
+                         'Resource locks already held by another worker')
 
 
 class FailedToLock(Exception):
@@ -13,10 +20,16 @@ class LockWrapper(object):
         self._lock = lock
 
     def __enter__(self):
+        start = time.time()
         try:
-            return self._lock.__enter__()
+            result = self._lock.__enter__()
+            ACQUIRED.inc()
+            return result
         except portalocker.AlreadyLocked:
+            FAILED.inc()
             raise FailedToLock("Failed to lock [{0}]".format(self._name))
+        finally:
+            trace.add('lock', time.time() - start)
 
     def __exit__(self, type, value, tb):
         if os.path.exists(self._lock.filename):
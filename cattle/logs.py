@@ -0,0 +1,217 @@
+'''
+Logging off the event hot path.
+
+QueueHandler puts records on a bounded queue and a writer thread hands
+them to the real handlers, so workers never wait on the log file.  When
+the queue is full records are dropped and counted rather than blocking.
+Messages are formatted by the writer, unless their arguments might
+change before it gets to them.
+
+JsonFormatter writes one JSON object per record, with the id and name of
+the event the logging thread was handling.  Payload wraps request and
+response JSON so it is only turned into a string if the record is
+written, and cut to Config.log_payload_max() bytes unless picked by
+Config.log_payload_sample().
+'''
+
+import json
+import logging
+import os
+import random
+import time
+
+from cattle import Config
+from cattle import metrics
+from cattle import trace
+
+if Config.is_eventlet():
+    from eventlet import patcher
+    # A real thread, so a slow disk doesn't stall the hub
+    _threading = patcher.original('threading')
+    _queue = patcher.original('Queue')
+else:
+    import threading as _threading
+    import Queue as _queue
+
+DROPPED = metrics.counter('cattle_log_records_dropped_total',
+                          'Log records dropped because the queue was full')
+
+# Arguments that can be formatted later as they are
+_IMMUTABLE = (basestring, int, long, float, bool, type(None))
+
+
+class Payload(object):
+    def __init__(self, content):
+        self.content = content
+
+    def __str__(self):
+        content = self.content
+        limit = Config.log_payload_max()
+        if not limit or len(content) <= limit or \
+                random.random() < Config.log_payload_sample():
+            return content
+        return '{0}... [{1} bytes]'.format(content[:limit], len(content))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            'thread': record.threadName,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        event_id = getattr(record, 'eventId', None)
+        if event_id is not None:
+            data['eventId'] = event_id
+            data['eventName'] = record.eventName
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data)
+
+
+class QueueHandler(logging.Handler):
+    '''
+    Hands records to handlers on a writer thread.  Each process gets its
+    own queue and writer, started on its first record, since threads
+    don't survive the fork of the workers.
+    '''
+
+    def __init__(self, handlers, size=None):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        self.size = Config.log_queue_size() if size is None else size
+        self._pid = None
+        self._queue = None
+        self._writer = None
+        self._start_lock = _threading.Lock()
+        self._dropped = 0
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked, maybe while the parent's writer held the locks of
+                # the handlers, which would then stay held here for good
+                for handler in self.handlers:
+                    handler.createLock()
+            self._queue = _queue.Queue(self.size)
+            self._writer = _threading.Thread(target=self._write,
+                                             args=(self._queue,),
+                                             name='log-writer')
+            self._writer.setDaemon(True)
+            self._writer.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        t = trace.current()
+        if t is not None:
+            record.eventId = t.id
+            record.eventName = t.name
+
+        if record.args and not (
+                isinstance(record.args, tuple) and
+                all(isinstance(a, _IMMUTABLE + (Payload,))
+                    for a in record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+
+        if record.exc_info:
+            # Tracebacks hold on to frames, keep the text instead
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+
+    def handle(self, record):
+        # No lock, emit only puts on a queue, and a lock held by another
+        # thread of the parent when a worker forks is never released in it
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.prepare(record)
+            self._queue.put_nowait(record)
+        except _queue.Full:
+            self._dropped += 1
+            DROPPED.inc()
+        except:
+            self.handleError(record)
+
+    def _write(self, queue):
+        dropped = 0
+        while True:
+            record = queue.get()
+            try:
+                if record is None:
+                    break
+
+                if self._dropped != dropped:
+                    self._handle(_dropped_record(self._dropped - dropped))
+                    dropped = self._dropped
+
+                self._handle(record)
+            finally:
+                queue.task_done()
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush(self, timeout=5):
+        '''Wait up to timeout seconds for the queued records to be handled'''
+        if self._pid != os.getpid():
+            return
+        end = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < end:
+            time.sleep(0.01)
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        if self._pid == os.getpid():
+            self.flush()
+            try:
+                self._queue.put_nowait(None)
+                self._writer.join(5)
+            except _queue.Full:
+                pass
+            self._pid = None
+        for handler in self.handlers:
+            handler.close()
+        logging.Handler.close(self)
+
+
+def flush(timeout=5):
+    '''
+    Write out the records this process queued, waiting at most timeout
+    seconds.  Forked workers end in os._exit, which skips the atexit close
+    of the handlers.
+    '''
+    t = _threading.Thread(target=_flush_root, name='log-flush')
+    t.setDaemon(True)
+    t.start()
+    t.join(timeout)
+
+
+def _flush_root():
+    for handler in logging.root.handlers:
+        handler.flush()
+
+
+def _dropped_record(count):
+    return logging.LogRecord('logs', logging.WARN, __file__, 0,
+                             'Dropped %s log records, the queue was full',
+                             (count,), None)
@@ -0,0 +1,234 @@
+'''
+Counters, gauges and histograms for the agent's own metrics.
+
+Values live in shared memory, so metrics created in the agent process
+before the workers fork add up the updates of every worker.  A metric
+may have a label, or a tuple of them, with a fixed set of values given
+up front, since shared memory can't grow after the fork.  An update
+takes one uncontended lock, cheap enough for every event or Docker
+call.  Callback metrics are read when rendered instead, for state of
+the agent process whose label values only show up at runtime.
+'''
+
+import bisect
+from collections import OrderedDict
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray
+
+# Seconds, from a fast inspect to a slow pull
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30)
+
+_METRICS = OrderedDict()
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, help, label=None, values=None, width=1):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = list(values) if label else [None]
+        self._index = dict((v, i) for i, v in enumerate(self.values))
+        self.width = width
+        self._data = RawArray('d', len(self.values) * width)
+        self._lock = Lock()
+
+    def _offset(self, value):
+        return self._index[value] * self.width
+
+    def _read(self):
+        with self._lock:
+            data = self._data[:]
+        return [data[i * self.width:(i + 1) * self.width]
+                for i in range(len(self.values))]
+
+    def _labels(self, value, extra=None):
+        labels = []
+        if isinstance(self.label, tuple):
+            labels.extend(zip(self.label, value))
+        elif self.label:
+            labels.append((self.label, value))
+        if extra:
+            labels.append(extra)
+        if not labels:
+            return ''
+        return '{' + ','.join('{0}="{1}"'.format(k, _escape(v))
+                              for k, v in labels) + '}'
+
+    def render(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.help),
+                 '# TYPE {0} {1}'.format(self.name, self.kind)]
+        for value, row in zip(self.values, self._read()):
+            lines.append('{0}{1} {2}'.format(self.name, self._labels(value),
+                                             _number(row[0])))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, label=None):
+        offset = self._offset(label)
+        with self._lock:
+            self._data[offset] += amount
+
+    def get(self, label=None):
+        return self._data[self._offset(label)]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, label=None):
+        self.inc(-amount, label)
+
+    def set(self, value, label=None):
+        offset = self._offset(label)
+        with self._lock:
+            self._data[offset] = value
+
+
+class Callback(_Metric):
+    '''
+    Values read from fn() when rendered, as {label value: number}, for
+    state the agent process keeps itself, such as its supervised children,
+    whose label values aren't known up front.  Only the process rendering
+    the metrics sees them.  None values are left out.
+    '''
+
+    def __init__(self, name, help, label, fn, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.help),
+                 '# TYPE {0} {1}'.format(self.name, self.kind)]
+        for value, number in sorted(self.fn().items()):
+            if number is not None:
+                lines.append('{0}{1} {2}'.format(
+                    self.name, self._labels(value), _number(number)))
+        return lines
+
+
+class Histogram(_Metric):
+    '''
+    Counts of observations per bucket, then the count of all
+    observations and their sum, for each label value.
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name, help, label=None, values=None,
+                 buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super(Histogram, self).__init__(name, help, label, values,
+                                        width=len(self.buckets) + 2)
+
+    def observe(self, amount, label=None):
+        offset = self._offset(label)
+        bucket = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            if bucket < len(self.buckets):
+                self._data[offset + bucket] += 1
+            self._data[offset + self.width - 2] += 1
+            self._data[offset + self.width - 1] += amount
+
+    def snapshot(self):
+        '''
+        {label value: {count, sum, buckets}} for label values with
+        observations, buckets being cumulative counts per upper bound.
+        '''
+        result = {}
+        for value, row in zip(self.values, self._read()):
+            count = row[-2]
+            if not count:
+                continue
+            cumulative = []
+            total = 0
+            for n in row[:-2]:
+                total += n
+                cumulative.append(total)
+            result[value] = {
+                'count': int(count),
+                'sum': row[-1],
+                'buckets': zip(self.buckets, cumulative),
+            }
+        return result
+
+    def render(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.help),
+                 '# TYPE {0} {1}'.format(self.name, self.kind)]
+        for value, row in zip(self.values, self._read()):
+            total = 0
+            for bound, n in zip(self.buckets, row[:-2]):
+                total += n
+                lines.append('{0}_bucket{1} {2}'.format(
+                    self.name, self._labels(value, ('le', _number(bound))),
+                    _number(total)))
+            lines.append('{0}_bucket{1} {2}'.format(
+                self.name, self._labels(value, ('le', '+Inf')),
+                _number(row[-2])))
+            lines.append('{0}_sum{1} {2}'.format(
+                self.name, self._labels(value), _number(row[-1])))
+            lines.append('{0}_count{1} {2}'.format(
+                self.name, self._labels(value), _number(row[-2])))
+        return lines
+
+
+def quantile(snapshot, q):
+    '''
+    The upper bound of the bucket holding the q quantile of a
+    Histogram.snapshot() entry, or None if it is past the last bucket.
+    '''
+    rank = q * snapshot['count']
+    for bound, count in snapshot['buckets']:
+        if count >= rank:
+            return bound
+    return None
+
+
+def _number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def _register(cls, name, *args, **kw):
+    try:
+        return _METRICS[name]
+    except KeyError:
+        metric = _METRICS[name] = cls(name, *args, **kw)
+        return metric
+
+
+def counter(name, help, label=None, values=None):
+    return _register(Counter, name, help, label, values)
+
+
+def gauge(name, help, label=None, values=None):
+    return _register(Gauge, name, help, label, values)
+
+
+def histogram(name, help, label=None, values=None, buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help, label, values, buckets=buckets)
+
+
+def callback(name, help, label, fn, kind='gauge'):
+    return _register(Callback, name, help, label, fn, kind=kind)
+
+
+def render():
+    '''Every metric in the Prometheus text exposition format'''
+    lines = []
+    for metric in _METRICS.values():
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -3,6 +3,8 @@ import os
 import imp
 import logging
 
+from cattle import startup_profile
+
 
 log = logging.getLogger("agent")
 
@@ -14,8 +16,9 @@ def _load(module, plugin_path):
 
     log.info("Loading Plugin: %s from %s", module, plugin_path)
     try:
-        m = imp.find_module(module, [plugin_path])
-        return imp.load_module(std_name, m[0], m[1], m[2])
+        with startup_profile.timed('plugin', module):
+            m = imp.find_module(module, [plugin_path])
+            return imp.load_module(std_name, m[0], m[1], m[2])
     except Exception:
         log.exception('Exception loading module')
 
@@ -3,7 +3,7 @@ import os
 import shlex
 
 from cattle import Config
-from cattle.process_manager import background
+from cattle.process_manager import supervise
 
 log = logging.getLogger('cadvisor')
 
@@ -11,6 +11,10 @@ log = logging.getLogger('cadvisor')
 class Cadvisor(object):
 
     def on_startup(self):
+        if Config.host_info_backend() == 'native':
+            log.info('Using native host stats, not starting cAdvisor')
+            return
+
         cmd = ['cadvisor',
                '-logtostderr=true',
                '-listen_ip', Config.cadvisor_ip(),
@@ -38,4 +42,4 @@ class Cadvisor(object):
             if os.path.exists('/host/proc/1/ns/mnt'):
                 cmd = ['nsenter', '--mount=/host/proc/1/ns/mnt', '--'] + cmd
 
-        background(cmd)
+        supervise('cadvisor', cmd)
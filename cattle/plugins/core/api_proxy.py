@@ -1,17 +1,49 @@
-import urlparse
+import errno
 import logging
+import os
+import select
 import socket
+import time
+import urlparse
+from threading import Thread, Lock
 
 from cattle import Config
+from cattle import metrics
 from cattle.utils import get_url_port
-from cattle.process_manager import background
 
 log = logging.getLogger('api-proxy')
 
+CONNECTIONS = metrics.counter('cattle_api_proxy_connections_total',
+                              'Connections accepted by the API proxy')
+ACTIVE = metrics.gauge('cattle_api_proxy_connections_active',
+                       'Connections the API proxy is forwarding')
+FAILED = metrics.counter('cattle_api_proxy_connections_failed_total',
+                         'API proxy connections that failed to reach the '
+                         'server')
+BYTES = metrics.counter('cattle_api_proxy_bytes_total',
+                        'Bytes forwarded by the API proxy', 'direction',
+                        ('server', 'client'))
+
+# TcpProxy.counters names as metrics and their label
+_METRICS = {
+    'connections': (CONNECTIONS, None),
+    'activeConnections': (ACTIVE, None),
+    'failedConnections': (FAILED, None),
+    'bytesToServer': (BYTES, 'server'),
+    'bytesToClient': (BYTES, 'client'),
+}
+
+# Same values as EPOLLIN, EPOLLOUT, EPOLLERR and EPOLLHUP
+_READ = 0x001
+_WRITE = 0x004
+_ERROR = 0x008 | 0x010
+
+_RETRY = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
 
 class ApiProxy(object):
     def __init__(self):
-        self.pid = None
+        self.proxy = None
 
     def on_startup(self):
         url = Config.config_url()
@@ -28,8 +60,347 @@ class ApiProxy(object):
 
         log.info('Proxying %s:%s -> %s:%s', from_host, from_port, to_host_ip,
                  to_port)
-        listen = 'TCP4-LISTEN:{0},fork,bind={1},reuseaddr'.format(from_port,
-                                                                  from_host)
-        to = 'TCP:{0}:{1}'.format(to_host_ip, to_port)
+        self.proxy = TcpProxy(from_host, from_port, to_host_ip, to_port)
+        self.proxy.start()
+
+
+class _EpollPoller(object):
+    def __init__(self):
+        self._epoll = select.epoll()
+
+    def register(self, fd, mask):
+        self._epoll.register(fd, mask)
+
+    def modify(self, fd, mask):
+        self._epoll.modify(fd, mask)
+
+    def unregister(self, fd):
+        self._epoll.unregister(fd)
+
+    def poll(self, timeout=None):
+        try:
+            return self._epoll.poll(-1 if timeout is None else timeout)
+        except IOError as e:
+            if e.errno == errno.EINTR:
+                return []
+            raise
+
+    def close(self):
+        self._epoll.close()
+
+
+class _SelectPoller(object):
+    # Used when epoll isn't available, for example when eventlet has
+    # replaced the select module
+    def __init__(self):
+        self._fds = {}
+
+    def register(self, fd, mask):
+        self._fds[fd] = mask
+
+    modify = register
+
+    def unregister(self, fd):
+        del self._fds[fd]
+
+    def poll(self, timeout=None):
+        reads = [fd for fd, mask in self._fds.items() if mask & _READ]
+        writes = [fd for fd, mask in self._fds.items() if mask & _WRITE]
+        try:
+            reads, writes, _ = select.select(reads, writes, [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+
+        events = {}
+        for fds, flag in ((reads, _READ), (writes, _WRITE)):
+            for fd in fds:
+                events[fd] = events.get(fd, 0) | flag
+        return events.items()
+
+    def close(self):
+        self._fds.clear()
+
+
+def _poller():
+    if hasattr(select, 'epoll'):
+        return _EpollPoller()
+    return _SelectPoller()
+
+
+class _Side(object):
+    '''
+    One socket of a proxied connection.  pending holds data read from the
+    peer that hasn't been written to this socket yet.  The peer isn't read
+    again until pending is flushed, which is what gives backpressure.
+    '''
+
+    def __init__(self, sock, upstream=False):
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.upstream = upstream
+        self.peer = None
+        self.pending = ''
+        self.eof = False
+        self.shutdown = False
+        self.connecting = upstream
+        self.mask = None
+
+    def want(self):
+        if self.connecting:
+            return _WRITE
+
+        mask = 0
+        if not (self.eof or self.peer.pending or self.peer.connecting):
+            mask |= _READ
+        if self.pending:
+            mask |= _WRITE
+        return mask
+
+
+class TcpProxy(object):
+    '''
+    Forwards TCP connections from listen_host:listen_port to
+    to_host:to_port from a single thread, instead of forking a socat per
+    connection.
+    '''
+
+    BUFFER_SIZE = 65536
+    BACKLOG = 128
+    RETRY_INTERVAL = 5
+
+    def __init__(self, listen_host, listen_port, to_host, to_port):
+        self.listen_host = listen_host
+        self.listen_port = int(listen_port)
+        self.to_host = to_host
+        self.to_port = int(to_port)
+        self.address = None
+        self.counters = {
+            'connections': 0,
+            'activeConnections': 0,
+            'failedConnections': 0,
+            'bytesToServer': 0,
+            'bytesToClient': 0,
+        }
+        self._sides = {}
+        self._listener = None
+        self._poller = None
+        self._running = False
+        self._thread = None
+        self._lock = Lock()
+        self._wake_r = self._wake_w = None
+
+    def start(self):
+        self._running = True
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = Thread(target=self._run, name='api-proxy')
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._running = False
+        if self._wake_w is not None:
+            os.write(self._wake_w, 'x')
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+        metric, label = _METRICS[name]
+        metric.inc(value, label=label)
+
+    def _run(self):
+        while self._running and self._listener is None:
+            try:
+                self._listen()
+            except socket.error:
+                log.exception('Failed to listen on %s:%s, retrying in %s '
+                              'seconds', self.listen_host, self.listen_port,
+                              self.RETRY_INTERVAL)
+                time.sleep(self.RETRY_INTERVAL)
+
+        try:
+            while self._running:
+                try:
+                    self._loop()
+                except:
+                    log.exception('Error in API proxy')
+        finally:
+            self._close_all()
+
+    def _listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((self.listen_host, self.listen_port))
+            listener.listen(self.BACKLOG)
+            listener.setblocking(0)
+        except:
+            listener.close()
+            raise
+
+        self._poller = _poller()
+        self._poller.register(listener.fileno(), _READ)
+        self._poller.register(self._wake_r, _READ)
+        self._listener = listener
+        self.address = listener.getsockname()
+
+    def _loop(self):
+        for fd, events in self._poller.poll():
+            if fd == self._wake_r:
+                os.read(fd, 4096)
+            elif fd == self._listener.fileno():
+                self._accept()
+            else:
+                side = self._sides.get(fd)
+                if side is not None:
+                    self._handle(side, events)
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except socket.error as e:
+                if e.args[0] in _RETRY:
+                    return
+                raise
+
+            self._count('connections')
+            upstream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            for sock in (client, upstream):
+                sock.setblocking(0)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            err = upstream.connect_ex((self.to_host, self.to_port))
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                log.info('Failed to connect to %s:%s: %s', self.to_host,
+                         self.to_port, os.strerror(err))
+                self._count('failedConnections')
+                client.close()
+                upstream.close()
+                continue
+
+            a = _Side(client)
+            b = _Side(upstream, upstream=True)
+            a.peer, b.peer = b, a
+            self._sides[a.fd] = a
+            self._sides[b.fd] = b
+            self._count('activeConnections')
+            self._update(a)
+
+    def _handle(self, side, events):
+        try:
+            if side.connecting:
+                self._connected(side)
+            elif events & _ERROR and not side.want() & _READ:
+                self._close(side)
+                return
+            else:
+                if events & (_READ | _ERROR):
+                    self._read(side)
+                if events & _WRITE:
+                    self._write(side)
+        except socket.error as e:
+            log.debug('Closing proxied connection: %s', e)
+            self._close(side)
+            if side.connecting:
+                self._count('failedConnections')
+            return
+
+        if side.eof and side.peer.eof and not side.pending and \
+                not side.peer.pending:
+            self._close(side)
+        else:
+            self._update(side)
+
+    def _connected(self, side):
+        err = side.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err != 0:
+            raise socket.error(err, os.strerror(err))
+        side.connecting = False
+
+    def _read(self, side):
+        try:
+            data = side.sock.recv(self.BUFFER_SIZE)
+        except socket.error as e:
+            if e.args[0] in _RETRY:
+                return
+            raise
+
+        if not data:
+            side.eof = True
+            if not side.peer.pending:
+                self._shutdown(side.peer)
+            return
+
+        self._count('bytesToClient' if side.upstream else 'bytesToServer',
+                    len(data))
+        side.peer.pending = data
+        # Most of the time the other side can take it right away
+        self._write(side.peer)
+
+    def _write(self, side):
+        if not side.pending:
+            return
+
+        try:
+            sent = side.sock.send(side.pending)
+        except socket.error as e:
+            if e.args[0] in _RETRY:
+                return
+            raise
+
+        side.pending = side.pending[sent:]
+        if not side.pending and side.peer.eof:
+            self._shutdown(side)
+
+    def _shutdown(self, side):
+        if side.shutdown:
+            return
+        side.shutdown = True
+        try:
+            side.sock.shutdown(socket.SHUT_WR)
+        except socket.error:
+            pass
+
+    def _update(self, side):
+        for s in (side, side.peer):
+            mask = s.want()
+            if s.mask is None:
+                self._poller.register(s.fd, mask)
+            elif mask != s.mask:
+                self._poller.modify(s.fd, mask)
+            s.mask = mask
+
+    def _close(self, side):
+        if side.fd not in self._sides:
+            return
+
+        for s in (side, side.peer):
+            del self._sides[s.fd]
+            if s.mask is not None:
+                self._poller.unregister(s.fd)
+            s.sock.close()
+        self._count('activeConnections', -1)
+
+    def _close_all(self):
+        for side in self._sides.values():
+            self._close(side)
 
-        background(['socat', listen, to])
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._poller is not None:
+            self._poller.close()
+            self._poller = None
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+        self._wake_r = self._wake_w = None
@@ -1,6 +1,7 @@
 import os
 import subprocess
 
+from cattle import profiler
 from cattle import utils
 from cattle import Config
 from cattle.type_manager import types
@@ -34,6 +35,41 @@ class PingHandler:
         return resp
 
 
+class ProfileHandler:
+    def __init__(self):
+        pass
+
+    def events(self):
+        return ['agent.profile']
+
+    def execute(self, event):
+        if not _should_handle(self, event):
+            return
+
+        # Replies at once with the session, which is asked for again with
+        # its id for the samples once it has ended
+        data = event.data or {}
+        id = data.get('session')
+        if not id:
+            id, until = profiler.request(data.get('duration') or
+                                         Config.profile_duration())
+            return utils.reply(event, {
+                'session': id,
+                'until': until,
+            })
+
+        if data.get('file'):
+            return utils.reply(event, {
+                'session': id,
+                'files': profiler.files(id),
+            })
+
+        return utils.reply(event, {
+            'session': id,
+            'stacks': profiler.collect(id),
+        })
+
+
 class ConfigUpdateHandler:
     def __init__(self):
         pass
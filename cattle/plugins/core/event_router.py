@@ -1,4 +1,4 @@
-from cattle.type_manager import get_type_list
+from cattle.type_manager import get_type_list, types, generation
 from cattle.type_manager import PRE_REQUEST_HANDLER, STORAGE_DRIVER
 from cattle.type_manager import COMPUTE_DRIVER, POST_REQUEST_HANDLER
 from cattle.type_manager import REQUEST_HANDLER
@@ -6,31 +6,99 @@ from cattle.type_manager import REQUEST_HANDLER
 
 class Router:
     def __init__(self):
-        pass
+        self._table = None
+        self._events = None
+        self._generation = None
 
     def route(self, req):
-        for handler in _handlers(req):
+        for handler in self._handlers(req):
             resp = handler.execute(req)
             if resp is not None:
                 return resp
 
+    def dispatch_table(self):
+        if self._table is None or self._generation != generation():
+            self._generation = generation()
+            self._events = _handler_events()
+            self._table = build_dispatch_table(self._events)
+        return self._table
 
-def _handlers(req):
+    def _handlers(self, req):
+        name = event_name(req.name)
+        table = self.dispatch_table()
+        try:
+            entries = table[name]
+        except KeyError:
+            # Only handlers without events() take undeclared names, keep
+            # them with the declared ones until the types change
+            entries = table[name] = _entries(name, self._events)
+
+        for handler, check in entries:
+            if not check or handler.supports(req):
+                yield handler
+
+
+def event_name(name):
+    if name is None:
+        return None
+    return name.split(';', 1)[0]
+
+
+def build_dispatch_table(events=None):
+    '''
+    Map each event name any registered handler declares to the ordered
+    tuple of (handler, check_supports) entries that route() walks.  Handlers
+    that do not declare events() are included for every event.
+    '''
+    if events is None:
+        events = _handler_events()
+
+    names = set()
+    for handled in events.values():
+        if handled is not None:
+            names.update(handled)
+
+    table = {}
+    for name in names:
+        table[name] = _entries(name, events)
+
+    return table
+
+
+def _handler_events():
+    events = {}
+    for t in types():
+        if hasattr(t, 'events'):
+            events[t] = frozenset(t.events())
+        else:
+            events[t] = None
+    return events
+
+
+def _entries(name, events):
+    def handles(handler):
+        handled = events.get(handler)
+        return handled is None or name in handled
+
+    entries = []
     for pre in get_type_list(PRE_REQUEST_HANDLER):
-        yield pre
+        if handles(pre):
+            entries.append((pre, False))
 
     drivers = []
-    if req.name.startswith("storage."):
-        drivers = get_type_list(STORAGE_DRIVER)
-
-    if req.name.startswith("compute."):
-        drivers = get_type_list(COMPUTE_DRIVER)
+    if name is not None:
+        if name.startswith('storage.'):
+            drivers = get_type_list(STORAGE_DRIVER)
 
-    drivers.extend(get_type_list(REQUEST_HANDLER))
+        if name.startswith('compute.'):
+            drivers = get_type_list(COMPUTE_DRIVER)
 
-    for driver in drivers:
-        if driver.supports(req):
-            yield driver
+    for driver in list(drivers) + get_type_list(REQUEST_HANDLER):
+        if handles(driver):
+            entries.append((driver, True))
 
     for post in get_type_list(POST_REQUEST_HANDLER):
-        yield post
+        if handles(post):
+            entries.append((post, False))
+
+    return tuple(entries)
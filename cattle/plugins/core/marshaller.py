@@ -1,5 +1,5 @@
 import json
-from cattle.utils import JsonObject
+from cattle.utils import JsonObject, classify
 
 
 class Marshaller:
@@ -7,8 +7,9 @@ class Marshaller:
         pass
 
     def from_string(self, string):
-        obj = json.loads(string)
-        return JsonObject(obj)
+        obj = JsonObject(json.loads(string))
+        classify(obj)
+        return obj
 
     def to_string(self, obj):
         obj = JsonObject.unwrap(obj)
@@ -0,0 +1,69 @@
+import logging
+import socket
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from threading import Thread
+
+from cattle import Config
+from cattle import metrics
+
+log = logging.getLogger('metrics')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = metrics.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MetricsEndpoint(object):
+    '''
+    Serves cattle.metrics in the Prometheus text format at /metrics on
+    Config.metrics_port().  It runs in the agent process, which shares the
+    metrics memory with the workers, so a scrape sees all of them.
+    '''
+
+    def __init__(self):
+        self.server = None
+
+    def on_startup(self):
+        port = Config.metrics_port()
+        if not port:
+            return
+
+        try:
+            self.server = _Server((Config.metrics_ip(), port), _Handler)
+        except socket.error:
+            # Optional, not worth failing the agent over
+            log.exception('Failed to serve metrics on port %s, continuing '
+                          'without them', port)
+            return
+        log.info('Serving metrics on %s:%s', *self.server.server_address)
+
+        t = Thread(target=self.server.serve_forever, name='metrics')
+        t.setDaemon(True)
+        t.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
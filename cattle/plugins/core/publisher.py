@@ -1,12 +1,19 @@
 import logging
 import requests
 import time
+from cattle import logs
+from cattle import metrics
+from cattle import trace
 from cattle import type_manager
 from cattle.utils import log_request
 
 
 log = logging.getLogger("agent")
 
+PUBLISHED = metrics.counter('cattle_publish_total', 'Replies published')
+FAILED = metrics.counter('cattle_publish_failures_total',
+                         'Replies that failed to publish')
+
 
 class Publisher:
     def __init__(self, url, auth):
@@ -16,17 +23,27 @@ class Publisher:
         self._session = requests.Session()
 
     def publish(self, resp):
+        with trace.span('publish'):
+            self._publish(resp)
+
+    def _publish(self, resp):
         line = self._marshaller.to_string(resp)
 
         start = time.time()
+        PUBLISHED.inc()
         try:
             r = self._session.post(self._url, data=line, auth=self._auth,
                                    timeout=60)
             if r.status_code != 201:
-                log.error("Error [%s], Request [%s]", r.text, line)
+                FAILED.inc()
+                log.error("Error [%s], Request [%s]", r.text,
+                          logs.Payload(line))
+        except:
+            FAILED.inc()
+            raise
         finally:
-            log_request(resp, log, 'Response: %s [%s] seconds', line,
-                        time.time() - start)
+            log_request(resp, log, 'Response: %s [%s] seconds',
+                        logs.Payload(line), time.time() - start)
 
     @property
     def url(self):
@@ -1,11 +1,12 @@
 import logging
 
 from docker.utils import kwargs_from_env
-from cattle import default_value, Config
+from cattle import default_value, config_value, Config, startup_profile
 
 log = logging.getLogger('docker')
 
 _ENABLED = True
+_DOCKER_INFO = None
 
 
 class DockerConfig:
@@ -13,18 +14,22 @@ class DockerConfig:
         pass
 
     @staticmethod
+    @config_value
     def docker_enabled():
         return default_value('DOCKER_ENABLED', 'true') == 'true'
 
     @staticmethod
+    @config_value
     def docker_host_ip():
         return default_value('DOCKER_HOST_IP', Config.agent_ip())
 
     @staticmethod
+    @config_value
     def docker_home():
         return default_value('DOCKER_HOME', '/var/lib/docker')
 
     @staticmethod
+    @config_value
     def docker_uuid_file():
         def_value = '{0}/.docker_uuid'.format(Config.state_dir())
         return default_value('DOCKER_UUID_FILE', def_value)
@@ -35,31 +40,43 @@ class DockerConfig:
                                          DockerConfig.docker_uuid_file())
 
     @staticmethod
+    @config_value
     def url_base():
         return default_value('DOCKER_URL_BASE', None)
 
     @staticmethod
+    @config_value
     def api_version():
         return default_value('DOCKER_API_VERSION', '1.18')
 
     @staticmethod
+    @config_value
     def storage_api_version():
         return default_value('DOCKER_STORAGE_API_VERSION', '1.21')
 
     @staticmethod
+    @config_value
     def docker_required():
         return default_value('DOCKER_REQUIRED', 'true') == 'true'
 
     @staticmethod
+    @config_value
     def delegate_timeout():
         return int(default_value('DOCKER_DELEGATE_TIMEOUT', '120'))
 
     @staticmethod
+    @config_value
     def use_boot2docker_connection_env_vars():
         use_b2d = default_value('DOCKER_USE_BOOT2DOCKER', 'false')
         return use_b2d.lower() == 'true'
 
     @staticmethod
+    @config_value
+    def docker_trace():
+        return default_value('DOCKER_TRACE', 'false') == 'true'
+
+    @staticmethod
+    @config_value
     def is_host_pidns():
         return default_value('AGENT_PIDNS', 'container') == 'host'
 
@@ -87,6 +104,18 @@ def docker_client(version=None, base_url_override=None, tls_config=None,
     return Client(**kwargs)
 
 
+def docker_info():
+    '''
+    The result of the startup docker info call, shared so startup doesn't
+    ask the daemon again for things that only change on a daemon restart.
+    '''
+    global _DOCKER_INFO
+    if _DOCKER_INFO is None:
+        with startup_profile.timed('docker', 'info'):
+            _DOCKER_INFO = docker_client().info()
+    return _DOCKER_INFO
+
+
 def pull_image(image, progress):
     _DOCKER_POOL.pull_image(image, progress)
 
@@ -101,9 +130,13 @@ except:
     log.info('Disabling docker, docker-py not found')
     _ENABLED = False
 
+if _ENABLED and DockerConfig.docker_trace():
+    from . import tracing
+    tracing.install(Client)
+
 try:
     if _ENABLED:
-        docker_client().info()
+        docker_info()
 except Exception, e:
     log.exception('Disabling docker, could not contact docker')
     _ENABLED = False
@@ -20,6 +20,7 @@ from cattle.lock import lock
 from cattle.plugins.docker.network import setup_ipsec, setup_links, \
     setup_mac_and_ip, setup_ports, setup_network_mode, setup_dns
 from cattle.plugins.docker.agent import setup_cattle_config_url
+from cattle.plugins.docker import tracing
 
 
 log = logging.getLogger('docker')
@@ -81,8 +82,26 @@ class DockerCompute(KindBasedMixin, BaseComputeDriver):
     def __init__(self):
         KindBasedMixin.__init__(self, kind='docker')
         BaseComputeDriver.__init__(self)
-        self.host_info = HostInfo(docker_client())
-        self.system_images = self.get_agent_images(docker_client())
+        self._host_info = None
+        self._system_images = None
+
+    # Both of these talk to docker, so build them on first use rather than
+    # while plugins are loading.
+    @property
+    def host_info(self):
+        if self._host_info is None:
+            self._host_info = HostInfo(docker_client())
+        return self._host_info
+
+    @host_info.setter
+    def host_info(self, value):
+        self._host_info = value
+
+    @property
+    def system_images(self):
+        if self._system_images is None:
+            self._system_images = self.get_agent_images(docker_client())
+        return self._system_images
 
     def get_agent_images(self, client):
         images = client.images(filters={'label': SYSTEM_LABEL})
@@ -124,6 +143,15 @@ class DockerCompute(KindBasedMixin, BaseComputeDriver):
 
         self._add_resources(ping, pong)
         self._add_instances(ping, pong)
+        self._add_docker_stats(ping, pong)
+
+    def _add_docker_stats(self, ping, pong):
+        if not utils.ping_include_docker_stats(ping) or \
+                not DockerConfig.docker_trace():
+            return
+
+        pong.data.dockerStats = tracing.stats()
+        utils.ping_set_option(pong, 'dockerStats', True)
 
     def _add_instances(self, ping, pong):
         if not utils.ping_include_instances(ping):
@@ -143,9 +171,35 @@ class DockerCompute(KindBasedMixin, BaseComputeDriver):
         for key, container in nonrunning.iteritems():
             self.add_container('stopped', container, containers)
 
+        if utils.ping_include_container_stats(ping):
+            self._add_container_stats(ping, pong, containers)
+
         utils.ping_add_resources(pong, *containers)
         utils.ping_set_option(pong, 'instances', True)
 
+    def _add_container_stats(self, ping, pong, containers):
+        # true for Config.container_stats_limit() containers, or a smaller
+        # number of them
+        limit = Config.container_stats_limit()
+        option = utils.ping_include_container_stats(ping)
+        if option is not True:
+            try:
+                limit = min(limit, int(option))
+            except (TypeError, ValueError):
+                log.warn('Ignoring containerStats option %r', option)
+
+        try:
+            stats = self.host_info.container_stats.get(limit)
+        except:
+            log.exception("Error getting container stats")
+            return
+
+        for container in containers:
+            if container['dockerId'] in stats:
+                container['stats'] = stats[container['dockerId']]
+
+        utils.ping_set_option(pong, 'containerStats', True)
+
     def add_container(self, state, container, containers):
         try:
             labels = container['Labels']
@@ -2,11 +2,10 @@ import logging
 
 from cattle import Config
 from cattle.utils import reply, popen
-from .compute import DockerCompute
 from cattle.agent.handler import BaseHandler
 from cattle.progress import Progress
 from cattle.type_manager import get_type, MARSHALLER
-from . import docker_client
+from . import docker_client, get_compute
 
 import subprocess
 import os
@@ -77,7 +76,6 @@ def ns_exec(pid, event):
 
 class DockerDelegate(BaseHandler):
     def __init__(self):
-        self.compute = DockerCompute()
         pass
 
     def events(self):
@@ -88,14 +86,15 @@ class DockerDelegate(BaseHandler):
            instanceData.get('token') is None:
             return
 
-        container = self.compute.get_container(docker_client(), instanceData,
-                                               by_agent=True)
+        compute = get_compute()
+        container = compute.get_container(docker_client(), instanceData,
+                                          by_agent=True)
         if container is None:
             log.info('Can not call [%s], container does not exists',
                      instanceData.uuid)
             return
 
-        inspect = self.compute.inspect(container)
+        inspect = compute.inspect(container)
 
         try:
             running = inspect['State']['Running']
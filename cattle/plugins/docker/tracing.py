@@ -0,0 +1,74 @@
+import functools
+import time
+
+from cattle import metrics
+from cattle import trace
+
+# Client methods that make a Docker API request
+TRACED = ('containers', 'inspect_container', 'create_container_from_config',
+          'start', 'stop', 'kill', 'wait', 'remove_container', 'pull',
+          'inspect_image', 'images', 'tag', 'remove_image', 'build', 'info',
+          'version', 'inspect_volume', 'create_volume', 'remove_volume')
+
+DURATION = metrics.histogram('docker_request_duration_seconds',
+                             'Docker API call latency',
+                             'method', TRACED)
+ERRORS = metrics.counter('docker_request_errors_total',
+                         'Docker API calls that raised',
+                         'method', TRACED)
+IN_FLIGHT = metrics.gauge('docker_requests_in_flight',
+                          'Docker API calls in progress',
+                          'method', TRACED)
+
+
+def _traced(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kw):
+        IN_FLIGHT.inc(label=name)
+        start = time.time()
+        try:
+            return method(*args, **kw)
+        except:
+            ERRORS.inc(label=name)
+            raise
+        finally:
+            elapsed = time.time() - start
+            DURATION.observe(elapsed, label=name)
+            IN_FLIGHT.dec(label=name)
+            trace.add('docker', elapsed)
+
+    wrapper.traced = True
+    return wrapper
+
+
+def install(client_class):
+    '''
+    Time the TRACED methods of the docker-py Client class.  Calls that
+    stream, like pull(stream=True), are timed until the stream is
+    returned.  Nothing is wrapped unless this is called, so tracing costs
+    nothing when disabled.
+    '''
+    for name in TRACED:
+        method = getattr(client_class, name, None)
+        if method is None or getattr(method, 'traced', False):
+            continue
+        setattr(client_class, name, _traced(name, method))
+
+
+def stats():
+    '''
+    Per method count, errors, in flight calls, average and bucket bound
+    percentiles in seconds, for methods that have been called.
+    '''
+    result = {}
+    for name, snapshot in DURATION.snapshot().iteritems():
+        result[name] = {
+            'count': snapshot['count'],
+            'errors': int(ERRORS.get(name)),
+            'inFlight': int(IN_FLIGHT.get(name)),
+            'avg': round(snapshot['sum'] / snapshot['count'], 6),
+            'p50': metrics.quantile(snapshot, 0.5),
+            'p95': metrics.quantile(snapshot, 0.95),
+            'p99': metrics.quantile(snapshot, 0.99),
+        }
+    return result
@@ -2,7 +2,7 @@ import os
 from cattle.plugins.docker import DockerConfig
 from cattle import Config
 
-from cattle.process_manager import background
+from cattle.process_manager import supervise
 
 
 class HostApi(object):
@@ -15,14 +15,15 @@ class HostApi(object):
         url = 'http://{0}:{1}'.format(Config.cadvisor_ip(),
                                       Config.cadvisor_port())
 
-        background(['host-api',
-                    '-cadvisor-url',  url,
-                    '-logtostderr=true',
-                    '-ip', Config.host_api_ip(),
-                    '-port', str(Config.host_api_port()),
-                    '-auth=true',
-                    '-host-uuid', DockerConfig.docker_uuid(),
-                    '-public-key', Config.jwt_public_key_file(),
-                    '-cattle-url', Config.api_url(),
-                    '-cattle-state-dir', Config.container_state_dir()],
-                   env=env)
+        supervise('host-api',
+                  ['host-api',
+                   '-cadvisor-url',  url,
+                   '-logtostderr=true',
+                   '-ip', Config.host_api_ip(),
+                   '-port', str(Config.host_api_port()),
+                   '-auth=true',
+                   '-host-uuid', DockerConfig.docker_uuid(),
+                   '-public-key', Config.jwt_public_key_file(),
+                   '-cattle-url', Config.api_url(),
+                   '-cattle-state-dir', Config.container_state_dir()],
+                  env=env)
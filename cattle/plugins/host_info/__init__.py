@@ -0,0 +1,14 @@
+from cattle.type_manager import register_type, LIFECYCLE
+from cattle.type_manager import POST_REQUEST_HANDLER
+from .metrics import HostMetrics
+from .disk_bench import DiskBenchmark
+from .native import SAMPLER
+
+_HOST_METRICS = HostMetrics()
+_DISK_BENCHMARK = DiskBenchmark()
+
+register_type(LIFECYCLE, SAMPLER)
+register_type(LIFECYCLE, _HOST_METRICS)
+register_type(POST_REQUEST_HANDLER, _HOST_METRICS)
+register_type(LIFECYCLE, _DISK_BENCHMARK)
+register_type(POST_REQUEST_HANDLER, _DISK_BENCHMARK)
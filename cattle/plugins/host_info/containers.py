@@ -0,0 +1,81 @@
+from threading import Lock
+
+_NS = 1e9
+
+_COUNTERS = ('cpu', 'memory', 'rxBytes', 'txBytes', 'readBytes',
+             'writeBytes')
+
+_RATES = (('cpu', 'cpuPercent', 100.0 / _NS),
+          ('rxBytes', 'rxRate', 1),
+          ('txBytes', 'txRate', 1),
+          ('readBytes', 'readRate', 1),
+          ('writeBytes', 'writeRate', 1))
+
+
+def compact(latest, previous=None):
+    '''
+    The counters of latest with missing ones left out, plus per second
+    rates against previous when there is one.  cpuPercent is of one core.
+    '''
+    stats = {}
+    for key in _COUNTERS:
+        if latest.get(key) is not None:
+            stats[key] = latest[key]
+
+    if previous is None:
+        return stats
+
+    elapsed = (latest['timestamp'] - previous['timestamp']) / _NS
+    if elapsed <= 0:
+        return stats
+
+    for key, rate, scale in _RATES:
+        a, b = previous.get(key), latest.get(key)
+        # Counters reset when a container restarts
+        if a is not None and b is not None and b >= a:
+            stats[rate] = round((b - a) * scale / elapsed, 3)
+
+    return stats
+
+
+def top(stats, limit):
+    '''The limit busiest containers of {docker id: stats}, CPU first'''
+    if limit is None or len(stats) <= limit:
+        return stats
+
+    def busy(item):
+        s = item[1]
+        return s.get('cpuPercent', 0), s.get('memory', 0)
+
+    return dict(sorted(stats.iteritems(), key=busy, reverse=True)[:limit])
+
+
+class ContainerStats(object):
+    '''
+    Per container usage from a stats client's get_container_counters().
+    cAdvisor returns two samples per container to take rates between,
+    the native client one, so the previous call's counters are kept for
+    rates instead.
+    '''
+
+    def __init__(self, client):
+        self.client = client
+        self._previous = {}
+        self._lock = Lock()
+
+    def get(self, limit=None):
+        counters = self.client.get_container_counters()
+
+        with self._lock:
+            previous, self._previous = self._previous, {}
+            stats = {}
+            for docker_id, samples in counters.iteritems():
+                latest = samples[-1]
+                if len(samples) > 1:
+                    last = samples[-2]
+                else:
+                    last = previous.get(docker_id)
+                self._previous[docker_id] = latest
+                stats[docker_id] = compact(latest, last)
+
+        return top(stats, limit)
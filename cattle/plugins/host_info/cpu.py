@@ -1,45 +1,38 @@
 import platform
 import os
 import math
-import re
 
 from cattle.utils import CadvisorAPIClient
 from cattle import Config
+from . import procfs
+from .utils import cached, STATIC, SLOW, LIVE
+from .stats_window import cpu_window
 
 
 class CpuCollector(object):
-    def __init__(self):
-        self.cadvisor = CadvisorAPIClient(Config.cadvisor_ip(),
-                                          Config.cadvisor_port())
+    def __init__(self, cadvisor=None):
+        if cadvisor is None:
+            cadvisor = CadvisorAPIClient(Config.cadvisor_ip(),
+                                         Config.cadvisor_port())
+        self.cadvisor = cadvisor
 
     def _get_cpuinfo_data(self):
-        with open('/proc/cpuinfo') as f:
-            data = f.readlines()
-
-        return data
+        return procfs.read('/proc/cpuinfo')
 
+    @cached(STATIC)
     def _get_linux_cpu_info(self):
-        data = {}
-
-        procs = []
-        file_data = self._get_cpuinfo_data()
-        for line in file_data:
-            split_line = line.split(':')
-            if split_line[0].strip() == "model name":
-                procs.append(split_line[1].strip())
-                freq = re.search(r'([0-9\.]+)\s?GHz', split_line[1])
-                if freq:
-                    data['mhz'] = float(freq.group(1)) * 1000
-
-            if 'mhz' not in data:
-                if split_line[0].strip() == "cpu MHz":
-                    data['mhz'] = float(split_line[1].strip())
-
-        data['modelName'] = procs[0]
-        data['count'] = len(procs)
-
-        return data
-
+        info = procfs.cpuinfo(self._get_cpuinfo_data())
+        return {'modelName': info['modelName'], 'count': info['count']}
+
+    @cached(SLOW)
+    def _get_cpu_mhz(self):
+        # Changes with frequency scaling, unlike the model and count
+        info = procfs.cpuinfo(self._get_cpuinfo_data())
+        if 'mhz' in info:
+            return {'mhz': info['mhz']}
+        return {}
+
+    @cached(LIVE)
     def _get_cpu_percentages(self):
         data = {}
         data['cpuCoresPercentages'] = []
@@ -66,8 +59,14 @@ class CpuCollector(object):
 
                 data['cpuCoresPercentages'].append(percentage)
 
+            window = cpu_window(stats, self.cadvisor.timestamp_diff,
+                                Config.host_info_cpu_window())
+            if window is not None:
+                data['cpuWindow'] = window
+
         return data
 
+    @cached(LIVE)
     def _get_load_average(self):
         return {'loadAvg': list(os.getloadavg())}
 
@@ -79,11 +78,13 @@ class CpuCollector(object):
 
         if platform.system() == 'Linux':
             data.update(self._get_linux_cpu_info())
+            data.update(self._get_cpu_mhz())
             data.update(self._get_load_average())
             data.update(self._get_cpu_percentages())
 
         return data
 
+    @cached(STATIC)
     def get_labels(self, pfx="rancher"):
         if os.path.exists('/dev/kvm'):
             return {".".join([pfx, "kvm"]): "true"}
@@ -2,20 +2,30 @@ import platform
 
 from cattle.utils import CadvisorAPIClient
 from cattle import Config
+from .utils import cached, SLOW, LIVE
 
 
 class DiskCollector(object):
-    def __init__(self, docker_client=None):
+    def __init__(self, docker_client=None, cadvisor=None):
         self.unit = 1048576
-        self.cadvisor = CadvisorAPIClient(Config.cadvisor_ip(),
-                                          Config.cadvisor_port())
+        if cadvisor is None:
+            cadvisor = CadvisorAPIClient(Config.cadvisor_ip(),
+                                         Config.cadvisor_port())
+        self.cadvisor = cadvisor
 
         self.docker_client = docker_client
-        self.docker_storage_driver = None
+        self._docker_storage_driver = None
 
-        if self.docker_client:
-            self.docker_storage_driver = \
-                self.docker_client.info().get("Driver", None)
+    @property
+    def docker_storage_driver(self):
+        if self._docker_storage_driver is None and self.docker_client:
+            self._docker_storage_driver = \
+                self._docker_info().get("Driver", None)
+        return self._docker_storage_driver
+
+    @cached(SLOW)
+    def _docker_info(self):
+        return self.docker_client.info()
 
     def _convert_units(self, number):
         # Return in MB
@@ -25,7 +35,7 @@ class DiskCollector(object):
         data = {}
 
         if self.docker_client:
-            for item in self.docker_client.info().get("DriverStatus"):
+            for item in self._docker_info().get("DriverStatus"):
                 data[item[0]] = item[1]
 
         return data
@@ -45,6 +55,7 @@ class DiskCollector(object):
 
         return include
 
+    @cached(LIVE)
     def _get_mountpoints_cadvisor(self):
         data = {}
         stat = self.cadvisor.get_latest_stat()
@@ -64,6 +75,7 @@ class DiskCollector(object):
 
         return data
 
+    @cached(SLOW)
     def _get_machine_filesystems_cadvisor(self):
         data = {}
         machine_info = self.cadvisor.get_machine_stats()
@@ -0,0 +1,198 @@
+import fcntl
+import io
+import json
+import logging
+import mmap
+import os
+import random
+import time
+from contextlib import contextmanager
+from threading import Thread
+
+from cattle import Config
+from cattle import utils
+
+log = logging.getLogger('iops')
+
+BLOCK_SIZE = 4096
+_CHUNK = 1024 * 1024
+
+
+def device_name(path):
+    '''
+    The name of the disk holding path as fio reports it in disk_util, e.g.
+    sda for a file on /dev/sda1, or None if path isn't on a block device.
+    '''
+    st = os.stat(path)
+    sys_path = '/sys/dev/block/{0}:{1}'.format(os.major(st.st_dev),
+                                               os.minor(st.st_dev))
+    if not os.path.exists(sys_path):
+        return None
+
+    sys_path = os.path.realpath(sys_path)
+    if os.path.exists(os.path.join(sys_path, 'partition')):
+        sys_path = os.path.dirname(sys_path)
+    return os.path.basename(sys_path)
+
+
+def _prepare(path, size):
+    # Fill the file with data, random blocks of a sparse or compressible
+    # file wouldn't reach the disk
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0600)
+    try:
+        if os.fstat(fd).st_size >= size:
+            return
+        chunk = os.urandom(_CHUNK)
+        for _ in range(size / _CHUNK):
+            os.write(fd, chunk)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _iops(path, size, duration, write, flags):
+    # mmap memory is page aligned, which O_DIRECT needs
+    buf = mmap.mmap(-1, BLOCK_SIZE)
+    buf.write(os.urandom(BLOCK_SIZE))
+    blocks = size / BLOCK_SIZE
+
+    fd = os.open(path, (os.O_RDWR if write else os.O_RDONLY) | flags)
+    try:
+        f = io.FileIO(fd, 'r+' if write else 'r', closefd=False)
+        ops = 0
+        start = time.time()
+        end = start + duration
+        now = start
+        while now < end:
+            os.lseek(fd, random.randrange(blocks) * BLOCK_SIZE, os.SEEK_SET)
+            if write:
+                os.write(fd, buf)
+            else:
+                f.readinto(buf)
+            ops += 1
+            now = time.time()
+        if write:
+            os.fsync(fd)
+            now = time.time()
+    finally:
+        os.close(fd)
+        buf.close()
+
+    return round(ops / (now - start), 3)
+
+
+def benchmark(path, size, duration, flags=getattr(os, 'O_DIRECT', 0)):
+    '''
+    Random 4k read and then write IOPS of a size bytes scratch file at
+    path, each run for duration seconds, bypassing the page cache.
+    '''
+    _prepare(path, size)
+    return {
+        'read': _iops(path, size, duration, False, flags),
+        'write': _iops(path, size, duration, True, flags),
+    }
+
+
+def write_results(state_dir, device, results):
+    '''
+    Write results as the fio JSON output IopsCollector reads, each file
+    renamed into place so a reader never sees half of one.
+    '''
+    for kind in ('read', 'write'):
+        data = {
+            'fio version': 'cattle-disk-bench',
+            'jobs': [{'jobname': kind, kind: {'iops': results[kind]}}],
+            'disk_util': [{'name': device}],
+        }
+        path = os.path.join(state_dir, kind + '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.rename(path + '.tmp', path)
+
+
+@contextmanager
+def _locked(path):
+    '''
+    Hold an flock on path, removed again on release.  A waiter that gets
+    the lock of a file removed meanwhile tries again on the current one.
+    '''
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                break
+        except OSError:
+            pass
+        os.close(fd)
+
+    try:
+        yield
+    finally:
+        os.remove(path)
+        os.close(fd)
+
+
+class DiskBenchmark(object):
+    '''
+    Measures the IOPS of the disk holding Config.disk_bench_file() so
+    DEFAULT_DISK blkio options work without an external fio run.  Runs
+    on the host.disk.benchmark event, and at startup when there are no
+    results yet if Config.disk_bench_on_startup().
+    '''
+
+    def on_startup(self):
+        if not Config.disk_bench_on_startup():
+            return
+
+        state_dir = Config.iops_state_dir()
+        if os.path.exists(os.path.join(state_dir, 'read.json')) and \
+                os.path.exists(os.path.join(state_dir, 'write.json')):
+            return
+
+        t = Thread(target=self._run_logged, name='disk-bench')
+        t.setDaemon(True)
+        t.start()
+
+    def _run_logged(self):
+        try:
+            self.run()
+        except:
+            log.exception('Disk benchmark failed')
+
+    def run(self):
+        state_dir = Config.iops_state_dir()
+        path = Config.disk_bench_file()
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+
+        # One run at a time across workers, and the agent at startup
+        with _locked(path + '.lock'):
+            device = device_name(os.path.dirname(path))
+            if device is None:
+                log.warn('%s is not on a block device, not benchmarking',
+                         path)
+                return {}
+
+            log.info('Benchmarking IOPS of %s', device)
+            try:
+                results = benchmark(path, Config.disk_bench_size(),
+                                    Config.disk_bench_duration())
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+            write_results(state_dir, device, results)
+            log.info('IOPS of %s: %s', device, results)
+
+            results['device'] = '/dev/' + device
+            return results
+
+    def events(self):
+        return ['host.disk.benchmark']
+
+    def execute(self, event):
+        name = event.name.split(';', 1)[0]
+        if name not in self.events() or event.replyTo is None:
+            return
+
+        return utils.reply(event, self.run())
@@ -1,50 +1,64 @@
 import logging
+import os
 import platform
 import json
 
+from cattle import Config
+from .utils import WatchedFiles
+
 log = logging.getLogger('iops')
 
 
 class IopsCollector(object):
-    def __init__(self):
-        self.data = {}
+    def __init__(self, state_dir=None):
+        if state_dir is None:
+            state_dir = Config.iops_state_dir()
+        self.state_dir = state_dir
+        self.files = WatchedFiles([self._path('read'), self._path('write')],
+                                  self._parse_iops_file)
+
+    def _path(self, read_or_write):
+        return os.path.join(self.state_dir, read_or_write + '.json')
 
     def _get_iops_data(self, read_or_write):
-        with open('/var/lib/rancher/state/' + read_or_write + '.json') as f:
+        with open(self._path(read_or_write)) as f:
             return json.load(f)
 
     def _parse_iops_file(self):
-        data = {}
+        read_json_data = self._get_iops_data('read')
+        write_json_data = self._get_iops_data('write')
 
-        try:
-            read_json_data = self._get_iops_data('read')
-            write_json_data = self._get_iops_data('write')
-        except IOError:
-            # File doesn't exist. Silently skip.
-            return {}
+        read_jobs = read_json_data['jobs']
+        write_jobs = write_json_data['jobs']
+        devices = [d['name'].encode('ascii', 'ignore')
+                   for d in read_json_data['disk_util']]
+
+        # A job per device when the benchmark ran one for each, otherwise
+        # the one job's results hold for every device it touched
+        data = {}
+        for i, device in enumerate(devices):
+            if len(read_jobs) == len(devices) == len(write_jobs):
+                read_job, write_job = read_jobs[i], write_jobs[i]
+            else:
+                read_job, write_job = read_jobs[0], write_jobs[0]
+            data['/dev/' + device] = {'read': read_job['read']['iops'],
+                                      'write': write_job['write']['iops']}
 
-        read_iops = read_json_data['jobs'][0]['read']['iops']
-        write_iops = write_json_data['jobs'][0]['write']['iops']
-        device = read_json_data['disk_util'][0]['name']
-        key = '/dev/' + device.encode('ascii', 'ignore')
-        data[key] = {'read': read_iops, 'write': write_iops}
-        return data
+        return {'devices': data,
+                'default': '/dev/' + devices[0] if devices else None}
 
     def key_name(self):
         return "iopsInfo"
 
     def get_data(self):
         if platform.system() == 'Linux':
-            if not self.data:
-                self.data = self._parse_iops_file()
-            return self.data
+            return dict(self.files.get().get('devices', {}))
         else:
             return {}
 
     def get_default_disk(self):
-        data = self.get_data()
-        if not data:
+        if platform.system() != 'Linux':
             return None
 
-        # Return the first item in the dict
-        return data.keys()[0]
+        # The first device fio reported
+        return self.files.get().get('default')
@@ -1,36 +1,134 @@
 import logging
+import time
+from threading import Thread, Event, Lock
 
+from cattle import Config
+from cattle.utils import CadvisorAPIClient
 from cattle.plugins.host_info.memory import MemoryCollector
 from cattle.plugins.host_info.os_c import OSCollector
 from cattle.plugins.host_info.cpu import CpuCollector
 from cattle.plugins.host_info.disk import DiskCollector
 from cattle.plugins.host_info.iops import IopsCollector
+from cattle.plugins.host_info.native import NativeStatsClient
+from cattle.plugins.host_info.containers import ContainerStats
+from cattle.plugins.host_info.stats_window import duration_seconds, \
+    samples_for_window
+from cattle.plugins.host_info.utils import cached, SLOW
 
 log = logging.getLogger('host_info')
 
 
+class _Run(object):
+    '''
+    One call to collector.get_data() on its own thread.  The thread is left
+    to finish on its own if the caller stops waiting.
+    '''
+
+    def __init__(self, collector, on_success):
+        self.collector = collector
+        self.started = time.time()
+        self.value = None
+        self.error = None
+        self.done = Event()
+        self._on_success = on_success
+
+        t = Thread(target=self._run,
+                   name='host-info-{0}'.format(collector.key_name()))
+        t.setDaemon(True)
+        t.start()
+
+    def _run(self):
+        try:
+            self.value = self.collector.get_data()
+            self._on_success(self.collector.key_name(), self.value)
+        except Exception as e:
+            self.error = e
+            log.exception(
+                "Error collecting {0} stats".format(
+                    self.collector.key_name()))
+        finally:
+            self.done.set()
+
+
 class HostInfo(object):
     def __init__(self, docker_client=None):
         self.docker_client = docker_client
+        # Enough samples for the CPU window, the disk collector only needs
+        # the latest
+        if Config.host_info_backend() == 'native':
+            num_stats = samples_for_window(Config.host_info_cpu_window(),
+                                           Config.native_stats_interval())
+            self.cadvisor = NativeStatsClient(num_stats=num_stats)
+        else:
+            interval = duration_seconds(Config.cadvisor_interval())
+            num_stats = samples_for_window(Config.host_info_cpu_window(),
+                                           interval)
+            self.cadvisor = CadvisorAPIClient(Config.cadvisor_ip(),
+                                              Config.cadvisor_port(),
+                                              num_stats=num_stats)
+        self.container_stats = ContainerStats(self.cadvisor)
         self.iops_collector = IopsCollector()
         self.collectors = [MemoryCollector(),
                            OSCollector(self.docker_client),
-                           DiskCollector(self.docker_client),
-                           CpuCollector(),
+                           DiskCollector(self.docker_client, self.cadvisor),
+                           CpuCollector(self.cadvisor),
                            self.iops_collector]
+        self._runs = {}
+        self._last = {}
+        self._lock = Lock()
+
+    def _collected(self, key, value):
+        with self._lock:
+            self._last[key] = value
 
     def collect_data(self):
-        data = {}
+        '''
+        Run all collectors in parallel.  A collector that fails or doesn't
+        finish within its timeout, or before the overall deadline, reports
+        its last good value with stale set, or {} if it never succeeded.
+        A collector still running from an earlier call is waited on
+        instead of being started again.
+        '''
+        deadline = time.time() + Config.host_info_deadline()
+        self.cadvisor.new_cycle()
+
+        runs = []
         for collector in self.collectors:
-            try:
-                data[collector.key_name()] = collector.get_data()
-            except:
-                log.exception(
-                    "Error collecting {0} stats".format(collector.key_name()))
-                data[collector.key_name()] = {}
+            key = collector.key_name()
+            run = self._runs.get(key)
+            if run is None or run.done.is_set():
+                run = self._runs[key] = _Run(collector, self._collected)
+            runs.append(run)
+
+        data = {}
+        for run in runs:
+            key = run.collector.key_name()
+            end = min(deadline, run.started + Config.host_info_timeout(key))
+            run.done.wait(max(0, end - time.time()))
+
+            if run.done.is_set() and run.error is None:
+                data[key] = run.value
+                continue
+
+            if not run.done.is_set():
+                log.warn('Timed out collecting %s stats after %.1f seconds',
+                         key, time.time() - run.started)
+            data[key] = self._stale(key)
 
         return data
 
+    def _stale(self, key):
+        with self._lock:
+            last = self._last.get(key)
+
+        if last is None:
+            return {}
+
+        value = dict(last)
+        value['stale'] = True
+        return value
+
+    @cached(SLOW)
     def host_labels(self, label_pfx="io.rancher.host"):
         labels = {}
         for collector in self.collectors:
@@ -1,39 +1,36 @@
 import platform
 
+from . import procfs
+from .utils import cached, LIVE
+
 
 class MemoryCollector(object):
     def __init__(self):
-        self.key_map = {'memtotal': 'memTotal',
-                        'memfree': 'memFree',
-                        'memavailable': 'memAvailable',
-                        'buffers': 'buffers',
-                        'cached': 'cached',
-                        'swapcached': 'swapCached',
-                        'active': 'active',
-                        'inactive': 'inactive',
-                        'swaptotal': 'swapTotal',
-                        'swapfree': 'swapFree'
+        self.key_map = {'MemTotal': 'memTotal',
+                        'MemFree': 'memFree',
+                        'MemAvailable': 'memAvailable',
+                        'Buffers': 'buffers',
+                        'Cached': 'cached',
+                        'SwapCached': 'swapCached',
+                        'Active': 'active',
+                        'Inactive': 'inactive',
+                        'SwapTotal': 'swapTotal',
+                        'SwapFree': 'swapFree'
                         }
 
         self.unit = 1024.0
 
     def _get_meminfo_data(self):
-        with open('/proc/meminfo') as f:
-            return f.readlines()
+        return procfs.read('/proc/meminfo')
 
+    @cached(LIVE)
     def _parse_linux_meminfo(self):
         data = {k: None for k in self.key_map.values()}
 
         # /proc/meminfo file has all values in kB
-        mem_data = self._get_meminfo_data()
-        for line in mem_data:
-            line_list = line.split(':')
-            key_lower = line_list[0].lower()
-            possible_mem_value = line_list[1].strip().split(' ')[0]
-
-            if self.key_map.get(key_lower):
-                converted_mem_val = float(possible_mem_value)/self.unit
-                data[self.key_map[key_lower]] = round(converted_mem_val, 3)
+        mem_data = procfs.meminfo(self._get_meminfo_data(), self.key_map)
+        for key, value in mem_data.iteritems():
+            data[self.key_map[key]] = round(value / self.unit, 3)
 
         return data
 
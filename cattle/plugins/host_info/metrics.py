@@ -0,0 +1,293 @@
+import logging
+import math
+import os
+import time
+from multiprocessing.sharedctypes import RawArray
+from threading import Thread
+
+from cattle import Config
+from cattle import utils
+from cattle.plugins.host_info import procfs
+from cattle.plugins.host_info.native import NativeStatsClient, \
+    host_cpu_usage
+
+log = logging.getLogger('host_info')
+
+# cpu and memory are percent used, disk the fullest filesystem's percent
+# used and load the one minute load average
+METRICS = ('cpu', 'memory', 'disk', 'load')
+
+# (multiple of the sample interval, points kept).  At the default 10
+# second interval that is 10s points for an hour, 1m for a day and 10m
+# for a week.
+TIERS = ((1, 360), (6, 1440), (60, 1008))
+
+_NAN = float('nan')
+
+_MEMINFO_KEYS = ('MemTotal', 'MemAvailable', 'MemFree', 'Buffers',
+                 'Cached')
+
+
+class _Tier(object):
+    '''
+    One resolution of the store, a ring of rows holding a timestamp and a
+    value per metric.  The rows live in shared memory so workers forked
+    after startup read what the sampler in the agent process writes.  A
+    sequence counter that is odd during a write lets readers retry a read
+    that raced one.
+    '''
+
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+        self.width = len(METRICS) + 1
+        self._rows = RawArray('d', size * self.width)
+        # sequence, next row, rows used
+        self._state = RawArray('l', 3)
+        # The bucket being averaged from finer samples, writer only
+        self._bucket = None
+        self._sums = [0.0] * len(METRICS)
+        self._counts = [0] * len(METRICS)
+
+    def add(self, ts, values):
+        state = self._state
+        state[0] += 1
+        offset = state[1] * self.width
+        self._rows[offset] = ts
+        self._rows[offset + 1:offset + self.width] = values
+        state[1] = (state[1] + 1) % self.size
+        state[2] = min(self.size, state[2] + 1)
+        state[0] += 1
+
+    def accumulate(self, ts, values):
+        # Buckets are written once a sample lands past their end
+        bucket = int(ts // self.step)
+        if self._bucket is not None and bucket != self._bucket:
+            self._flush()
+        self._bucket = bucket
+
+        for i, value in enumerate(values):
+            if not math.isnan(value):
+                self._sums[i] += value
+                self._counts[i] += 1
+
+    def _flush(self):
+        values = [s / c if c else _NAN
+                  for s, c in zip(self._sums, self._counts)]
+        self.add(self._bucket * self.step, values)
+        self._sums = [0.0] * len(METRICS)
+        self._counts = [0] * len(METRICS)
+
+    def rows(self):
+        '''Rows oldest first, as lists of [timestamp, value, ...]'''
+        while True:
+            seq = self._state[0]
+            if seq % 2 == 0:
+                head = self._state[1]
+                count = self._state[2]
+                data = self._rows[:]
+                if self._state[0] == seq:
+                    break
+            time.sleep(0)
+
+        width = self.width
+        rows = []
+        for i in range(head - count, head):
+            offset = (i % self.size) * width
+            rows.append(data[offset:offset + width])
+        return rows
+
+
+class MetricsStore(object):
+    '''
+    Fixed size history of host metrics.  Samples go into the finest tier
+    as they are and are averaged into the coarser tiers, so memory use is
+    set by TIERS and does not grow with uptime.
+    '''
+
+    def __init__(self, interval, tiers=TIERS):
+        self.interval = interval
+        self.tiers = [_Tier(interval * factor, size)
+                      for factor, size in tiers]
+
+    def add(self, ts, values):
+        self.tiers[0].add(ts, values)
+        for tier in self.tiers[1:]:
+            tier.accumulate(ts, values)
+
+    def tier(self, start=None, end=None, resolution=None):
+        '''
+        The tier to answer a query from: the finest one at least as coarse
+        as resolution, otherwise the finest one that holds the whole range.
+        '''
+        if resolution:
+            for tier in self.tiers:
+                if tier.step >= resolution:
+                    return tier
+            return self.tiers[-1]
+
+        if start is None:
+            return self.tiers[0]
+
+        if end is None:
+            end = time.time()
+        for tier in self.tiers:
+            if tier.step * tier.size >= end - start:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, start=None, end=None, resolution=None, metrics=None):
+        tier = self.tier(start, end, resolution)
+        columns = [i for i, name in enumerate(METRICS)
+                   if not metrics or name in metrics]
+
+        points = []
+        for row in tier.rows():
+            ts = row[0]
+            if start is not None and ts < start:
+                continue
+            if end is not None and ts > end:
+                continue
+            point = [ts]
+            for i in columns:
+                value = row[i + 1]
+                point.append(None if math.isnan(value) else round(value, 3))
+            points.append(point)
+
+        return {
+            'step': tier.step,
+            'metrics': [METRICS[i] for i in columns],
+            'points': points,
+        }
+
+
+class MetricsSampler(object):
+    '''
+    Reads one row of METRICS from /proc and statvfs.  CPU is the host's,
+    from /proc/stat under Config.native_proc_root(), not any cgroup.
+    '''
+
+    def __init__(self, proc_root=None, clock_ticks=None):
+        if proc_root is None:
+            proc_root = Config.native_proc_root()
+        self.proc_root = proc_root
+        self.clock_ticks = clock_ticks
+        # Only for its filesystems
+        self.stats = NativeStatsClient(proc_root=proc_root)
+        self._last = None
+
+    def sample(self):
+        now = time.time()
+        values = []
+        for metric in (self._cpu, self._memory, self._disk, self._load):
+            try:
+                values.append(float(metric(now)))
+            except Exception:
+                log.debug('Failed to sample %s', metric.__name__,
+                          exc_info=True)
+                values.append(_NAN)
+        return now, values
+
+    def _cpu(self, now):
+        usage = host_cpu_usage(self.proc_root, self.clock_ticks)
+        current = (now, sum(usage), len(usage))
+        last, self._last = self._last, current
+        if last is None:
+            return _NAN
+
+        elapsed = (now - last[0]) * 10 ** 9
+        cores = current[2]
+        if cores == 0 or elapsed <= 0:
+            return _NAN
+        busy = current[1] - last[1]
+        return min(100.0, float(busy) / (elapsed * cores) * 100)
+
+    def _memory(self, now):
+        path = os.path.join(self.proc_root, 'meminfo')
+        info = procfs.meminfo(procfs.read(path), _MEMINFO_KEYS)
+
+        total = info['MemTotal']
+        available = info.get('MemAvailable')
+        if available is None:
+            available = (info.get('MemFree', 0) + info.get('Buffers', 0) +
+                         info.get('Cached', 0))
+        return float(total - available) / total * 100
+
+    def _disk(self, now):
+        used = [float(fs['usage']) / fs['capacity'] * 100
+                for fs in self.stats.filesystems() if fs['capacity']]
+        return max(used) if used else _NAN
+
+    def _load(self, now):
+        path = os.path.join(self.proc_root, 'loadavg')
+        with open(path) as f:
+            return f.read().split()[0]
+
+
+class HostMetrics(object):
+    '''
+    Samples METRICS every Config.host_metrics_interval() seconds into a
+    MetricsStore created at startup, before the workers fork.  History is
+    available through the host.metrics.query event and the hostMetrics
+    ping option.
+    '''
+
+    def __init__(self):
+        self.store = None
+        self.sampler = None
+
+    def on_startup(self):
+        if not Config.host_metrics_enabled():
+            return
+
+        self.store = MetricsStore(Config.host_metrics_interval())
+        self.sampler = MetricsSampler()
+
+        t = Thread(target=self._run, name='host-metrics')
+        t.setDaemon(True)
+        t.start()
+
+    def _run(self):
+        interval = self.store.interval
+        next_sample = time.time()
+        while True:
+            try:
+                self.store.add(*self.sampler.sample())
+                next_sample = max(next_sample + interval, time.time())
+                # A slow sample can take the sleep below zero
+                time.sleep(max(0, next_sample - time.time()))
+            except:
+                log.exception('Failed to sample host metrics')
+                time.sleep(interval)
+
+    def query(self, start=None, end=None, resolution=None, metrics=None):
+        if self.store is None:
+            return {}
+        return self.store.query(start, end, resolution, metrics)
+
+    def events(self):
+        return ['host.metrics.query']
+
+    def execute(self, event):
+        name = event.name.split(';', 1)[0]
+        if name not in self.events() or event.replyTo is None:
+            return
+
+        data = event.data or {}
+        return utils.reply(event, self.query(start=data.get('start'),
+                                             end=data.get('end'),
+                                             resolution=data.get('resolution'),
+                                             metrics=data.get('metrics')))
+
+    def on_ping(self, ping, pong):
+        option = utils.ping_include_host_metrics(ping)
+        if not option or self.store is None:
+            return
+
+        # true for the default window or a number of seconds
+        window = Config.host_metrics_ping_window()
+        if option is not True:
+            window = float(option)
+
+        pong.data.hostMetrics = self.query(start=time.time() - window)
+        utils.ping_set_option(pong, 'hostMetrics', True)
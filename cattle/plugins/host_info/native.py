@@ -0,0 +1,384 @@
+import logging
+import os
+import re
+import time
+from multiprocessing.sharedctypes import RawArray
+from threading import Thread
+
+from cattle import Config
+from cattle.plugins.host_info.utils import cached, SLOW
+
+log = logging.getLogger('host_info')
+
+# Columns of a /proc/diskstats line after major, minor and name, with the
+# names cAdvisor uses for them
+_DISKSTATS_FIELDS = ['reads_completed', 'reads_merged', 'sectors_read',
+                     'read_time', 'writes_completed', 'writes_merged',
+                     'sectors_written', 'write_time', 'io_in_progress',
+                     'io_time', 'weighted_io_time']
+
+_CPUACCT_DIRS = ['cpuacct', 'cpu,cpuacct', 'cpuacct,cpu']
+
+_CONTAINER_CGROUP = re.compile(r'^(?:docker-)?([0-9a-f]{64})(?:\.scope)?$')
+
+_NS = 10 ** 9
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _read_int(cgroup, name):
+    if cgroup is None:
+        return None
+    try:
+        return int(_read(os.path.join(cgroup, name)))
+    except (IOError, ValueError):
+        return None
+
+
+def _blkio_bytes(cgroup):
+    # Lines of "major:minor Read|Write|... bytes" and a Total
+    if cgroup is None:
+        return {}
+    try:
+        content = _read(os.path.join(cgroup,
+                                     'blkio.throttle.io_service_bytes'))
+    except IOError:
+        return {}
+
+    counters = {'readBytes': 0, 'writeBytes': 0}
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[1] in ('Read', 'Write'):
+            counters[parts[1].lower() + 'Bytes'] += int(parts[2])
+    return counters
+
+
+def host_cpu_usage(proc_root, clock_ticks=None):
+    '''Busy time of each CPU of the host in ns, from /proc/stat'''
+    if clock_ticks is None:
+        clock_ticks = _CLOCK_TICKS
+    usage = []
+    for line in _read(os.path.join(proc_root, 'stat')).splitlines():
+        if not line.startswith('cpu') or line.startswith('cpu '):
+            continue
+        # user nice system idle iowait irq softirq steal, busy time is
+        # everything but idle and iowait
+        values = [int(x) for x in line.split()[1:9]]
+        busy = sum(values) - values[3] - values[4]
+        usage.append(busy * _NS / clock_ticks)
+    return usage
+
+
+def _cpu_sample(timestamp, per_cpu):
+    return {
+        'timestamp': int(timestamp * _NS),
+        'cpu': {
+            'usage': {
+                'total': sum(per_cpu),
+                'per_cpu_usage': per_cpu,
+            },
+        },
+    }
+
+
+class CpuSampler(object):
+    '''
+    Samples host CPU every Config.native_stats_interval() seconds into a
+    ring of the last Config.native_stats_samples() samples.  It is started
+    at agent startup, before the workers fork, and the ring lives in shared
+    memory, so the ping worker has rates on its first ping.  A sequence
+    counter that is odd during a write lets readers retry a read that raced
+    one.
+    '''
+
+    def __init__(self):
+        self.proc_root = None
+        self.size = 0
+        self.width = 0
+        self._rows = None
+        self._state = None
+
+    def on_startup(self):
+        if Config.host_info_backend() == 'native':
+            self.start()
+
+    def start(self, proc_root=None):
+        if self._rows is not None:
+            return
+
+        self.proc_root = Config.native_proc_root() if proc_root is None \
+            else proc_root
+        self.size = Config.native_stats_samples()
+        # timestamp and the usage of each CPU
+        self.width = len(host_cpu_usage(self.proc_root)) + 1
+        self._rows = RawArray('d', self.size * self.width)
+        # sequence, next row, rows used
+        self._state = RawArray('l', 3)
+        self.sample()
+
+        t = Thread(target=self._run, name='native-stats')
+        t.setDaemon(True)
+        t.start()
+
+    def _run(self):
+        while True:
+            time.sleep(Config.native_stats_interval())
+            try:
+                self.sample()
+            except:
+                log.exception('Failed to sample host CPU')
+
+    def sample(self):
+        now = time.time()
+        per_cpu = host_cpu_usage(self.proc_root)
+        if len(per_cpu) != self.width - 1:
+            # CPUs came or went, the ring only fits the count at startup
+            log.debug('Skipping CPU sample of %s CPUs', len(per_cpu))
+            return
+
+        state = self._state
+        state[0] += 1
+        offset = state[1] * self.width
+        self._rows[offset] = now
+        self._rows[offset + 1:offset + self.width] = per_cpu
+        state[1] = (state[1] + 1) % self.size
+        state[2] = min(self.size, state[2] + 1)
+        state[0] += 1
+
+    def samples(self):
+        '''Samples oldest first, None if the sampler wasn't started'''
+        if self._rows is None:
+            return None
+
+        while True:
+            seq = self._state[0]
+            if seq % 2 == 0:
+                head = self._state[1]
+                count = self._state[2]
+                data = self._rows[:]
+                if self._state[0] == seq:
+                    break
+            time.sleep(0)
+
+        width = self.width
+        samples = []
+        for i in range(head - count, head):
+            offset = (i % self.size) * width
+            samples.append(_cpu_sample(
+                data[offset], [int(x) for x in
+                               data[offset + 1:offset + width]]))
+        return samples
+
+
+SAMPLER = CpuSampler()
+
+
+class NativeStatsClient(object):
+    '''
+    Drop in replacement for CadvisorAPIClient that reads /proc, the docker
+    cgroups and statvfs directly.  Samples have the same shape as the
+    cAdvisor v1.x stats the collectors read, so cpuCoresPercentages,
+    mountPoints and fileSystems come out the same.
+
+    Host CPU comes from /proc/stat, sampled by the CpuSampler started at
+    startup.  Without it there is only the current sample, so no rates.
+    Filesystems change slowly and are read at the slow cache tier.
+    '''
+
+    def __init__(self, proc_root=None, cgroup_root=None, num_stats=None,
+                 sampler=None):
+        if proc_root is None:
+            proc_root = Config.native_proc_root()
+        if cgroup_root is None:
+            cgroup_root = Config.native_cgroup_root()
+
+        self.proc_root = proc_root
+        self.cgroup_root = cgroup_root
+        self.num_stats = num_stats
+        self.sampler = SAMPLER if sampler is None else sampler
+        self._clock_ticks = _CLOCK_TICKS
+
+    def new_cycle(self):
+        pass
+
+    def get_stats(self):
+        samples = self.sampler.samples()
+        if not samples:
+            samples = [self._cpu_sample()]
+        if self.num_stats:
+            samples = samples[-self.num_stats:]
+
+        filesystems = self._filesystems()
+        for sample in samples:
+            sample['filesystem'] = filesystems
+        return samples
+
+    def get_latest_stat(self):
+        samples = self.get_stats()
+        if len(samples) > 0:
+            return samples[-1]
+        return {}
+
+    def filesystems(self):
+        return self._filesystems()
+
+    def get_machine_stats(self):
+        return {
+            'num_cores': len(self._per_cpu_usage()),
+            'filesystems': [{'device': fs['device'],
+                             'capacity': fs['capacity']}
+                            for fs in self._filesystems()],
+        }
+
+    def timestamp_diff(self, time_current, time_prev):
+        return float(time_current - time_prev)
+
+    def sample(self):
+        sample = self._cpu_sample()
+        sample['filesystem'] = self._filesystems()
+        return sample
+
+    def _cpu_sample(self):
+        return _cpu_sample(time.time(), self._per_cpu_usage())
+
+    def get_container_counters(self):
+        '''
+        Usage counters of every docker container, read straight from the
+        docker cgroups, as {docker id: [latest]}.
+        '''
+        now = int(time.time() * _NS)
+        cpuacct = self._container_cgroups(_CPUACCT_DIRS)
+        memory = self._container_cgroups(['memory'])
+        blkio = self._container_cgroups(['blkio'])
+
+        counters = {}
+        for docker_id, path in cpuacct.iteritems():
+            try:
+                cpu = int(_read(os.path.join(path, 'cpuacct.usage')))
+            except (IOError, ValueError):
+                continue
+
+            c = {
+                'timestamp': now,
+                'cpu': cpu,
+                'memory': _read_int(memory.get(docker_id),
+                                    'memory.usage_in_bytes'),
+            }
+            c.update(self._container_network(path))
+            c.update(_blkio_bytes(blkio.get(docker_id)))
+            counters[docker_id] = [c]
+
+        return counters
+
+    def _container_cgroups(self, subsystems):
+        # cgroupfs puts containers in docker/<id>, systemd in
+        # system.slice/docker-<id>.scope
+        found = {}
+        for subsystem in subsystems:
+            for parent in ('docker', 'system.slice'):
+                base = os.path.join(self.cgroup_root, subsystem, parent)
+                try:
+                    names = os.listdir(base)
+                except OSError:
+                    continue
+                for name in names:
+                    match = _CONTAINER_CGROUP.match(name)
+                    if match:
+                        found[match.group(1)] = os.path.join(base, name)
+            if found:
+                break
+        return found
+
+    def _container_network(self, cgroup):
+        # cgroups don't count network traffic, read it from the container's
+        # network namespace through one of its processes
+        try:
+            pid = _read(os.path.join(cgroup, 'cgroup.procs')).split()[0]
+            content = _read(os.path.join(self.proc_root, pid, 'net', 'dev'))
+        except (IOError, IndexError):
+            return {}
+
+        rx = tx = 0
+        for line in content.splitlines()[2:]:
+            name, _, values = line.partition(':')
+            if name.strip() == 'lo':
+                continue
+            values = values.split()
+            rx += int(values[0])
+            tx += int(values[8])
+        return {'rxBytes': rx, 'txBytes': tx}
+
+    def _per_cpu_usage(self):
+        return host_cpu_usage(self.proc_root, self._clock_ticks)
+
+    def _diskstats(self):
+        stats = {}
+        try:
+            content = _read(os.path.join(self.proc_root, 'diskstats'))
+        except IOError:
+            return stats
+
+        for line in content.splitlines():
+            parts = line.split()
+            if len(parts) < 14:
+                continue
+            stats[parts[2]] = dict(zip(_DISKSTATS_FIELDS,
+                                       [int(x) for x in parts[3:14]]))
+        return stats
+
+    def _mounts(self):
+        # pid 1's view is the host's when the agent runs in a container
+        # with the host's /proc
+        for path in ('1/mounts', 'mounts'):
+            try:
+                return _read(os.path.join(self.proc_root, path)).splitlines()
+            except IOError:
+                pass
+        return []
+
+    def _statvfs(self, mountpoint):
+        host_path = os.path.join(self.proc_root, '1', 'root',
+                                 mountpoint.lstrip('/'))
+        for path in (host_path, mountpoint):
+            try:
+                return os.statvfs(path)
+            except OSError:
+                pass
+        return None
+
+    @cached(SLOW)
+    def _filesystems(self):
+        diskstats = self._diskstats()
+        seen = set()
+        filesystems = []
+
+        for line in self._mounts():
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+
+            device, mountpoint = parts[0], parts[1]
+            if not device.startswith('/dev/') or device in seen:
+                continue
+
+            st = self._statvfs(mountpoint.replace('\\040', ' '))
+            if st is None:
+                continue
+            seen.add(device)
+
+            fs = {
+                'device': device,
+                'capacity': st.f_blocks * st.f_frsize,
+                'usage': (st.f_blocks - st.f_bfree) * st.f_frsize,
+                'available': st.f_bavail * st.f_frsize,
+            }
+            name = os.path.basename(os.path.realpath(device))
+            fs.update(diskstats.get(name, {}))
+            filesystems.append(fs)
+
+        return filesystems
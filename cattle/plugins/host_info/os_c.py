@@ -1,5 +1,5 @@
 import platform
-from .utils import semver_trunk
+from .utils import semver_trunk, cached, SLOW
 
 
 class OSCollector(object):
@@ -19,6 +19,11 @@ class OSCollector(object):
 
         return data
 
+    @cached(SLOW)
+    def _docker_info(self):
+        return self.docker_client.info()
+
+    @cached(SLOW)
     def _docker_version_request(self):
         if self.docker_client:
             return self.docker_client.version()
@@ -52,8 +57,7 @@ class OSCollector(object):
         if platform.system() == 'Linux':
             if self.docker_client:
                 data["operatingSystem"] = \
-                    self.docker_client.info().get("OperatingSystem",
-                                                  None)
+                    self._docker_info().get("OperatingSystem", None)
 
             data['kernelVersion'] = \
                 platform.release() if len(platform.release()) > 0 else None
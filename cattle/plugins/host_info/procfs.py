@@ -0,0 +1,111 @@
+import io
+import os
+import re
+import threading
+
+# Big enough for /proc/cpuinfo of a few dozen cores, grown when needed
+_BUFFER_SIZE = 64 * 1024
+
+_GHZ = re.compile(r'([0-9\.]+)\s?GHz')
+
+_local = threading.local()
+
+
+def read(path):
+    '''
+    The whole of a /proc file, read with one open into a per thread buffer
+    that is reused between calls.  /proc files report a size of 0, so the
+    buffer is doubled until a read comes back short.
+    '''
+    buf = getattr(_local, 'buf', None)
+    if buf is None:
+        buf = _local.buf = bytearray(_BUFFER_SIZE)
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        f = io.FileIO(fd, closefd=False)
+        size = 0
+        while True:
+            if size == len(buf):
+                buf.extend(bytearray(len(buf)))
+            n = f.readinto(memoryview(buf)[size:])
+            if not n:
+                break
+            size += n
+    finally:
+        os.close(fd)
+
+    return str(buf[:size])
+
+
+def _find_line(content, key, start=0):
+    # Offset just past the ':' of the first "key<whitespace>: value" line
+    while True:
+        i = content.find(key, start)
+        if i == -1:
+            return -1
+        start = i + len(key)
+        if i > 0 and content[i - 1] != '\n':
+            continue
+        colon = content.find(':', start)
+        if colon != -1 and not content[start:colon].strip():
+            return colon + 1
+
+
+def _value(content, offset):
+    end = content.find('\n', offset)
+    if end == -1:
+        end = len(content)
+    return content[offset:end].strip()
+
+
+def fields(content, keys):
+    '''
+    Values of the "key: value" lines of keys only, the first of each.
+    Nothing is done with the lines of any other key.
+    '''
+    values = {}
+    for key in keys:
+        offset = _find_line(content, key)
+        if offset != -1:
+            values[key] = _value(content, offset)
+    return values
+
+
+def count(content, key):
+    '''The number of "key: value" lines'''
+    n = 0
+    offset = _find_line(content, key)
+    while offset != -1:
+        n += 1
+        offset = _find_line(content, key, offset)
+    return n
+
+
+def meminfo(content, keys):
+    '''Values of /proc/meminfo keys in kB'''
+    return dict((k, int(v.split()[0]))
+                for k, v in fields(content, keys).iteritems())
+
+
+def cpuinfo(content):
+    '''
+    modelName, count and mhz from /proc/cpuinfo.  Every core has its own
+    model name line, but they are all the same, so only the first is
+    read and the frequency comes from its GHz suffix when it has one,
+    otherwise from the first cpu MHz line.
+    '''
+    values = fields(content, ('model name', 'cpu MHz'))
+
+    data = {
+        'modelName': values.get('model name'),
+        'count': count(content, 'model name'),
+    }
+
+    freq = _GHZ.search(data['modelName'] or '')
+    if freq:
+        data['mhz'] = float(freq.group(1)) * 1000
+    elif 'cpu MHz' in values:
+        data['mhz'] = float(values['cpu MHz'])
+
+    return data
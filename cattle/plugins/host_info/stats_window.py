@@ -0,0 +1,99 @@
+import math
+import re
+from array import array
+
+_NS = 1e9
+_DURATION = re.compile(r'([0-9.]+)(ns|us|ms|s|m|h)')
+_UNITS = {'ns': 1e-9, 'us': 1e-6, 'ms': 1e-3, 's': 1, 'm': 60, 'h': 3600}
+
+
+def duration_seconds(value):
+    '''
+    Seconds in a Go duration such as cAdvisor's -housekeeping_interval,
+    e.g. 1s, 500ms or 1m30s.
+    '''
+    seconds = 0.0
+    for number, unit in _DURATION.findall(value):
+        seconds += float(number) * _UNITS[unit]
+    return seconds
+
+
+def samples_for_window(window, interval):
+    if interval <= 0:
+        return 2
+    return int(math.ceil(window / interval)) + 1
+
+
+def percentile(values, pct):
+    # Nearest rank on a sorted list
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, rank)]
+
+
+def cpu_window(samples, timestamp_diff, window=None):
+    '''
+    CPU utilization over cAdvisor style samples, oldest first, limited to
+    the last window seconds.  timestamp_diff(a, b) returns a - b in
+    nanoseconds.  Each sample's per_cpu_usage is a cumulative nanosecond
+    counter, so per core use is the counter delta over the time delta.
+
+    Returns None with fewer than two usable samples.
+    '''
+    if len(samples) < 2:
+        return None
+
+    latest = samples[-1]['timestamp']
+    if window:
+        limit = window * _NS
+        samples = [s for s in samples
+                   if timestamp_diff(latest, s['timestamp']) <= limit]
+
+    usage = [array('d', s['cpu']['usage']['per_cpu_usage'])
+             for s in samples]
+    cores = len(usage[-1])
+    if cores == 0:
+        return None
+
+    # Drop samples from before a CPU was hot plugged
+    start = 0
+    for i, u in enumerate(usage):
+        if len(u) != cores:
+            start = i + 1
+    samples = samples[start:]
+    usage = usage[start:]
+    if len(samples) < 2:
+        return None
+
+    times = [timestamp_diff(s['timestamp'], samples[0]['timestamp'])
+             for s in samples]
+    totals = array('d', [sum(u) for u in usage])
+
+    intervals = []
+    for i in range(1, len(samples)):
+        dt = times[i] - times[i - 1]
+        if dt > 0:
+            busy = totals[i] - totals[i - 1]
+            intervals.append(min(100.0, busy / (dt * cores) * 100))
+
+    span = times[-1]
+    if span <= 0 or not intervals:
+        return None
+
+    first = usage[0]
+    last = usage[-1]
+    per_core = [round(min(100.0, (b - a) / span * 100), 3)
+                for a, b in zip(first, last)]
+    intervals.sort()
+
+    return {
+        'seconds': round(span / _NS, 3),
+        'samples': len(samples),
+        'coresPercentages': per_core,
+        'min': round(intervals[0], 3),
+        'avg': round(min(100.0, (totals[-1] - totals[0]) /
+                         (span * cores) * 100), 3),
+        'max': round(intervals[-1], 3),
+        'p95': round(percentile(intervals, 95), 3),
+    }
@@ -1,4 +1,18 @@
+import copy
+import logging
+import os
 import re
+import time
+from threading import Lock
+
+from cattle import Config
+
+log = logging.getLogger('host_info')
+
+# Cache tiers for collector methods, see Config.host_info_ttl
+STATIC = 'static'
+SLOW = 'slow'
+LIVE = 'live'
 
 
 def semver_trunk(version, vrm_vals=3):
@@ -17,3 +31,100 @@ def semver_trunk(version, vrm_vals=3):
             }.get(vrm_vals, version)
 
         return version
+
+
+def cached(tier):
+    '''
+    Cache a collector method per instance and arguments for
+    Config.host_info_ttl(tier) seconds.  Empty results aren't cached, so a
+    source that isn't up yet (cAdvisor right after startup) is asked again
+    on the next ping.
+    '''
+    def decorator(function):
+        def wrapper(self, *args, **kw):
+            ttl = Config.host_info_ttl(tier)
+            if ttl == 0:
+                return function(self, *args, **kw)
+
+            try:
+                cache = self._cache
+            except AttributeError:
+                cache = self._cache = {}
+
+            key = (function.__name__, args, tuple(sorted(kw.items())))
+            now = time.time()
+            try:
+                expires, value = cache[key]
+                if expires is None or now < expires:
+                    return copy.deepcopy(value)
+            except KeyError:
+                pass
+
+            value = function(self, *args, **kw)
+            if value:
+                cache[key] = (None if ttl < 0 else now + ttl, value)
+            return copy.deepcopy(value)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+    return decorator
+
+
+class WatchedFiles(object):
+    '''
+    The result of load(), reloaded only when the mtime or size of one of
+    paths changes.  The files are checked at most every interval seconds
+    so callers on every ping or container start don't touch the disk.
+    Until all of paths exist the value is empty.
+    '''
+
+    def __init__(self, paths, load, interval=None):
+        self.paths = paths
+        self.load = load
+        self.interval = interval
+        self.value = {}
+        self._stamp = None
+        self._checked = None
+        self._lock = Lock()
+
+    def get(self):
+        interval = self.interval
+        if interval is None:
+            interval = Config.host_info_watch_interval()
+
+        with self._lock:
+            now = time.time()
+            if self._checked is not None and now - self._checked < interval:
+                return self.value
+            self._checked = now
+
+            stamp = self._stat()
+            if stamp == self._stamp:
+                return self.value
+
+            if None in stamp:
+                self.value = {}
+                self._stamp = stamp
+                return self.value
+
+            try:
+                self.value = self.load()
+                self._stamp = stamp
+            except Exception:
+                # Most likely a file that's still being written, keep the
+                # last value and try again on the next check
+                log.exception('Failed to load %s', ', '.join(self.paths))
+
+            return self.value
+
+    def _stat(self):
+        stamp = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
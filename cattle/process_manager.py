@@ -1,7 +1,19 @@
-import time
-import os
+import errno
+import fcntl
 import logging
-from threading import Thread
+import os
+import select
+import signal
+import time
+from collections import deque
+from threading import Thread, RLock
+
+import psutil
+
+from cattle import Config
+from cattle import liveness
+from cattle import metrics
+from cattle import startup_profile
 try:
     from subprocess32 import Popen
 except:
@@ -9,78 +21,406 @@ except:
 
 log = logging.getLogger('process-manager')
 
+RUNNING = 'running'
+BACKOFF = 'backoff'
+CRASH_LOOP = 'crash-loop'
+STOPPED = 'stopped'
+
+
+# Scraped from the agent process, which runs the supervisor.  The metrics
+# of a scrape share one stats() call, as CPU percent is measured between
+# calls.
+_SNAPSHOT = {'time': 0, 'stats': []}
+SNAPSHOT_AGE = 1
+
+
+def _stat(key):
+    def read():
+        now = time.time()
+        if now - _SNAPSHOT['time'] > SNAPSHOT_AGE:
+            _SNAPSHOT['stats'] = stats()
+            _SNAPSHOT['time'] = now
+        return dict((s['name'], s[key]) for s in _SNAPSHOT['stats'])
+    return read
+
+
+metrics.callback('cattle_child_restarts_total',
+                 'Restarts of each supervised process', 'child',
+                 _stat('restarts'), kind='counter')
+metrics.callback('cattle_child_uptime_seconds',
+                 'Seconds since each supervised process started', 'child',
+                 _stat('uptime'))
+metrics.callback('cattle_child_cpu_percent',
+                 'CPU percent of each supervised process since the last '
+                 'scrape', 'child', _stat('cpuPercent'))
+metrics.callback('cattle_child_cpu_seconds_total',
+                 'CPU time of each supervised process', 'child',
+                 _stat('cpuTime'), kind='counter')
+metrics.callback('cattle_child_rss_bytes',
+                 'Resident memory of each supervised process', 'child',
+                 _stat('rss'))
+metrics.callback('cattle_child_crash_loop',
+                 '1 while a supervised process is crash looping', 'child',
+                 _stat('crashLoop'))
+
+
+# The basic problem is the agent will spawn many subprocesses that need to be
+# alive as long as the agent is alive.  If the subprocess dies, it should be
+# restarted.  If the agent dies, the subprocess should die too.
+#
+# Children are launched from a single long lived supervisor thread with
+# PR_SET_PDEATHSIG so the kernel kills them with the agent.  SIGCHLD wakes the
+# supervisor through signal.set_wakeup_fd, which reaps only its own children
+# (multiprocessing workers are left alone) and restarts them with
+# exponential backoff.  The supervisor blocks on the wakeup pipe, and on a
+# pidfd per child where the kernel has them (Linux 5.3+), and only reaps when
+# it is woken.  Python 2 skips the wakeup write while an earlier signal is
+# still waiting for the main thread, so children without a pidfd are also
+# polled every FALLBACK_INTERVAL seconds, or every POLL_INTERVAL seconds when
+# the handler can't be installed.
+#
+# The SIGCHLD handler is process wide.  signal.siginterrupt(SIGCHLD, False)
+# asks for SA_RESTART, so a child exiting doesn't fail the blocking calls of
+# other threads with EINTR.  Calls the kernel never restarts, like select(),
+# still see EINTR and have to retry.
+class Child(object):
+    def __init__(self, name, args, kw):
+        self.name = name
+        self.args = args
+        self.kw = kw
+        self.process = None
+        self.started = None
+        self.restarts = 0
+        self.failures = 0
+        self.exits = deque()
+        self.returncode = None
+        self.next_start = 0
+        self.state = BACKOFF
+        self.crash_loop = False
+        self.pidfd = None
+        self._ps = None
+
+    @property
+    def pid(self):
+        if self.process is None:
+            return None
+        return self.process.pid
+
+    def stats(self, now=None):
+        if now is None:
+            now = time.time()
+
+        ret = {
+            'name': self.name,
+            'pid': self.pid,
+            'state': self.state,
+            'restarts': self.restarts,
+            'crashLoop': self.crash_loop,
+            'uptime': None,
+            'lastExitCode': self.returncode,
+            'cpuPercent': None,
+            'cpuTime': None,
+            'rss': None,
+        }
+
+        if self.process is None:
+            return ret
+
+        ret['uptime'] = round(now - self.started, 3)
+        try:
+            if self._ps is None or self._ps.pid != self.pid:
+                self._ps = psutil.Process(self.pid)
+                # The first call only primes the counters
+                self._ps.cpu_percent(interval=None)
+            with self._ps.oneshot():
+                cpu = self._ps.cpu_times()
+                ret['cpuPercent'] = self._ps.cpu_percent(interval=None)
+                ret['cpuTime'] = round(cpu.user + cpu.system, 3)
+                ret['rss'] = self._ps.memory_info().rss
+        except psutil.Error:
+            pass
+
+        return ret
+
 
-# There's nothing about this solution that I particularly like.  The basic
-# problem is the agent will spawn many subprocesses that need to be alive as
-# long as the agent is alive.  If the subprocess dies, it should be restarted.
-# If the agent dies, the subprocess should die too.  A better solution could
-# be to make the agent process be PID 1 in a new PID namespace.
 class ProcessManager(object):
+    POLL_INTERVAL = 1
+    FALLBACK_INTERVAL = 30
+
     def __init__(self):
-        self.pids = {}
-        self.processes = []
+        self.children = []
+        self._lock = RLock()
+        self._thread = None
+        self._running = False
+        self._pdeathsig = False
+        self._sigchld = False
+        self._wake_r = None
+        self._wake_w = None
+        self._last_reap = 0
 
     def init(self):
-        script = os.path.join(os.path.dirname(__file__), 'process_watcher.sh')
+        self._pdeathsig = liveness.pdeathsig_supported()
+        if not self._pdeathsig:
+            log.warn('PR_SET_PDEATHSIG is not supported, children may '
+                     'outlive the agent if it is killed')
 
-        launch_script = False
+        self._wake_r, self._wake_w = os.pipe()
+        for fd in (self._wake_r, self._wake_w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self._sigchld = self._install_sigchld()
+        self._running = True
+
+        self._thread = Thread(target=self.watch, name='process-manager')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _install_sigchld(self):
+        # set_wakeup_fd() writes to the pipe from the C level handler, so the
+        # supervisor wakes up even while the main thread is blocked.  Both
+        # calls only work from the main thread, otherwise fall back to
+        # polling.
         try:
-            # If this isn't UNIX, this will fail, so just ignore it
-            os.setpgid(0, 0)
-            launch_script = True
-        except:
-            pass
+            signal.signal(signal.SIGCHLD, _on_sigchld)
+            # Restart other threads' system calls rather than fail them
+            signal.siginterrupt(signal.SIGCHLD, False)
+            signal.set_wakeup_fd(self._wake_w)
+            return True
+        except (AttributeError, ValueError):
+            log.info('Can not handle SIGCHLD, checking children every %s '
+                     'seconds', self.POLL_INTERVAL)
+            return False
+
+    def stop(self, timeout=5):
+        with self._lock:
+            self._running = False
+            children = list(self.children)
+
+        if self._sigchld:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            self._sigchld = False
+
+        if self._thread is not None:
+            self._wake()
+            self._thread.join(timeout)
+            self._thread = None
 
-        if launch_script:
-            self.background([script])
+        for child in children:
+            child.state = STOPPED
+            _close_pidfd(child)
+            if child.process is not None and child.process.poll() is None:
+                child.process.terminate()
 
-        t = Thread(target=self.watch)
-        t.setDaemon(True)
-        t.start()
+        end = time.time() + timeout
+        for child in children:
+            if child.process is None:
+                continue
+            while child.process.poll() is None and time.time() < end:
+                time.sleep(0.05)
+            if child.process.poll() is None:
+                child.process.kill()
+                child.process.wait()
+
+        for fd in (self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._wake_r = self._wake_w = None
+
+    def supervise(self, name, *args, **kw):
+        '''
+        Run Popen(*args, **kw) until the agent exits, restarting it whenever
+        it dies.  Returns the Child so callers can inspect its state.
+        '''
+        child = Child(name, args, kw)
+        with self._lock:
+            self.children.append(child)
+
+        if self._thread is None:
+            self._start(child, time.time())
+        else:
+            self._wake()
+
+        return child
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            children = list(self.children)
+        return [child.stats(now) for child in children]
 
     def watch(self):
-        while True:
-            time.sleep(2)
+        while self._running:
             try:
-                self.processes = filter(_wait_process, self.processes)
-
-                for pid, spawn in self.pids.items():
-                    if not os.path.exists('/proc/{0}'.format(pid)):
-                        self._exec(spawn, pid)
+                self._wait()
             except:
-                log.exception('Error in process watcher')
+                log.exception('Error in process supervisor')
+                time.sleep(1)
+
+    def _wake(self):
+        if self._wake_w is None:
+            return
+        try:
+            os.write(self._wake_w, 'x')
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
 
-    def _exec(self, spawn, old_pid=None):
+    def _poll_interval(self):
+        if self._sigchld:
+            return self.FALLBACK_INTERVAL
+        return self.POLL_INTERVAL
+
+    def _timeout(self, now):
+        timeout = None
+        with self._lock:
+            for child in self.children:
+                if child.state == STOPPED:
+                    continue
+                if child.process is None:
+                    delay = max(0, child.next_start - now)
+                elif child.pidfd is None:
+                    delay = max(0, self._last_reap + self._poll_interval() -
+                                now)
+                else:
+                    continue
+                if timeout is None or delay < timeout:
+                    timeout = delay
+        return timeout
+
+    def _wait(self):
+        with self._lock:
+            fds = [c.pidfd for c in self.children if c.pidfd is not None]
         try:
-            new_pid = spawn()
-            self.pids[new_pid] = spawn
+            readable, _, _ = select.select([self._wake_r] + fds, [], [],
+                                           self._timeout(time.time()))
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            readable = []
+
+        if self._wake_r in readable:
             try:
-                del self.pids[old_pid]
-            except KeyError:
-                pass
+                os.read(self._wake_r, 4096)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+        if not self._running:
+            return
+
+        now = time.time()
+        # Woken by SIGCHLD, or the fallback poll is due
+        if readable or now - self._last_reap >= self._poll_interval():
+            self._last_reap = now
+            self._reap(now)
+        self._start_due(now)
+
+    def _reap(self, now):
+        with self._lock:
+            children = [c for c in self.children if c.process is not None]
+
+        for child in children:
+            # poll() is waitpid(pid, WNOHANG), so only our children are
+            # reaped
+            if child.process.poll() is not None:
+                log.info('Process %s (pid %d) exited with %s after %.1f '
+                         'seconds', child.name, child.process.pid,
+                         child.process.returncode, now - child.started)
+                self._exited(child, child.process.returncode, now)
+
+    def _start_due(self, now):
+        with self._lock:
+            due = [c for c in self.children
+                   if c.process is None and c.state != STOPPED and
+                   c.next_start <= now]
+
+        for child in due:
+            self._start(child, now)
+
+    def _start(self, child, now):
+        if child.started is not None:
+            child.restarts += 1
+
+        try:
+            child.process = self._launch(child)
+            child.started = now
+            child.state = RUNNING
+            try:
+                child.pidfd = liveness.pidfd_open(child.process.pid)
+            except (AttributeError, OSError):
+                child.pidfd = None
         except:
-            log.exception('Failed to spawn process')
+            log.exception('Failed to launch %s', child.name)
+            child.started = now
+            self._exited(child, None, now)
+
+    def _launch(self, child):
+        kw = dict(child.kw)
+        log.info('Launching %s', child.args[0])
+        if self._pdeathsig:
+            kw['preexec_fn'] = liveness.set_pdeathsig
+        with startup_profile.timed('process', child.name):
+            p = Popen(*child.args, **kw)
+        log.info('Launched %s as pid %d', child.args[0], p.pid)
+        return p
+
+    def _exited(self, child, returncode, now):
+        _close_pidfd(child)
+        child.process = None
+        child.returncode = returncode
+
+        # A child that stayed up for the backoff ceiling was healthy, so the
+        # next failure restarts immediately again
+        max_backoff = Config.process_max_backoff()
+        if now - child.started >= max_backoff:
+            child.failures = 0
+        child.failures += 1
+
+        window = Config.process_crash_loop_window()
+        child.exits.append(now)
+        while child.exits and child.exits[0] < now - window:
+            child.exits.popleft()
+
+        crash_loop = len(child.exits) >= Config.process_crash_loop_restarts()
+        if crash_loop and not child.crash_loop:
+            log.error('Process %s exited %d times in %d seconds, restarting '
+                      'every %d seconds', child.name, len(child.exits),
+                      window, max_backoff)
+        elif child.crash_loop and not crash_loop:
+            log.info('Process %s is no longer crash looping', child.name)
+        child.crash_loop = crash_loop
+
+        if crash_loop:
+            child.state = CRASH_LOOP
+            delay = max_backoff
+        else:
+            child.state = BACKOFF
+            delay = backoff(child.failures, max_backoff)
+
+        child.next_start = now + delay
+
+
+def _close_pidfd(child):
+    if child.pidfd is not None:
+        os.close(child.pidfd)
+        child.pidfd = None
+
 
-    def _exec_background(self, *args, **kw):
-        log.info('Launching %s', args[0])
-        p = Popen(*args, **kw)
-        self.processes.append(p)
-        log.info('Launched %s as pid %d', args[0], p.pid)
-        return p.pid
+def backoff(failures, max_backoff):
+    if failures <= 1:
+        return 0
+    return min(max_backoff, 2 ** (failures - 2))
 
-    def background(self, *args, **kw):
-        self._exec(lambda: self._exec_background(*args, **kw))
 
+def _on_sigchld(signum, frame):
+    # The wakeup fd does the work, this only replaces SIG_DFL
+    pass
 
-def _wait_process(process):
-    process.poll()
-    if process.returncode is not None:
-        log.info('Process %d is dead, return code %d', process.pid,
-                 process.returncode)
-        return False
-    return True
 
 _PROCESS_MANAGER = ProcessManager()
 
-background = _PROCESS_MANAGER.background
+supervise = _PROCESS_MANAGER.supervise
+stats = _PROCESS_MANAGER.stats
 init = _PROCESS_MANAGER.init
@@ -0,0 +1,287 @@
+'''
+A sampling profiler that can be switched on in a running agent.
+
+request() starts a profiling session for a number of seconds, from the
+agent.profile event or Config.profile_signal().  The session lives in
+shared memory created by init() before the workers fork, and every
+process started watch() on it, so each of them samples the stacks of
+all its threads, and with eventlet its greenthreads, until the session
+ends.  Watchers block on a pipe, also created by init(), that request()
+writes a byte per watcher to when a session starts.  Each process then
+writes its samples in the collapsed stack format flamegraph.pl reads to
+
+    Config.profile_dir()/profile-<session>-<pid>.txt
+
+with the process and thread names as the root frames, so the files of
+a session can simply be concatenated.  The agent.profile event replies
+at once with the session id and end time, and returns those files, or
+their content, when sent again with the session id after the end.
+
+The sampler sleeps long enough to keep its own CPU use under
+MAX_OVERHEAD of one core, sessions are capped at
+Config.profile_max_duration() and each process keeps at most MAX_STACKS
+distinct stacks, so a session is safe to run on a busy host.
+'''
+
+import errno
+import fcntl
+import glob
+import logging
+import os
+import signal
+import sys
+import time
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+from cattle import Config
+
+if Config.is_eventlet():
+    from eventlet import patcher
+    # The sampler has to be a real thread to see a busy hub
+    _threading = patcher.original('threading')
+    _sleep = patcher.original('time').sleep
+    _read = patcher.original('os').read
+else:
+    import threading as _threading
+    _sleep = time.sleep
+    _read = os.read
+
+log = logging.getLogger('profiler')
+
+MAX_OVERHEAD = 0.05
+MAX_STACKS = 5000
+MAX_DEPTH = 100
+KEEP_SESSIONS = 5
+# Wakeups written at once, well under the size of a pipe
+MAX_WAKE = 1024
+
+_state = {'session': None, 'lock': None, 'watchers': None, 'wake': None}
+_watching = {'pid': None}
+
+
+def init():
+    '''Create the shared session, before workers fork'''
+    if _state['session'] is None:
+        # session start, session end
+        _state['session'] = RawArray('d', 2)
+        # Watchers ever started, ones that died stay counted and their
+        # wakeups are read by the others as spurious ones
+        _state['watchers'] = RawValue('l', 0)
+        _state['lock'] = Lock()
+
+        r, w = os.pipe()
+        for fd in (r, w):
+            fcntl.fcntl(fd, fcntl.F_SETFD,
+                        fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        # request() runs in a signal handler, it must never block
+        fcntl.fcntl(w, fcntl.F_SETFL,
+                    fcntl.fcntl(w, fcntl.F_GETFL) | os.O_NONBLOCK)
+        _state['wake'] = (r, w)
+
+
+def request(duration):
+    '''
+    Start a session of duration seconds in every watching process, or
+    extend the running one.  Returns the session id and end time.
+    '''
+    init()
+    duration = max(0, min(float(duration), Config.profile_max_duration()))
+    session = _state['session']
+    now = time.time()
+    with _state['lock']:
+        started = session[1] <= now
+        if started:
+            session[0] = now
+        session[1] = max(session[1], now + duration)
+        id = _session_id(session[0])
+        until = session[1]
+        watchers = _state['watchers'].value
+
+    if started:
+        _wake(watchers)
+    log.info('Profiling session %s until %s', id, until)
+    _prune(id)
+    return id, until
+
+
+def _session_id(start):
+    return str(int(start * 1000))
+
+
+def _wake(watchers):
+    try:
+        os.write(_state['wake'][1], 'x' * min(watchers, MAX_WAKE))
+    except OSError as e:
+        # Full of wakeups nobody is waiting for
+        if e.errno != errno.EAGAIN:
+            raise
+
+
+def _wait():
+    try:
+        _read(_state['wake'][0], 1)
+    except OSError as e:
+        if e.errno != errno.EINTR:
+            raise
+
+
+def watch(name):
+    '''Sample this process during sessions, once per process'''
+    init()
+    pid = os.getpid()
+    if _watching['pid'] == pid:
+        return
+    _watching['pid'] = pid
+    with _state['lock']:
+        _state['watchers'].value += 1
+
+    t = _threading.Thread(target=_watch, args=(name,), name='profiler')
+    t.setDaemon(True)
+    t.start()
+
+
+def _watch(name):
+    session = _state['session']
+    seen = None
+    while True:
+        start, until = session[0], session[1]
+        if not start or start == seen or until <= time.time():
+            _wait()
+            continue
+
+        seen = start
+        try:
+            sampler = Sampler(name)
+            sampler.run(lambda: session[1])
+            _save(_session_id(start), sampler)
+        except:
+            log.exception('Profiling failed')
+
+
+def _path(id, pid='*'):
+    return os.path.join(Config.profile_dir(),
+                        'profile-{0}-{1}.txt'.format(id, pid))
+
+
+def _save(id, sampler):
+    directory = Config.profile_dir()
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+
+    path = _path(id, os.getpid())
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(sampler.collapsed())
+    os.rename(tmp, path)
+    log.info('Wrote %s samples to %s', sampler.samples, path)
+
+
+def _prune(id):
+    sessions = set()
+    for path in glob.glob(_path('*')):
+        sessions.add(os.path.basename(path).split('-')[1])
+    sessions.discard(id)
+    for old in sorted(sessions, key=int)[:-KEEP_SESSIONS + 1]:
+        for path in glob.glob(_path(old)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def files(id):
+    return sorted(glob.glob(_path(id)))
+
+
+def collect(id):
+    '''The collapsed stacks every process wrote for a session'''
+    lines = []
+    for path in files(id):
+        with open(path) as f:
+            lines.extend(line for line in f.read().splitlines() if line)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _frames(frame):
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append('{0} ({1}:{2})'.format(
+            code.co_name, os.path.basename(code.co_filename),
+            code.co_firstlineno))
+        frame = frame.f_back
+    if frame is not None:
+        names.append('...')
+    names.reverse()
+    return names
+
+
+def _greenthreads():
+    if not Config.is_eventlet():
+        return []
+    from cattle.concurrency import pool
+    return list(pool.coroutines_running)
+
+
+class Sampler(object):
+    def __init__(self, name, interval=None):
+        self.name = name
+        self.interval = Config.profile_interval() if interval is None \
+            else interval
+        self.stacks = {}
+        self.samples = 0
+
+    def _add(self, root, frame):
+        key = ';'.join(root + _frames(frame))
+        if key not in self.stacks and len(self.stacks) >= MAX_STACKS:
+            key = ';'.join(root + ['[truncated]'])
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def sample(self):
+        me = _threading.current_thread().ident
+        names = dict((t.ident, t.name) for t in _threading.enumerate())
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                self._add([self.name, names.get(ident, str(ident))], frame)
+
+        for greenthread in _greenthreads():
+            # None for the running one, which its thread's frame covers
+            frame = greenthread.gr_frame
+            if frame is not None:
+                self._add([self.name, 'greenthread'], frame)
+
+        self.samples += 1
+
+    def run(self, until):
+        '''Sample until the time returned by until()'''
+        while time.time() < until():
+            start = time.time()
+            self.sample()
+            cost = time.time() - start
+            _sleep(max(self.interval, cost / MAX_OVERHEAD - cost))
+
+    def collapsed(self):
+        return ''.join('{0} {1}\n'.format(k, v)
+                       for k, v in sorted(self.stacks.iteritems()))
+
+
+def _on_signal(signum, frame):
+    try:
+        request(Config.profile_duration())
+    except:
+        log.exception('Failed to start profiling')
+
+
+def install_signal():
+    '''Start a session of Config.profile_duration() on the signal'''
+    name = Config.profile_signal()
+    if not name:
+        return
+
+    signum = getattr(signal, name)
+    signal.signal(signum, _on_signal)
+    signal.siginterrupt(signum, False)
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger('startup-profile')
+
+# Timing records for main.py --profile-startup.  Everything here is a no-op
+# until enable() is called so the hooks can stay in place on the normal
+# startup path.
+_PROFILE = {
+    'enabled': False,
+    'path': None,
+    'start': None,
+    'records': [],
+    'imports': [],
+}
+
+
+def enable(path, start=None):
+    if start is None:
+        start = time.time()
+    _PROFILE['enabled'] = True
+    _PROFILE['path'] = path
+    _PROFILE['start'] = start
+
+
+def enabled():
+    return _PROFILE['enabled']
+
+
+def record(kind, name, start, duration):
+    if not _PROFILE['enabled']:
+        return
+
+    _PROFILE['records'].append({
+        'kind': kind,
+        'name': name,
+        'start': round(start - _PROFILE['start'], 6),
+        'duration': round(duration, 6),
+    })
+
+
+@contextmanager
+def timed(kind, name):
+    if not _PROFILE['enabled']:
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(kind, name, start, time.time() - start)
+
+
+def set_imports(imports):
+    _PROFILE['imports'] = imports
+
+
+def report():
+    timings = {}
+    for record in sorted(_PROFILE['records'], key=lambda x: x['start']):
+        timings.setdefault(record['kind'], []).append({
+            'name': record['name'],
+            'start': record['start'],
+            'duration': record['duration'],
+        })
+
+    return {
+        'pid': os.getpid(),
+        'start': _PROFILE['start'],
+        'elapsed': round(time.time() - _PROFILE['start'], 6),
+        'timings': timings,
+        'imports': sorted(_PROFILE['imports'],
+                          key=lambda x: x['duration'], reverse=True),
+    }
+
+
+def write():
+    if not _PROFILE['enabled']:
+        return
+
+    path = _PROFILE['path']
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(report(), f, indent=2, sort_keys=True)
+        os.rename(tmp, path)
+        log.info('Wrote startup profile to %s', path)
+    except (IOError, OSError):
+        log.exception('Failed to write startup profile to %s', path)
+
+
+def finish():
+    '''
+    Write the final report and stop recording, so later process restarts
+    and reconnects don't grow the records.
+    '''
+    write()
+    _PROFILE['enabled'] = False
@@ -0,0 +1,162 @@
+'''
+Where an event's time goes between the websocket and its reply.
+
+The worker begins a Trace when it takes an event off the queue and ends
+it once the reply is published.  Code in between adds to the stages of
+the current trace, kept per thread (per greenlet with eventlet):
+
+    queue    parsed until a worker took it
+    parse    unmarshalling the JSON, on the websocket reader
+    handler  agent.execute, which includes the stages below
+    lock     waiting on resource locks
+    docker   Docker API calls
+    publish  posting replies and progress
+    total    received until done
+
+Finished traces are observed into the cattle_event_stage_seconds
+histogram per event name and stage, and written as JSON lines to
+Config.trace_file() when set.  Config.trace_sample() and
+Config.trace_ping_sample() pick the fraction of events that are traced
+so pings don't flood either.
+'''
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from cattle import Config
+from cattle import metrics
+
+log = logging.getLogger('trace')
+
+STAGES = ('queue', 'parse', 'handler', 'lock', 'docker', 'publish', 'total')
+
+OTHER = 'other'
+
+_local = threading.local()
+_events = set()
+_duration = None
+_out = {'key': None, 'fd': None}
+_out_lock = threading.Lock()
+
+
+def init(events):
+    '''
+    Create the stage histogram for the subscribed event names, before
+    workers fork so it is shared with them.
+    '''
+    global _duration
+
+    _events.update(e.split(';', 1)[0] for e in events)
+    _events.update(['ping', OTHER])
+    values = [(e, s) for e in sorted(_events) for s in STAGES]
+    _duration = metrics.histogram('cattle_event_stage_seconds',
+                                  'Time events spend in each stage',
+                                  ('event', 'stage'), values)
+
+
+class Trace(object):
+    def __init__(self, received=None):
+        self.start = time.time() if received is None else received
+        self.id = None
+        self.name = None
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def event(self):
+        if self.name is None:
+            return OTHER
+        name = self.name.split(';', 1)[0]
+        return name if name in _events else OTHER
+
+    def sampled(self):
+        if self.event() == 'ping':
+            rate = Config.trace_ping_sample()
+        else:
+            rate = Config.trace_sample()
+        return rate >= 1 or random.random() < rate
+
+    def finish(self):
+        self.stages['total'] = time.time() - self.start
+        if not self.sampled():
+            return
+
+        event = self.event()
+        if _duration is not None:
+            for stage, seconds in self.stages.iteritems():
+                _duration.observe(seconds, label=(event, stage))
+
+        if Config.trace_file():
+            _write(self.record())
+
+    def record(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'time': self.start,
+            'stages': dict((k, round(v, 6))
+                           for k, v in self.stages.iteritems()),
+        }
+
+
+def _write(record):
+    # One O_APPEND write per line keeps lines from different workers whole
+    key = (os.getpid(), Config.trace_file())
+    with _out_lock:
+        if _out['key'] != key:
+            if _out['fd'] is not None and _out['key'][0] == key[0]:
+                os.close(_out['fd'])
+            _out['fd'] = os.open(key[1],
+                                 os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+            _out['key'] = key
+        fd = _out['fd']
+    try:
+        os.write(fd, json.dumps(record) + '\n')
+    except OSError:
+        log.exception('Failed to write trace')
+
+
+def begin(received=None):
+    t = _local.trace = Trace(received)
+    return t
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+def end():
+    t = current()
+    if t is None:
+        return
+    _local.trace = None
+    try:
+        t.finish()
+    except:
+        log.exception('Failed to finish trace')
+
+
+def add(stage, seconds):
+    t = current()
+    if t is not None:
+        t.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    t = current()
+    if t is None:
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        t.add(stage, time.time() - start)
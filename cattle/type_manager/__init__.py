@@ -15,6 +15,10 @@ REQUEST_HANDLER = 'request_handler'
 POST_REQUEST_HANDLER = 'post_request_handler'
 LIFECYCLE = 'lifecycle'
 
+# Bumped on every registration so consumers that precompute tables from
+# the registry (the event router) know when to rebuild them.
+_GENERATION = [0]
+
 
 def types():
     seen = set()
@@ -31,13 +35,19 @@ def register_type(type_name, impl):
         types = TYPES[type_name]
         for i in range(len(types)):
             if priority < _get_priority(types[i]):
-                types.insert(i, types)
+                types.insert(i, impl)
                 break
         else:
             types.append(impl)
     except KeyError:
         TYPES[type_name] = [impl]
 
+    _GENERATION[0] += 1
+
+
+def generation():
+    return _GENERATION[0]
+
 
 def _get_priority(impl):
     try:
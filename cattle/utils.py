@@ -1,7 +1,6 @@
 from tempfile import NamedTemporaryFile
 from os import path
 from urlparse import urlparse
-from contextlib import closing
 
 import binascii
 import calendar
@@ -12,8 +11,8 @@ import subprocess
 import time
 import uuid
 import json
-import urllib2
-import arrow
+import requests
+from threading import Lock
 
 
 try:
@@ -29,6 +28,11 @@ log = logging.getLogger('cattle')
 _TEMP_NAME = 'work'
 _TEMP_PREFIX = 'cattle-temp-'
 
+# Event classes, see classify()
+PING = 'ping'
+WORK = 'work'
+_KIND = '_kind'
+
 
 def _to_json_object(v):
     if isinstance(v, dict):
@@ -73,22 +77,71 @@ class JsonObject:
         if isinstance(json_object, JsonObject):
             ret = {}
             for k, v in json_object.__dict__.items():
-                ret[k] = JsonObject.unwrap(v)
+                if k != _KIND:
+                    ret[k] = JsonObject.unwrap(v)
             return ret
 
         return json_object
 
 
+# Keeps connections to cAdvisor alive between pings.  The collectors of a
+# ping each run on a new thread, so the threads of a process share one
+# session, used under its lock as a Session isn't safe to use from several
+# at once.  Workers forked from this process create their own, with a lock
+# no thread of the parent can be holding.
+_CADVISOR = {'pid': None, 'session': None, 'lock': None}
+
+
+def _cadvisor_session():
+    '''The session of this process and the lock to use it under'''
+    global _CADVISOR
+    state = _CADVISOR
+    if state['pid'] != os.getpid():
+        # Threads racing here each make one, the last is kept
+        state = {'pid': os.getpid(), 'session': requests.Session(),
+                 'lock': Lock()}
+        _CADVISOR = state
+    return state['session'], state['lock']
+
+
 class CadvisorAPIClient(object):
-    def __init__(self, host, port, version='v1.2', proto='http://'):
+    def __init__(self, host, port, version='v1.3', proto='http://',
+                 num_stats=None):
         self.url = '{0}{1}:{2}/api/{3}'.format(proto, host, str(port), version)
+        self.num_stats = num_stats
+        self._cycle = None
+        self._snapshot = None
+        self._snapshot_cycle = None
+        self._lock = Lock()
+
+    def new_cycle(self):
+        '''
+        Start a collection cycle.  Until the next one /containers is fetched
+        at most once and shared by every caller, including collectors on
+        other threads.
+        '''
+        with self._lock:
+            self._cycle = (self._cycle or 0) + 1
 
     def get_containers(self):
-        return self._get(self.url + '/containers')
+        with self._lock:
+            if self._cycle is not None and \
+                    self._snapshot_cycle == self._cycle:
+                return self._snapshot
+
+            body = None
+            if self.num_stats:
+                body = {'num_stats': self.num_stats}
+            data = self._get(self.url + '/containers', body)
+
+            if self._cycle is not None:
+                self._snapshot = data
+                self._snapshot_cycle = self._cycle
+            return data
 
     def get_latest_stat(self):
         containers = self.get_stats()
-        if len(containers) > 1:
+        if len(containers) > 0:
             return containers[-1]
         return {}
 
@@ -105,28 +158,36 @@ class CadvisorAPIClient(object):
         return {}
 
     def timestamp_diff(self, time_current, time_prev):
-        time_current_conv = self._timestamp_convert(time_current)
-        time_prev_conv = self._timestamp_convert(time_prev)
-
-        diff = (time_current_conv - time_prev_conv).total_seconds()
-        return round((diff * 10**9))
-
-    def _timestamp_convert(self, stime):
-        # Cadvisor handles everything in nanoseconds.
-        # Python does not.
-        t_conv = arrow.get(stime[0:26])
-        return t_conv
-
-    def _marshall_to_python(self, data):
-        if isinstance(data, str):
-            return json.loads(data)
-
-    def _get(self, url):
+        return float(parse_timestamp(time_current) -
+                     parse_timestamp(time_prev))
+
+    def get_container_counters(self):
+        '''
+        Usage counters of every docker container from one /subcontainers
+        call, as {docker id: [older, latest]}.
+        '''
+        data = self._get(self.url + '/subcontainers/docker', {'num_stats': 2})
+        counters = {}
+        for container in data or []:
+            name = container.get('name', '')
+            if name == '/docker' or not container.get('stats'):
+                continue
+            docker_id = name.rsplit('/', 1)[-1]
+            counters[docker_id] = [_container_counters(s)
+                                   for s in container['stats']]
+        return counters
+
+    def _get(self, url, body=None):
         try:
-            with closing(urllib2.urlopen(url, timeout=5)) as resp:
-                if resp.code == 200:
-                    data = resp.read()
-                    return self._marshall_to_python(data)
+            session, lock = _cadvisor_session()
+            with lock:
+                if body is None:
+                    resp = session.get(url, timeout=5)
+                else:
+                    resp = session.post(url, data=json.dumps(body),
+                                        timeout=5)
+            if resp.status_code == 200:
+                return resp.json()
         except:
             log.exception(
                 "Could not get stats from cAdvisor at: {0}".format(url))
@@ -134,6 +195,66 @@ class CadvisorAPIClient(object):
         return None
 
 
+def _container_counters(stat):
+    network = stat.get('network') or {}
+    read = write = None
+    for device in (stat.get('diskio') or {}).get('io_service_bytes') or []:
+        read = (read or 0) + device['stats'].get('Read', 0)
+        write = (write or 0) + device['stats'].get('Write', 0)
+
+    return {
+        'timestamp': parse_timestamp(stat['timestamp']),
+        'cpu': stat.get('cpu', {}).get('usage', {}).get('total'),
+        'memory': stat.get('memory', {}).get('usage'),
+        'rxBytes': network.get('rx_bytes'),
+        'txBytes': network.get('tx_bytes'),
+        'readBytes': read,
+        'writeBytes': write,
+    }
+
+
+def _days_from_civil(year, month, day):
+    # Days since 1970-01-01 in the proleptic Gregorian calendar, from
+    # http://howardhinnant.github.io/date_algorithms.html
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def parse_timestamp(stime):
+    '''
+    Parse an RFC3339 timestamp as cAdvisor (Go's RFC3339Nano) writes it,
+    e.g. 2015-09-11T23:24:17.465693131Z or ...17.4656-07:00, into integer
+    nanoseconds since the epoch.  The layout is fixed up to the seconds,
+    followed by an optional fraction of up to 9 digits and the zone.
+    '''
+    end = len(stime)
+    offset = 0
+    if stime[-1] in 'Zz':
+        end -= 1
+    elif stime[-6] in '+-':
+        offset = int(stime[-5:-3]) * 3600 + int(stime[-2:]) * 60
+        if stime[-6] == '-':
+            offset = -offset
+        end -= 6
+
+    seconds = _days_from_civil(int(stime[0:4]), int(stime[5:7]),
+                               int(stime[8:10])) * 86400 + \
+        int(stime[11:13]) * 3600 + int(stime[14:16]) * 60 + \
+        int(stime[17:19]) - offset
+
+    nanos = 0
+    if end > 20 and stime[19] == '.':
+        frac = stime[20:end]
+        nanos = int(frac) * 10 ** (9 - len(frac))
+
+    return seconds * 1000000000 + nanos
+
+
 def ping_include_resources(ping):
     try:
         return ping.data.options['resources']
@@ -155,6 +276,27 @@ def ping_include_instances(ping):
         return False
 
 
+def ping_include_container_stats(ping):
+    try:
+        return ping.data.options['containerStats']
+    except (KeyError, AttributeError):
+        return False
+
+
+def ping_include_docker_stats(ping):
+    try:
+        return ping.data.options['dockerStats']
+    except (KeyError, AttributeError):
+        return False
+
+
+def ping_include_host_metrics(ping):
+    try:
+        return ping.data.options['hostMetrics']
+    except (KeyError, AttributeError):
+        return False
+
+
 def ping_add_resources(pong, *args):
     if 'resources' not in pong.data:
         pong.data.resources = []
@@ -196,7 +338,7 @@ def reply(event, data=None, parent=None):
 
 
 def _reply_obj(event, data):
-    return JsonObject({
+    obj = JsonObject({
         'id': str(uuid.uuid4()),
         'name': event.replyTo,
         'data': data,
@@ -206,6 +348,8 @@ def _reply_obj(event, data):
         'previousNames': [event.name],
         'time': calendar.timegm(time.gmtime()) * 1000,
     })
+    obj.__dict__[_KIND] = classify(event)
+    return obj
 
 
 def get_data(obj, prefix=None, strip_prefix=True):
@@ -398,33 +542,50 @@ def get_or_create_list(container, key):
     return value
 
 
-def log_request(req, log, *args):
-    debug = False
-    try:
-        if 'ping' in req.name:
-            debug = True
-    except:
-        pass
+def _base_name(name):
+    if isinstance(name, basestring):
+        return name.split(';', 1)[0]
+    return None
 
-    try:
-        if 'ping' in req.data.event.name:
-            debug = True
-    except:
-        pass
 
-    try:
-        if 'ping' in req.previousNames[0]:
-            debug = True
-    except:
-        pass
+def _first_name(names):
+    if isinstance(names, list) and len(names) > 0:
+        return names[0]
+    return None
 
-    try:
-        if 'ping' in req.data.previousNames[0]:
-            debug = True
-    except:
-        pass
 
-    if debug:
+def classify(event):
+    '''
+    PING for a ping event, an event wrapping one or a reply to one, WORK
+    for anything else.  Worked out once and kept on the event, which
+    the marshaller does as it parses, and replies take it from their
+    event.  Not included in the JSON.
+    '''
+    if not isinstance(event, JsonObject):
+        return WORK
+
+    fields = event.__dict__
+    kind = fields.get(_KIND)
+    if kind is not None:
+        return kind
+
+    names = [fields.get('name'), _first_name(fields.get('previousNames'))]
+    data = fields.get('data')
+    if isinstance(data, JsonObject):
+        inner = data.__dict__.get('event')
+        if isinstance(inner, JsonObject):
+            names.append(inner.__dict__.get('name'))
+        names.append(_first_name(data.__dict__.get('previousNames')))
+
+    kind = WORK
+    if any(_base_name(name) == 'ping' for name in names):
+        kind = PING
+    fields[_KIND] = kind
+    return kind
+
+
+def log_request(req, log, *args):
+    if classify(req) == PING:
         log.debug(*args)
     else:
         log.info(*args)
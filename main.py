@@ -1,7 +1,60 @@
 #!/usr/bin/env python
 
+import __builtin__
 import sys
 import os
+import threading
+import time
+
+
+class _ImportTimer(object):
+    '''
+    Wraps __import__ to record how long each import that actually loads new
+    modules takes, both cumulative and excluding nested imports.  Only
+    installed for --profile-startup.
+    '''
+
+    def __init__(self):
+        self.start = time.time()
+        self.imports = []
+        self._import = __builtin__.__import__
+        self._local = threading.local()
+
+    def install(self):
+        __builtin__.__import__ = self._timed_import
+
+    def uninstall(self):
+        __builtin__.__import__ = self._import
+
+    def _timed_import(self, name, *args, **kw):
+        try:
+            stack = self._local.stack
+        except AttributeError:
+            stack = self._local.stack = [0.0]
+
+        loaded = len(sys.modules)
+        stack.append(0.0)
+        start = time.time()
+        try:
+            return self._import(name, *args, **kw)
+        finally:
+            duration = time.time() - start
+            nested = stack.pop()
+            stack[-1] += duration
+
+            if len(sys.modules) > loaded:
+                importer = args[0] if len(args) else kw.get('globals')
+                if importer:
+                    importer = importer.get('__name__')
+                self.imports.append({
+                    'name': name,
+                    'importer': importer,
+                    'duration': round(duration, 6),
+                    'self': round(duration - nested, 6),
+                })
+
+
+_IMPORT_TIMER = None
 
 # Cattle imports should go after this.
 if __name__ == '__main__':
@@ -9,16 +62,23 @@ if __name__ == '__main__':
     if os.path.exists(dist):
         sys.path.insert(0, dist)
 
+    for arg in sys.argv[1:]:
+        if arg == '--profile-startup' or arg.startswith('--profile-startup='):
+            _IMPORT_TIMER = _ImportTimer()
+            _IMPORT_TIMER.install()
+
 from cattle import concurrency  # NOQA
 
+import atexit
 import logging
 from logging.handlers import RotatingFileHandler
+from threading import Thread
 import argparse
 
 _LOG_SIZE = 20971520
 _LOG_COUNT = 2
 
-from cattle import plugins, Config, process_manager
+from cattle import plugins, Config, logs, process_manager, startup_profile
 from cattle.agent.event import EventClient
 from cattle.type_manager import types, get_type_list, LIFECYCLE
 
@@ -36,13 +96,19 @@ def _setup_logger():
 
     file_handler = RotatingFileHandler(Config.log(), maxBytes=_LOG_SIZE,
                                        backupCount=_LOG_COUNT)
-    file_handler.setFormatter(logging.Formatter(format))
+    if Config.log_format() == 'json':
+        file_handler.setFormatter(logs.JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(format))
+    # Workers only queue records, a writer thread does the file I/O
+    queue_handler = logs.QueueHandler([file_handler])
+    atexit.register(queue_handler.close)
 
     std_err_handler = logging.StreamHandler(sys.stderr)
     std_err_handler.setFormatter(logging.Formatter(format))
     std_err_handler.setLevel(logging.WARN)
 
-    logging.root.addHandler(file_handler)
+    logging.root.addHandler(queue_handler)
     logging.root.addHandler(std_err_handler)
 
 
@@ -56,6 +122,53 @@ def _gather_events():
     return events
 
 
+def _timed(phase, method, *args, **kw):
+    kind = kw.get('kind', 'phase')
+    start = time.time()
+    try:
+        return method(*args)
+    finally:
+        duration = time.time() - start
+        startup_profile.record(kind, phase, start, duration)
+        log.info('Startup %s [%s] took [%.3f] seconds', kind, phase,
+                 duration)
+
+
+def _startup(lifecycles):
+    # The on_startup hooks don't depend on each other and mostly wait on
+    # docker or process launches, so run them side by side.
+    errors = []
+
+    def start(lifecycle):
+        try:
+            _timed(type(lifecycle).__name__, lifecycle.on_startup,
+                   kind='lifecycle')
+        except Exception as e:
+            log.exception('Failed to start %s', lifecycle)
+            errors.append(e)
+
+    threads = []
+    for lifecycle in lifecycles:
+        t = Thread(target=start, args=(lifecycle,))
+        t.setDaemon(True)
+        t.start()
+        threads.append(t)
+
+    for t in threads:
+        t.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+
+def _enable_profile(path):
+    start = time.time()
+    if _IMPORT_TIMER is not None:
+        start = _IMPORT_TIMER.start
+    startup_profile.enable(path, start=start)
+    startup_profile.record('phase', 'imports', start, time.time() - start)
+
+
 def _args():
     parser = argparse.ArgumentParser(add_help=True)
 
@@ -68,6 +181,11 @@ def _args():
     parser.add_argument("--workers", default=Config.workers(),
                         help='Default value from CATTLE_WORKERS')
     parser.add_argument("--agent-id")
+    parser.add_argument("--profile-startup", nargs='?', metavar='FILE',
+                        const=os.path.join(Config.home(),
+                                           'startup-profile.json'),
+                        help='Write a JSON report of startup timings to '
+                             'FILE before subscribing')
 
     return parser.parse_args()
 
@@ -80,15 +198,18 @@ def main():
 
     args = _args()
 
+    if args.profile_startup:
+        _enable_profile(args.profile_startup)
+
     Config.set_access_key(args.access_key)
     Config.set_secret_key(args.secret_key)
     Config.set_api_url(args.url)
 
     Config.physical_host_uuid(force_write=True)
 
-    process_manager.init()
+    _timed('process_manager', process_manager.init)
 
-    plugins.load()
+    _timed('plugins', plugins.load)
 
     log.info('API URL %s', Config.api_url())
 
@@ -98,8 +219,12 @@ def main():
 
     log.info("Subscribing to %s", events)
 
-    for startup in get_type_list(LIFECYCLE):
-        startup.on_startup()
+    _timed('startup', _startup, get_type_list(LIFECYCLE))
+
+    if _IMPORT_TIMER is not None:
+        _IMPORT_TIMER.uninstall()
+        startup_profile.set_imports(_IMPORT_TIMER.imports)
+    startup_profile.write()
 
     client.run(events)
     sys.exit(0)
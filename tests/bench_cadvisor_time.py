@@ -0,0 +1,46 @@
+#!/usr/bin/env python2
+#
+# Compare parse_timestamp with the arrow based parsing timestamp_diff used
+# before.  arrow is no longer an agent dependency, install it to compare.
+# Run with: python -m tests.bench_cadvisor_time
+
+import timeit
+
+from cattle.utils import parse_timestamp
+
+_TIMESTAMPS = ['2015-09-11T23:24:17.465693131Z',
+               '2015-09-11T23:24:18.46581Z',
+               '2015-02-04T23:21:38.251266323-07:00']
+
+
+def _arrow_diff(arrow, current, prev):
+    diff = (arrow.get(current[0:26]) - arrow.get(prev[0:26])).total_seconds()
+    return round(diff * 10**9)
+
+
+def _native_diff(current, prev):
+    return float(parse_timestamp(current) - parse_timestamp(prev))
+
+
+def main():
+    funcs = [('parse_timestamp', _native_diff)]
+    try:
+        import arrow
+        funcs.insert(0, ('arrow', lambda c, p: _arrow_diff(arrow, c, p)))
+    except ImportError:
+        print 'arrow is not installed, only timing parse_timestamp'
+
+    pairs = zip(_TIMESTAMPS, _TIMESTAMPS[1:] + _TIMESTAMPS[:1])
+
+    for name, diff in funcs:
+        def run():
+            for current, prev in pairs:
+                diff(current, prev)
+
+        best = min(timeit.repeat(run, number=2000, repeat=5))
+        print '{0:>16}: {1:.2f} us/diff'.format(
+            name, best / (2000 * len(pairs)) * 10**6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python2
+#
+# Compare the precomputed dispatch table against the old linear scan of
+# every registered handler.  Run with: python -m tests.bench_event_router
+
+import timeit
+
+from cattle import type_manager
+from cattle.agent.handler import BaseHandler
+from cattle.plugins.core.event_router import Router
+from cattle.utils import JsonObject
+
+
+class _Driver(BaseHandler):
+    def __init__(self, category, kind):
+        super(_Driver, self).__init__()
+        self.category = category
+        self.kind = kind
+
+    def _get_handler_category(self, req):
+        return self.category
+
+    def _check_supports(self, req):
+        return req.data.kind == self.kind
+
+    def _do_instance_activate(self):
+        pass
+
+    def _do_volume_activate(self):
+        pass
+
+    def instance_activate(self, req=None, **kw):
+        return self.kind
+
+    def volume_activate(self, req=None, **kw):
+        return self.kind
+
+
+class _Post(object):
+    def __init__(self, name):
+        self.name = name
+
+    def events(self):
+        return [self.name]
+
+    def execute(self, req):
+        if req.name.split(';', 1)[0] == self.name:
+            return self.name
+
+
+def _legacy_handlers(req):
+    get_type_list = type_manager.get_type_list
+    for pre in get_type_list(type_manager.PRE_REQUEST_HANDLER):
+        yield pre
+
+    drivers = []
+    if req.name.startswith("storage."):
+        drivers = list(get_type_list(type_manager.STORAGE_DRIVER))
+
+    if req.name.startswith("compute."):
+        drivers = list(get_type_list(type_manager.COMPUTE_DRIVER))
+
+    drivers.extend(get_type_list(type_manager.REQUEST_HANDLER))
+
+    for driver in drivers:
+        if driver.supports(req):
+            yield driver
+
+    for post in get_type_list(type_manager.POST_REQUEST_HANDLER):
+        yield post
+
+
+def _legacy_route(req):
+    for handler in _legacy_handlers(req):
+        resp = handler.execute(req)
+        if resp is not None:
+            return resp
+
+
+def _events():
+    events = []
+    for i in range(80):
+        events.append(JsonObject({'name': 'ping;agent=42',
+                                  'data': {'kind': 'docker'}}))
+    for i in range(15):
+        events.append(JsonObject({'name': 'compute.instance.activate;agent=42',
+                                  'data': {'kind': 'docker'}}))
+    for i in range(5):
+        events.append(JsonObject({'name': 'storage.volume.activate;agent=42',
+                                  'data': {'kind': 'docker'}}))
+    return events
+
+
+def main():
+    type_manager.TYPES.clear()
+    for kind in ['kvm', 'lxc', 'docker']:
+        type_manager.register_type(type_manager.COMPUTE_DRIVER,
+                                   _Driver('compute', kind))
+        type_manager.register_type(type_manager.STORAGE_DRIVER,
+                                   _Driver('storage', kind))
+    for name in ['config.update', 'ping']:
+        type_manager.register_type(type_manager.POST_REQUEST_HANDLER,
+                                   _Post(name))
+
+    events = _events()
+    router = Router()
+
+    def legacy():
+        for req in events:
+            _legacy_route(req)
+
+    def table():
+        for req in events:
+            router.route(req)
+
+    for name, func in [('linear scan', legacy), ('dispatch table', table)]:
+        best = min(timeit.repeat(func, number=100, repeat=5))
+        print '{0:>16}: {1:.2f} us/event'.format(
+            name, best / (100 * len(events)) * 10**6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python2
+#
+# Compare the procfs parsers with the readlines based parsing the memory
+# and CPU collectors used before, on the tests/host_info fixtures with
+# cpuinfo scaled up to many cores.
+# Run with: python -m tests.bench_proc_parsers
+
+import os
+import re
+import tempfile
+import timeit
+
+import tests
+from cattle.plugins.host_info import procfs
+from cattle.plugins.host_info.memory import MemoryCollector
+
+_FIXTURES = os.path.join(os.path.dirname(tests.__file__), 'host_info')
+_CORES = 128
+
+
+def _readlines_meminfo(path, key_map):
+    with open(path) as f:
+        lines = f.readlines()
+
+    data = {}
+    for line in lines:
+        line_list = line.split(':')
+        key_lower = line_list[0].lower()
+        possible_mem_value = line_list[1].strip().split(' ')[0]
+        if key_map.get(key_lower):
+            data[key_map[key_lower]] = round(
+                float(possible_mem_value) / 1024.0, 3)
+    return data
+
+
+def _readlines_cpuinfo(path):
+    with open(path) as f:
+        lines = f.readlines()
+
+    data = {}
+    procs = []
+    for line in lines:
+        split_line = line.split(':')
+        if split_line[0].strip() == "model name":
+            procs.append(split_line[1].strip())
+            freq = re.search(r'([0-9\.]+)\s?GHz', split_line[1])
+            if freq:
+                data['mhz'] = float(freq.group(1)) * 1000
+
+        if 'mhz' not in data:
+            if split_line[0].strip() == "cpu MHz":
+                data['mhz'] = float(split_line[1].strip())
+
+    data['modelName'] = procs[0]
+    data['count'] = len(procs)
+    return data
+
+
+def _write(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def _time(name, run):
+    best = min(timeit.repeat(run, number=1000, repeat=5))
+    print '{0:>24}: {1:.2f} us/parse'.format(name, best / 1000 * 10**6)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(_FIXTURES, 'cpuinfo')) as f:
+        cpuinfo = f.read()
+    with open(os.path.join(_FIXTURES, 'meminfo')) as f:
+        meminfo = f.read()
+
+    # The fixture has 4 cores
+    cpuinfo_path = _write(directory, 'cpuinfo', cpuinfo * (_CORES / 4))
+    meminfo_path = _write(directory, 'meminfo', meminfo)
+
+    key_map = MemoryCollector().key_map
+    lower_map = dict((k.lower(), v) for k, v in key_map.iteritems())
+
+    print 'cpuinfo, {0} cores'.format(_CORES)
+    _time('readlines', lambda: _readlines_cpuinfo(cpuinfo_path))
+    _time('procfs', lambda: procfs.cpuinfo(procfs.read(cpuinfo_path)))
+
+    print 'meminfo'
+    _time('readlines', lambda: _readlines_meminfo(meminfo_path, lower_map))
+    _time('procfs', lambda: procfs.meminfo(procfs.read(meminfo_path),
+                                           key_map))
+
+    os.remove(cpuinfo_path)
+    os.remove(meminfo_path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
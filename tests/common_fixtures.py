@@ -1,6 +1,7 @@
 import os
 import random
 import sys
+import time
 import tests
 import shutil
 import pytest
@@ -38,3 +39,12 @@ def random_str():
 
 def random_num():
     return random.randint(0, 1000000)
+
+
+def wait_for(func, timeout=5):
+    end = time.time() + timeout
+    while time.time() < end:
+        if func():
+            return True
+        time.sleep(0.05)
+    return False
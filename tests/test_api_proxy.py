@@ -0,0 +1,115 @@
+import socket
+from threading import Thread
+
+import pytest
+
+from cattle import metrics
+from cattle.plugins.core import api_proxy
+from cattle.plugins.core.api_proxy import TcpProxy
+from .common_fixtures import wait_for
+
+
+class EchoServer(object):
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        t = Thread(target=self._run)
+        t.setDaemon(True)
+        t.start()
+
+    def _run(self):
+        while True:
+            conn, _ = self.sock.accept()
+            t = Thread(target=self._echo, args=(conn,))
+            t.setDaemon(True)
+            t.start()
+
+    def _echo(self, conn):
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                break
+            conn.sendall(data)
+        conn.close()
+
+
+@pytest.fixture(scope='module')
+def echo():
+    return EchoServer()
+
+
+@pytest.fixture(params=['epoll', 'select'])
+def proxy(request, echo, mocker):
+    if request.param == 'select':
+        mocker.patch.object(api_proxy, '_poller',
+                            api_proxy._SelectPoller)
+    p = TcpProxy('127.0.0.1', 0, '127.0.0.1', echo.port).start()
+    assert wait_for(lambda: p.address is not None)
+    yield p
+    p.stop()
+
+
+def _recv_all(sock):
+    data = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return ''.join(data)
+        data.append(chunk)
+
+
+def test_proxy_echo(proxy):
+    connections = api_proxy.CONNECTIONS.get()
+    active = api_proxy.ACTIVE.get()
+    to_client = api_proxy.BYTES.get(label='client')
+    client = socket.create_connection(proxy.address)
+    client.sendall('hello')
+    assert client.recv(5) == 'hello'
+
+    client.shutdown(socket.SHUT_WR)
+    assert _recv_all(client) == ''
+    client.close()
+
+    assert wait_for(lambda: proxy.stats()['activeConnections'] == 0)
+    stats = proxy.stats()
+    assert stats['connections'] == 1
+    assert stats['bytesToServer'] == 5
+    assert stats['bytesToClient'] == 5
+
+    assert api_proxy.CONNECTIONS.get() == connections + 1
+    assert api_proxy.BYTES.get(label='client') == to_client + 5
+    assert api_proxy.ACTIVE.get() == active
+    assert 'cattle_api_proxy_bytes_total{direction="server"}' in \
+        metrics.render()
+
+
+def test_proxy_large_transfer(proxy):
+    payload = ''.join(chr(i % 256) for i in range(256)) * 16 * 1024
+    client = socket.create_connection(proxy.address)
+
+    # The client only reads once everything is sent, so the proxy has to
+    # stop reading from it while the echo side is backed up
+    received = []
+    reader = Thread(target=lambda: received.append(_recv_all(client)))
+    reader.start()
+    client.sendall(payload)
+    client.shutdown(socket.SHUT_WR)
+    reader.join(10)
+
+    assert received == [payload]
+    client.close()
+    assert wait_for(lambda: proxy.stats()['activeConnections'] == 0)
+
+
+def test_proxy_upstream_down(proxy):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    proxy.to_port = s.getsockname()[1]
+    s.close()
+
+    client = socket.create_connection(proxy.address)
+    assert _recv_all(client) == ''
+    assert wait_for(lambda: proxy.stats()['failedConnections'] == 1)
+    assert proxy.stats()['activeConnections'] == 0
@@ -1,4 +1,4 @@
-from cattle import default_value, Config
+from cattle import default_value, Config, CONFIG_OVERRIDE
 import uuid
 import os
 
@@ -30,3 +30,26 @@ def test_default_value():
     Config.set_secret_key('override')
     actual = default_value('SECRET_KEY', default)
     assert 'override' == actual
+
+
+def test_config_snapshot():
+    var_name = 'CATTLE_MAX_DROPPED_PING'
+    os.environ.pop(var_name, None)
+    Config.reload()
+    assert Config.max_dropped_ping() == 10
+
+    # Environment changes are only seen after a reload
+    os.environ[var_name] = '20'
+    assert Config.max_dropped_ping() == 10
+    Config.reload()
+    assert Config.max_dropped_ping() == 20
+
+    # Overrides apply immediately
+    CONFIG_OVERRIDE['MAX_DROPPED_PING'] = '30'
+    assert Config.max_dropped_ping() == 30
+    del CONFIG_OVERRIDE['MAX_DROPPED_PING']
+    assert Config.max_dropped_ping() == 20
+
+    del os.environ[var_name]
+    Config.reload()
+    assert Config.max_dropped_ping() == 10
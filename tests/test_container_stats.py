@@ -0,0 +1,96 @@
+from cattle.utils import CadvisorAPIClient
+from cattle.plugins.host_info.containers import ContainerStats, compact, top
+from cattle.plugins.host_info.native import NativeStatsClient
+
+ID1 = 'a' * 64
+ID2 = 'b' * 64
+
+
+def _counters(ts, cpu, rx=0):
+    return {'timestamp': ts * 10 ** 9, 'cpu': cpu, 'memory': 1024,
+            'rxBytes': rx, 'txBytes': None}
+
+
+def test_compact():
+    stats = compact(_counters(12, 3 * 10 ** 9, rx=500),
+                    _counters(10, 2 * 10 ** 9, rx=100))
+    assert stats == {'cpu': 3 * 10 ** 9, 'memory': 1024, 'rxBytes': 500,
+                     'cpuPercent': 50.0, 'rxRate': 200.0}
+
+    # A restarted container's counters went backwards
+    stats = compact(_counters(12, 10), _counters(10, 2 * 10 ** 9))
+    assert 'cpuPercent' not in stats
+
+
+def test_top():
+    stats = {'a': {'cpuPercent': 5}, 'b': {'cpuPercent': 50},
+             'c': {'memory': 10}}
+    assert top(stats, 2) == {'a': {'cpuPercent': 5}, 'b': {'cpuPercent': 50}}
+    assert top(stats, 5) == stats
+
+
+def test_rates_across_calls():
+    class Client(object):
+        def __init__(self):
+            self.samples = [_counters(10, 0), _counters(11, 10 ** 9)]
+
+        def get_container_counters(self):
+            return {ID1: [self.samples.pop(0)]}
+
+    stats = ContainerStats(Client())
+    assert 'cpuPercent' not in stats.get()[ID1]
+    assert stats.get()[ID1]['cpuPercent'] == 100.0
+
+
+def test_cadvisor_subcontainers(mocker):
+    client = CadvisorAPIClient('127.0.0.1', 9344)
+    stat = {
+        'timestamp': '2015-09-11T23:24:17Z',
+        'cpu': {'usage': {'total': 10}},
+        'memory': {'usage': 20},
+        'network': {'rx_bytes': 30, 'tx_bytes': 40},
+        'diskio': {'io_service_bytes': [
+            {'stats': {'Read': 1, 'Write': 2}},
+            {'stats': {'Read': 3, 'Write': 4}}]},
+    }
+    get = mocker.patch.object(client, '_get', return_value=[
+        {'name': '/docker', 'stats': [stat]},
+        {'name': '/docker/' + ID1, 'stats': [stat, stat]},
+    ])
+
+    counters = client.get_container_counters()
+    get.assert_called_once_with(client.url + '/subcontainers/docker',
+                                {'num_stats': 2})
+    assert counters.keys() == [ID1]
+    assert len(counters[ID1]) == 2
+    assert counters[ID1][1] == {
+        'timestamp': 1442013857 * 10 ** 9, 'cpu': 10, 'memory': 20,
+        'rxBytes': 30, 'txBytes': 40, 'readBytes': 4, 'writeBytes': 6}
+
+
+def test_native_cgroups(tmpdir):
+    cgroup = tmpdir.mkdir('cgroup')
+    cpu = cgroup.mkdir('cpu,cpuacct').mkdir('docker').mkdir(ID1)
+    cpu.join('cpuacct.usage').write('123\n')
+    cpu.join('cgroup.procs').write('42\n43\n')
+    systemd = cgroup.mkdir('memory').mkdir('system.slice')
+    systemd.mkdir('docker-{0}.scope'.format(ID1)) \
+        .join('memory.usage_in_bytes').write('456\n')
+    cgroup.mkdir('blkio').mkdir('docker').mkdir(ID1) \
+        .join('blkio.throttle.io_service_bytes') \
+        .write('8:0 Read 10\n8:0 Write 20\n8:16 Read 1\nTotal 31\n')
+
+    proc = tmpdir.mkdir('proc')
+    proc.mkdir('42').mkdir('net').join('dev').write(
+        'Inter-|   Receive\n'
+        ' face |bytes packets\n'
+        '    lo: 99 1 0 0 0 0 0 0 99 1 0 0 0 0 0 0\n'
+        '  eth0: 100 2 0 0 0 0 0 0 200 3 0 0 0 0 0 0\n')
+
+    client = NativeStatsClient(proc_root=str(proc), cgroup_root=str(cgroup))
+    counters = client.get_container_counters()[ID1]
+    assert len(counters) == 1
+    del counters[0]['timestamp']
+    assert counters[0] == {'cpu': 123, 'memory': 456, 'rxBytes': 100,
+                           'txBytes': 200, 'readBytes': 11,
+                           'writeBytes': 20}
@@ -0,0 +1,87 @@
+import os
+import platform
+
+import pytest
+
+from cattle import CONFIG_OVERRIDE
+from cattle.utils import JsonObject
+from cattle.plugins.host_info import disk_bench
+from cattle.plugins.host_info.disk_bench import DiskBenchmark, benchmark, \
+    write_results
+from cattle.plugins.host_info.iops import IopsCollector
+
+
+@pytest.fixture
+def state(tmpdir, mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {
+        'IOPS_STATE_DIR': str(tmpdir),
+        'DISK_BENCH_SIZE': '1',
+        'DISK_BENCH_DURATION': '0.05',
+    })
+    return tmpdir
+
+
+def test_benchmark(tmpdir):
+    path = str(tmpdir.join('scratch'))
+    results = benchmark(path, 1024 * 1024, 0.05, flags=0)
+    assert results['read'] > 0
+    assert results['write'] > 0
+    assert os.path.getsize(path) == 1024 * 1024
+
+
+def test_results_read_by_collector(tmpdir, mocker):
+    mocker.patch.object(platform, 'system', return_value='Linux')
+    write_results(str(tmpdir), 'sda', {'read': 100.5, 'write': 50})
+
+    collector = IopsCollector(str(tmpdir))
+    assert collector.get_data() == {'/dev/sda': {'read': 100.5,
+                                                 'write': 50}}
+    assert collector.get_default_disk() == '/dev/sda'
+    assert sorted(os.listdir(str(tmpdir))) == ['read.json', 'write.json']
+
+
+def test_run(state, mocker):
+    mocker.patch.object(disk_bench, 'device_name', return_value='sdb')
+    real = disk_bench.benchmark
+    mocker.patch.object(disk_bench, 'benchmark',
+                        side_effect=lambda *a: real(*a, flags=0))
+
+    results = DiskBenchmark().run()
+    assert results['device'] == '/dev/sdb'
+    assert results['read'] > 0
+    # The scratch and lock files are removed, the results stay
+    assert sorted(os.listdir(str(state))) == ['read.json', 'write.json']
+
+
+def test_not_a_block_device(state, mocker):
+    mocker.patch.object(disk_bench, 'device_name', return_value=None)
+    assert DiskBenchmark().run() == {}
+    assert not state.join('read.json').exists()
+
+
+def test_execute_only_its_event(state, mocker):
+    run = mocker.patch.object(DiskBenchmark, 'run', return_value={})
+    event = JsonObject({'id': 'id', 'name': 'ping', 'replyTo': 'reply',
+                        'resourceType': None, 'resourceId': None,
+                        'data': {}})
+    assert DiskBenchmark().execute(event) is None
+    assert not run.called
+
+    event.name = 'host.disk.benchmark;handler=agent'
+    assert DiskBenchmark().execute(event) is not None
+    assert run.called
+
+
+def test_startup_only_without_results(state, mocker):
+    thread = mocker.patch.object(disk_bench, 'Thread')
+    DiskBenchmark().on_startup()
+    assert not thread.called
+
+    mocker.patch.dict(CONFIG_OVERRIDE, {'DISK_BENCH_ON_STARTUP': 'true'})
+    write_results(str(state), 'sda', {'read': 1, 'write': 1})
+    DiskBenchmark().on_startup()
+    assert not thread.called
+
+    state.join('write.json').remove()
+    DiskBenchmark().on_startup()
+    assert thread.called
@@ -1519,6 +1519,21 @@ def test_ping_stat_exception(agent, responses, mocker):
                post_func=ping_post_process_state_exception)
 
 
+@if_docker
+def test_ping_malformed_container_stats(mocker):
+    compute = DockerCompute()
+    compute.host_info = mocker.Mock()
+    compute.host_info.container_stats.get.return_value = {'id1': {'cpu': 1}}
+    ping = JsonObject({'data': {'options': {'containerStats': 'many'}}})
+    pong = JsonObject({'data': {}})
+    containers = [{'dockerId': 'id1'}]
+
+    compute._add_container_stats(ping, pong, containers)
+    compute.host_info.container_stats.get.assert_called_once_with(
+        Config.container_stats_limit())
+    assert containers[0]['stats'] == {'cpu': 1}
+
+
 @if_docker
 def test_volume_purge(agent, responses):
     delete_container('/c861f990-4472-4fa1-960f-65171b544c28')
@@ -0,0 +1,176 @@
+import pytest
+
+from cattle import type_manager
+from cattle.agent.handler import BaseHandler, KindBasedMixin
+from cattle.plugins.core import event_router
+from cattle.plugins.core.event_router import Router, build_dispatch_table
+from cattle.utils import JsonObject
+
+
+class FakeDriver(BaseHandler):
+    def __init__(self, category, kind, priority=None):
+        super(FakeDriver, self).__init__()
+        self.category = category
+        self.kind = kind
+        if priority is not None:
+            self.priority = priority
+
+    def _get_handler_category(self, req):
+        return self.category
+
+    def _check_supports(self, req):
+        return req.data.kind == self.kind
+
+    def _do_instance_activate(self):
+        pass
+
+    def instance_activate(self, req=None, **kw):
+        return self.kind
+
+
+class KindDriver(KindBasedMixin, BaseHandler):
+    def __init__(self, kind):
+        KindBasedMixin.__init__(self, kind=kind)
+
+    def _get_handler_category(self, req):
+        return 'compute'
+
+    def instance_activate(self, req=None, **kw):
+        return self._kind
+
+
+class FakePost(object):
+    def __init__(self, name):
+        self.name = name
+
+    def events(self):
+        return [self.name]
+
+    def execute(self, req):
+        return self.name
+
+
+class Wildcard(object):
+    priority = type_manager.PRIORITY_PRE
+
+    def __init__(self):
+        self.seen = []
+
+    def execute(self, req):
+        self.seen.append(req.name)
+
+
+@pytest.fixture
+def registry(mocker):
+    mocker.patch.dict(type_manager.TYPES, clear=True)
+    return type_manager
+
+
+def _req(name, kind='docker'):
+    return JsonObject({'name': name, 'data': {'kind': kind}})
+
+
+def test_register_type_priority_order(registry):
+    default = FakePost('a')
+    default.priority = type_manager.PRIORITY_DEFAULT
+    specific = FakePost('b')
+    pre = FakePost('c')
+    pre.priority = type_manager.PRIORITY_PRE
+
+    for impl in [default, specific, pre]:
+        registry.register_type(type_manager.POST_REQUEST_HANDLER, impl)
+
+    assert registry.get_type_list(type_manager.POST_REQUEST_HANDLER) == \
+        [pre, specific, default]
+
+
+def test_route_by_event_name(registry):
+    wildcard = Wildcard()
+    registry.register_type(type_manager.PRE_REQUEST_HANDLER, wildcard)
+    registry.register_type(type_manager.COMPUTE_DRIVER,
+                           FakeDriver('compute', 'docker'))
+    registry.register_type(type_manager.COMPUTE_DRIVER,
+                           FakeDriver('compute', 'kvm'))
+    registry.register_type(type_manager.POST_REQUEST_HANDLER,
+                           FakePost('ping'))
+
+    router = Router()
+    assert router.route(_req('compute.instance.activate;agent=4')) == \
+        'docker'
+    assert router.route(_req('compute.instance.activate', 'kvm')) == 'kvm'
+    assert router.route(_req('ping;agent=4')) == 'ping'
+    assert router.route(_req('storage.instance.activate')) is None
+    assert router.route(_req('unknown')) is None
+    assert wildcard.seen == ['compute.instance.activate;agent=4',
+                             'compute.instance.activate', 'ping;agent=4',
+                             'storage.instance.activate', 'unknown']
+
+
+def test_dispatch_table_rebuilt_on_register(registry):
+    router = Router()
+    assert router.route(_req('ping')) is None
+
+    registry.register_type(type_manager.POST_REQUEST_HANDLER,
+                           FakePost('ping'))
+    assert router.route(_req('ping')) == 'ping'
+
+
+def test_dispatch_table_entries(registry):
+    docker = FakeDriver('compute', 'docker')
+    post = FakePost('ping')
+    registry.register_type(type_manager.COMPUTE_DRIVER, docker)
+    registry.register_type(type_manager.POST_REQUEST_HANDLER, post)
+
+    table = build_dispatch_table()
+    assert table == {
+        'compute.instance.activate': ((docker, True),),
+        'ping': ((post, False),),
+    }
+
+
+def test_kind_based_supports(registry):
+    docker = KindDriver('docker')
+    req = JsonObject({
+        'name': 'compute.instance.activate;agent=4',
+        'data': {'instanceHostMap': {'host': {'kind': 'docker'}}},
+    })
+    assert docker.supports(req)
+    assert not KindDriver('kvm').supports(req)
+
+    req.data.instanceHostMap = None
+    assert not docker.supports(req)
+
+
+def test_kind_based_supports_undeclared_event(mocker):
+    mocker.patch.dict(KindBasedMixin._RESOLVED_PATHS, clear=True)
+    docker = KindDriver('docker')
+
+    def req(name, **data):
+        return JsonObject({'name': name, 'data': data})
+
+    assert not docker._check_supports(req('compute.instance.other'))
+    assert KindBasedMixin._RESOLVED_PATHS == {}
+
+    assert docker._check_supports(req('compute.instance.other;agent=4',
+                                      instancePull={'kind': 'docker'}))
+    assert KindBasedMixin._RESOLVED_PATHS == {
+        'compute.instance.other': ['instancePull', 'kind']
+    }
+
+    KindBasedMixin._RESOLVED_PATHS.clear()
+    assert not docker._check_supports(req('compute.instance.other',
+                                          instanceInspect={'kind': None}))
+    assert KindBasedMixin._RESOLVED_PATHS == {}
+
+
+def test_undeclared_entries_cached(registry, mocker):
+    wildcard = Wildcard()
+    registry.register_type(type_manager.PRE_REQUEST_HANDLER, wildcard)
+    router = Router()
+    entries = mocker.patch.object(event_router, '_entries',
+                                  return_value=((wildcard, False),))
+
+    router.route(_req('unknown'))
+    router.route(_req('unknown;agent=4'))
+    assert entries.call_count == 1
+    assert wildcard.seen == ['unknown', 'unknown;agent=4']
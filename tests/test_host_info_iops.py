@@ -0,0 +1,76 @@
+import json
+import os
+import platform
+
+import pytest
+
+from cattle import CONFIG_OVERRIDE
+from cattle.plugins.host_info.iops import IopsCollector
+
+
+def _fio(kind, iops, devices):
+    return json.dumps({
+        'jobs': [{kind: {'iops': i}} for i in iops],
+        'disk_util': [{'name': d} for d in devices],
+    })
+
+
+def _write(state, read_iops, write_iops, devices, mtime):
+    for kind, iops in (('read', read_iops), ('write', write_iops)):
+        path = state.join(kind + '.json')
+        path.write(_fio(kind, iops, devices))
+        os.utime(str(path), (mtime, mtime))
+
+
+@pytest.fixture
+def collector(tmpdir, mocker):
+    mocker.patch.object(platform, 'system', return_value='Linux')
+    mocker.patch.dict(CONFIG_OVERRIDE, {'HOST_INFO_WATCH_INTERVAL': '10'})
+    return IopsCollector(str(tmpdir))
+
+
+def test_missing_files(collector):
+    assert collector.get_data() == {}
+    assert collector.get_default_disk() is None
+
+
+def test_multiple_devices(collector, tmpdir):
+    _write(tmpdir, [100], [50], ['dm-0', 'sda'], 1000)
+    assert collector.get_data() == {'/dev/dm-0': {'read': 100, 'write': 50},
+                                    '/dev/sda': {'read': 100, 'write': 50}}
+    assert collector.get_default_disk() == '/dev/dm-0'
+
+
+def test_job_per_device(collector, tmpdir):
+    _write(tmpdir, [100, 200], [50, 60], ['sda', 'sdb'], 1000)
+    assert collector.get_data() == {'/dev/sda': {'read': 100, 'write': 50},
+                                    '/dev/sdb': {'read': 200, 'write': 60}}
+
+
+def test_reload_on_change(collector, tmpdir, mocker):
+    now = mocker.patch('time.time', return_value=1000.0)
+    load = mocker.spy(collector.files, 'load')
+
+    _write(tmpdir, [100], [50], ['sda'], 1000)
+    assert collector.get_default_disk() == '/dev/sda'
+
+    # Reruns are only looked for every interval seconds
+    _write(tmpdir, [300], [70], ['sdb'], 2000)
+    assert collector.get_data().keys() == ['/dev/sda']
+
+    now.return_value = 1011.0
+    assert collector.get_data() == {'/dev/sdb': {'read': 300, 'write': 70}}
+
+    now.return_value = 1022.0
+    collector.get_data()
+    assert load.call_count == 2
+
+
+def test_partial_file_keeps_last(collector, tmpdir, mocker):
+    now = mocker.patch('time.time', return_value=1000.0)
+    _write(tmpdir, [100], [50], ['sda'], 1000)
+    collector.get_data()
+
+    tmpdir.join('read.json').write('{"jobs": [')
+    now.return_value = 1011.0
+    assert collector.get_data().keys() == ['/dev/sda']
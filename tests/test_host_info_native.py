@@ -0,0 +1,147 @@
+import os
+import platform
+
+import pytest
+
+from cattle import CONFIG_OVERRIDE
+from cattle.plugins.host_info.cpu import CpuCollector
+from cattle.plugins.host_info.disk import DiskCollector
+from cattle.plugins.host_info.main import HostInfo
+from cattle.plugins.host_info import native
+from cattle.plugins.host_info.native import CpuSampler, NativeStatsClient
+
+STAT = '''cpu  300 0 300 1000 0 0 0 0 0 0
+cpu0 100 0 100 500 50 0 0 0 0 0
+cpu1 200 0 200 500 50 0 0 0 0 0
+intr 1 2 3
+'''
+
+DISKSTATS = '''   8       1 sda1 10 1 80 5 20 2 160 7 0 9 12
+'''
+
+
+@pytest.fixture
+def proc(tmpdir):
+    root = tmpdir.mkdir('proc')
+    root.join('stat').write(STAT)
+    root.join('diskstats').write(DISKSTATS)
+    root.join('mounts').write('/dev/sda1 / ext4 rw 0 0\n'
+                              '/dev/sda1 /var ext4 rw 0 0\n'
+                              'proc /proc proc rw 0 0\n')
+    return root
+
+
+STAT_LATER = '''cpu  450 0 300 1000 0 0 0 0 0 0
+cpu0 150 0 100 500 50 0 0 0 0 0
+cpu1 300 0 200 500 50 0 0 0 0 0
+'''
+
+
+@pytest.fixture
+def sampler(proc, mocker):
+    # Samples are taken by hand instead of the sampler thread, at times
+    # set by the test
+    mocker.patch.object(native, 'Thread')
+    mocker.patch.object(native, 'time')
+    mocker.patch.object(native, '_CLOCK_TICKS', 100)
+    native.time.time.return_value = 100.0
+    return CpuSampler()
+
+
+@pytest.fixture
+def client(proc, tmpdir, sampler):
+    c = NativeStatsClient(proc_root=str(proc),
+                          cgroup_root=str(tmpdir.join('cgroup')),
+                          num_stats=2, sampler=sampler)
+    c._clock_ticks = 100
+    return c
+
+
+def test_proc_stat_usage(client):
+    sample = client.sample()
+    assert sample['cpu']['usage']['per_cpu_usage'] == [2 * 10 ** 9,
+                                                       4 * 10 ** 9]
+    assert sample['cpu']['usage']['total'] == 6 * 10 ** 9
+
+
+def test_host_cpu_ignores_cgroup(client, tmpdir):
+    # The agent's own cgroup is not the host
+    cpuacct = tmpdir.mkdir('cgroup').mkdir('cpuacct')
+    cpuacct.join('cpuacct.usage_percpu').write('5 7 \n')
+    usage = client.sample()['cpu']['usage']['per_cpu_usage']
+    assert usage == [2 * 10 ** 9, 4 * 10 ** 9]
+
+
+def test_sampler_ring(proc, sampler, mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'NATIVE_STATS_SAMPLES': '2'})
+    assert sampler.samples() is None
+
+    sampler.start(str(proc))
+    assert native.Thread.call_count == 1
+    for i in range(2):
+        native.time.time.return_value += 1
+        sampler.sample()
+
+    samples = sampler.samples()
+    timestamps = [s['timestamp'] for s in samples]
+    assert timestamps == [101 * 10 ** 9, 102 * 10 ** 9]
+    assert samples[-1]['cpu']['usage']['total'] == 6 * 10 ** 9
+
+
+def test_sampler_started_on_startup(sampler, mocker):
+    mocker.patch.object(sampler, 'start')
+    sampler.on_startup()
+    assert sampler.start.call_count == 0
+
+    mocker.patch.dict(CONFIG_OVERRIDE, {'HOST_INFO_BACKEND': 'native'})
+    sampler.on_startup()
+    assert sampler.start.call_count == 1
+
+
+def test_filesystems(client):
+    filesystems = client.sample()['filesystem']
+    assert len(filesystems) == 1
+
+    fs = filesystems[0]
+    st = os.statvfs('/')
+    assert fs['device'] == '/dev/sda1'
+    assert fs['capacity'] == st.f_blocks * st.f_frsize
+    assert fs['reads_completed'] == 10
+    assert fs['weighted_io_time'] == 12
+
+    assert client.get_machine_stats()['filesystems'] == [
+        {'device': '/dev/sda1', 'capacity': fs['capacity']}]
+
+
+def test_filesystems_slow_tier(client, mocker):
+    statvfs = mocker.spy(client, '_statvfs')
+    client.get_stats()
+    client.get_stats()
+    assert statvfs.call_count == 1
+
+
+def test_collectors_on_native(proc, client, sampler, mocker):
+    mocker.patch.object(platform, 'system', return_value='Linux')
+    sampler.start(str(proc))
+    native.time.time.return_value += 1
+    sampler.sample()
+    native.time.time.return_value += 1
+    proc.join('stat').write(STAT_LATER)
+    sampler.sample()
+    assert len(client.get_stats()) == 2
+
+    cpu = CpuCollector(client)
+    data = cpu._get_cpu_percentages()
+    assert data['cpuCoresPercentages'] == [50, 100]
+    assert data['cpuWindow']['max'] == 75
+
+    disk = DiskCollector(cadvisor=client).get_data()
+    assert disk['mountPoints'].keys() == ['/dev/sda1']
+    assert disk['fileSystems'].keys() == ['/dev/sda1']
+
+
+def test_native_backend_selected(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'HOST_INFO_BACKEND': 'native'})
+    host = HostInfo()
+    assert isinstance(host.cadvisor, NativeStatsClient)
+    assert host.collectors[3].cadvisor is host.cadvisor
@@ -1,5 +1,6 @@
 import pytest
 import os
+import time
 import tests
 import platform
 import json
@@ -19,22 +20,22 @@ TEST_DIR = os.path.join(os.path.dirname(tests.__file__))
 
 def cpuinfo_data():
     with open(os.path.join(TEST_DIR, 'host_info/cpuinfo')) as mf:
-        return mf.readlines()
+        return mf.read()
 
 
 def non_intel_cpuinfo_data():
-    d = cpuinfo_data()
+    lines = cpuinfo_data().splitlines(True)
 
-    for line in d:
+    for i, line in enumerate(lines):
         if line.startswith("model name"):
-            d[d.index(line)] = "model name : AMD Opteron 250\n"
+            lines[i] = "model name : AMD Opteron 250\n"
 
-    return d
+    return ''.join(lines)
 
 
 def meminfo_data():
     with open(os.path.join(TEST_DIR, 'host_info/meminfo')) as mf:
-        return mf.readlines()
+        return mf.read()
 
 
 def cadvisor_stats_data():
@@ -112,7 +113,8 @@ def host_data(full_mock_hostinfo_obj):
 
     assert isinstance(data, dict)
     os.getloadavg.assert_called_once_with()
-    CpuCollector._get_cpuinfo_data.assert_called_once_with()
+    # Once for the model and count, once for the frequency
+    assert CpuCollector._get_cpuinfo_data.call_count == 2
     MemoryCollector._get_meminfo_data.assert_called_once_with()
     CadvisorAPIClient.get_containers.assert_called_with()
     CadvisorAPIClient.get_machine_stats.assert_called_with()
@@ -271,7 +273,8 @@ def test_collect_data_cpuinfo(host_data):
                              'count',
                              'mhz',
                              'loadAvg',
-                             'cpuCoresPercentages'
+                             'cpuCoresPercentages',
+                             'cpuWindow'
                              ]
 
     assert sorted(host_data['cpuInfo']) == sorted(expected_cpuinfo_keys)
@@ -301,3 +304,83 @@ def test_non_linux_host(host_data_non_linux):
     assert 'dockerStorageDriver' in host_data_non_linux['diskInfo'].keys()
     assert 'dockerStorageDriverStatus' in \
         host_data_non_linux['diskInfo'].keys()
+
+
+def test_collect_data_cached_by_tier(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'HOST_INFO_SLOW_TTL': '300'})
+    mocker.patch.object(platform, 'system', return_value='Linux')
+    mocker.patch('os.getloadavg', return_value=(1.0, 1.0, 1.0))
+    mocker.patch.object(CpuCollector, '_get_cpuinfo_data',
+                        return_value=cpuinfo_data())
+    mocker.patch.object(MemoryCollector, '_get_meminfo_data',
+                        return_value=meminfo_data())
+    mocker.patch.object(CadvisorAPIClient, 'get_containers',
+                        return_value=cadvisor_stats_data())
+    mocker.patch.object(CadvisorAPIClient, 'get_machine_stats',
+                        return_value=cadvisor_machine_stats_data())
+    now = mocker.patch('time.time', return_value=1000.0)
+
+    host = HostInfo()
+    first = host.collect_data()
+    first['cpuInfo']['modelName'] = 'changed'
+    assert host.collect_data()['cpuInfo']['modelName'] != 'changed'
+
+    # Static model and count plus the slow tier frequency
+    assert CpuCollector._get_cpuinfo_data.call_count == 2
+    assert MemoryCollector._get_meminfo_data.call_count == 2
+    assert os.getloadavg.call_count == 2
+    assert CadvisorAPIClient.get_machine_stats.call_count == 1
+
+    now.return_value = 1301.0
+    assert host.collect_data()['cpuInfo']['mhz'] == 1700
+    assert CpuCollector._get_cpuinfo_data.call_count == 3
+    assert CadvisorAPIClient.get_machine_stats.call_count == 2
+
+
+class SlowCollector(object):
+    def __init__(self, name, values, delay=0):
+        self.name = name
+        self.values = values
+        self.delay = delay
+
+    def key_name(self):
+        return self.name
+
+    def get_data(self):
+        time.sleep(self.delay)
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def test_collect_data_deadline(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {
+        'HOST_INFO_DEADLINE': '0.5',
+        'HOST_INFO_TIMEOUT': '0.3',
+        'HOST_INFO_FAST_TIMEOUT': '5',
+    })
+    host = HostInfo()
+    fast = SlowCollector('fast', [{'a': 1}, Exception('failed')])
+    slow = SlowCollector('slow', [{'b': 1}, {'b': 2}, {'b': 3}])
+    host.collectors = [fast, slow]
+
+    assert host.collect_data() == {'fast': {'a': 1}, 'slow': {'b': 1}}
+
+    slow.delay = 0.6
+    start = time.time()
+    assert host.collect_data() == {
+        'fast': {'a': 1, 'stale': True},
+        'slow': {'b': 1, 'stale': True},
+    }
+    assert time.time() - start < 0.45
+
+    # Still running, so it is waited on rather than started again
+    assert host.collect_data()['slow'] == {'b': 1, 'stale': True}
+    assert slow.values == [{'b': 2}, {'b': 3}]
+
+    # The late result becomes the stale value
+    time.sleep(0.5)
+    assert host._stale('slow') == {'b': 2, 'stale': True}
+    slow.delay = 0
+    assert host.collect_data()['slow'] == {'b': 3}
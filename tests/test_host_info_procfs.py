@@ -0,0 +1,53 @@
+import os
+
+import tests
+from cattle.plugins.host_info import procfs
+
+TEST_DIR = os.path.join(os.path.dirname(tests.__file__), 'host_info')
+
+
+def _fixture(name):
+    with open(os.path.join(TEST_DIR, name)) as f:
+        return f.read()
+
+
+def test_read_grows_buffer(tmpdir, mocker):
+    mocker.patch.object(procfs, '_local', procfs.threading.local())
+    mocker.patch.object(procfs, '_BUFFER_SIZE', 16)
+    content = _fixture('cpuinfo')
+    path = tmpdir.join('cpuinfo')
+    path.write(content)
+
+    assert procfs.read(str(path)) == content
+    buf = procfs._local.buf
+    assert len(buf) >= len(content)
+
+    path.write('short')
+    assert procfs.read(str(path)) == 'short'
+    assert procfs._local.buf is buf
+
+
+def test_fields_match_whole_keys():
+    content = 'SwapCached: 1 kB\nCached: 2 kB\nActive(anon): 3 kB\n' \
+              'Active:     4 kB\n'
+    assert procfs.fields(content, ['Cached', 'Active', 'Missing']) == {
+        'Cached': '2 kB', 'Active': '4 kB'}
+    assert procfs.meminfo(content, ['SwapCached', 'Active']) == {
+        'SwapCached': 1, 'Active': 4}
+
+
+def test_cpuinfo_many_cores():
+    content = _fixture('cpuinfo')
+    assert procfs.cpuinfo(content) == {
+        'modelName': 'Intel(R) Core(TM) i7-4650U CPU @ 1.70GHz',
+        'count': 4,
+        'mhz': 1700,
+    }
+
+    assert procfs.cpuinfo(content * 32)['count'] == 128
+
+
+def test_cpuinfo_mhz_fallback():
+    content = 'processor : 0\nmodel name : AMD Opteron 250\n' \
+              'cpu MHz     : 2334.915\n'
+    assert procfs.cpuinfo(content)['mhz'] == 2334.915
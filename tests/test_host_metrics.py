@@ -0,0 +1,169 @@
+import math
+import threading
+import time
+from multiprocessing import Process
+
+import pytest
+
+from cattle import CONFIG_OVERRIDE
+from cattle.utils import JsonObject
+from cattle.plugins.host_info.metrics import MetricsStore, MetricsSampler, \
+    HostMetrics
+
+NAN = float('nan')
+
+
+@pytest.fixture
+def store():
+    return MetricsStore(10, tiers=((1, 4), (3, 4)))
+
+
+def test_query_latest(store):
+    for i in range(3):
+        store.add(100 + i * 10, [i, 50, 60, 0.5])
+
+    result = store.query()
+    assert result['step'] == 10
+    assert result['metrics'] == ['cpu', 'memory', 'disk', 'load']
+    assert result['points'] == [[100, 0, 50, 60, 0.5],
+                                [110, 1, 50, 60, 0.5],
+                                [120, 2, 50, 60, 0.5]]
+
+
+def test_ring_size_is_fixed(store):
+    for i in range(10):
+        store.add(100 + i * 10, [i, NAN, 0, 0])
+
+    points = store.query()['points']
+    assert [p[0] for p in points] == [160, 170, 180, 190]
+    assert points[0][2] is None
+    assert len(store.tiers[0]._rows) == 4 * 5
+
+
+def test_downsample(store):
+    # 30 second buckets, the last one is still open
+    for ts, cpu in [(90, 10), (100, 20), (110, NAN), (120, 40), (130, 60)]:
+        store.add(ts, [cpu, 1, 2, 3])
+
+    result = store.query(resolution=30)
+    assert result['step'] == 30
+    assert result['points'] == [[90, 15, 1, 2, 3]]
+
+
+def test_query_filters(store):
+    for i in range(4):
+        store.add(100 + i * 10, [i, 50, 60, 0.5])
+
+    result = store.query(start=105, end=125, metrics=['cpu', 'load'])
+    assert result['metrics'] == ['cpu', 'load']
+    assert result['points'] == [[110, 1, 0.5], [120, 2, 0.5]]
+
+    # Longer than the 40 seconds the finest tier holds
+    assert store.query(start=0, end=100)['step'] == 30
+
+
+def test_shared_with_forked_reader(store):
+    def write():
+        store.add(100, [1, 2, 3, 4])
+
+    p = Process(target=write)
+    p.start()
+    p.join()
+    assert store.query()['points'] == [[100, 1, 2, 3, 4]]
+
+
+def test_sampler(tmpdir, mocker):
+    proc = tmpdir.mkdir('proc')
+    proc.join('stat').write('cpu  1 0 1 8 0 0 0 0 0 0\n'
+                            'cpu0 100 0 100 500 50 0 0 0 0 0\n')
+    proc.join('meminfo').write('MemTotal: 1000 kB\n'
+                               'MemFree: 100 kB\n'
+                               'MemAvailable: 250 kB\n')
+    proc.join('loadavg').write('0.75 0.5 0.25 1/100 42\n')
+    proc.join('mounts').write('')
+
+    # The agent's own cgroup doesn't count
+    cpuacct = tmpdir.mkdir('cgroup').mkdir('cpuacct')
+    cpuacct.join('cpuacct.usage_percpu').write('5 \n')
+    mocker.patch.dict(CONFIG_OVERRIDE,
+                      {'NATIVE_CGROUP_ROOT': str(tmpdir.join('cgroup'))})
+    time = mocker.patch('time.time', return_value=100.0)
+    sampler = MetricsSampler(str(proc), clock_ticks=100)
+
+    ts, values = sampler.sample()
+    assert math.isnan(values[0])
+    assert values[1] == 75
+    assert math.isnan(values[2])
+    assert values[3] == 0.75
+
+    proc.join('stat').write('cpu  1 0 1 8 0 0 0 0 0 0\n'
+                            'cpu0 150 0 100 500 50 0 0 0 0 0\n')
+    time.return_value = 101.0
+    ts, values = sampler.sample()
+    assert values[0] == 50
+
+
+def test_disabled_by_default():
+    metrics = HostMetrics()
+    metrics.on_startup()
+    assert metrics.store is None
+
+
+def _event(name, data):
+    return JsonObject({
+        'id': 'id',
+        'name': name,
+        'replyTo': 'reply.' + name,
+        'resourceType': None,
+        'resourceId': None,
+        'data': data,
+    })
+
+
+def test_slow_sampler_keeps_running(mocker):
+    metrics = HostMetrics()
+    metrics.store = MetricsStore(0.01)
+    samples = []
+    parked = threading.Event()
+
+    def sample():
+        samples.append(1)
+        if len(samples) > 3:
+            # Park the thread, it runs until the tests end
+            parked.set()
+            threading.Event().wait()
+        # Longer than the interval
+        time.sleep(0.03)
+        return time.time(), [1, 2, 3, 4]
+
+    metrics.sampler = mocker.Mock()
+    metrics.sampler.sample.side_effect = sample
+    t = threading.Thread(target=metrics._run)
+    t.setDaemon(True)
+    t.start()
+    assert parked.wait(5)
+    assert len(metrics.store.query()['points']) == 3
+
+
+def test_query_event_and_ping(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'HOST_METRICS_PING_WINDOW': '60'})
+    mocker.patch('time.time', return_value=150)
+    metrics = HostMetrics()
+    assert metrics.execute(_event('host.metrics.query', {})).data == {}
+    assert metrics.execute(_event('ping', {})) is None
+
+    metrics.store = MetricsStore(10)
+    metrics.store.add(100, [1, 2, 3, 4])
+
+    resp = metrics.execute(_event('host.metrics.query', {'start': 50}))
+    assert resp.data['points'] == [[100, 1, 2, 3, 4]]
+
+    ping = _event('ping', {'options': {'hostMetrics': 30}})
+    pong = _event('ping.reply', {})
+    metrics.on_ping(ping, pong)
+    assert pong.data.hostMetrics['points'] == []
+    assert pong.data.options['hostMetrics']
+
+    ping = _event('ping', {'options': {'hostMetrics': True}})
+    metrics.on_ping(ping, pong)
+    assert pong.data.hostMetrics['points'] == [[100, 1, 2, 3, 4]]
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import time
+
+import pytest
+
+from cattle import liveness
+
+from .common_fixtures import SCRATCH_DIR, wait_for
+
+
+@pytest.fixture
+def stamp():
+    stamp_file = os.path.join(SCRATCH_DIR, 'stamp-{0}'.format(time.time()))
+    with open(stamp_file, 'w'):
+        pass
+    os.utime(stamp_file, (1, 1))
+    return stamp_file
+
+
+@pytest.fixture(params=['watch', 'poll'])
+def mode(request, mocker):
+    if request.param == 'poll':
+        mocker.patch.object(liveness, 'inotify_init',
+                            side_effect=OSError('not supported'))
+        mocker.patch.object(liveness, 'pidfd_open',
+                            side_effect=OSError('not supported'))
+    return request.param
+
+
+def test_stamp_change(stamp, mode):
+    events = []
+    watcher = liveness.Liveness(stamp, interval=0.1)
+    watcher.add_listener(lambda *args: events.append(args))
+    watcher.start()
+
+    assert watcher.alive()
+    assert (watcher._inotify is not None) == (mode == 'watch')
+
+    os.utime(stamp, (2, 2))
+    assert wait_for(lambda: not watcher.alive())
+    assert events == [(liveness.STAMP_CHANGED, stamp)]
+
+
+def test_process_exit(mode):
+    p = subprocess.Popen(['sleep', '30'])
+    events = []
+    watcher = liveness.Liveness(pid=p.pid, interval=0.1)
+    watcher.add_listener(lambda *args: events.append(args))
+    watcher.start()
+
+    other = subprocess.Popen(['sleep', '0.1'])
+    watcher.watch_pid(other.pid, check=lambda: other.poll() is None)
+
+    assert wait_for(lambda: len(events) == 1)
+    assert events == [(liveness.PROCESS_EXITED, other.pid)]
+    assert watcher.alive()
+
+    p.kill()
+    p.wait()
+    assert wait_for(lambda: not watcher.alive())
+    assert events[1] == (liveness.PROCESS_EXITED, p.pid)
+
+
+def test_watch_shared_per_process(stamp):
+    watcher = liveness.watch(stamp, str(os.getpid()))
+    assert liveness.watch(stamp, os.getpid()) is watcher
+    assert watcher.alive()
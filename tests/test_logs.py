@@ -0,0 +1,150 @@
+import Queue
+import json
+import logging
+import os
+import time
+
+from cattle import CONFIG_OVERRIDE
+from cattle import logs
+from cattle import trace
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _logger(handler):
+    log = logging.getLogger('test-logs')
+    log.handlers = [handler]
+    log.propagate = False
+    log.setLevel(logging.DEBUG)
+    return log
+
+
+def test_payload(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'LOG_PAYLOAD_MAX': '10',
+                                        'LOG_PAYLOAD_SAMPLE': '0'})
+    assert str(logs.Payload('{"id":1}')) == '{"id":1}'
+    assert str(logs.Payload('x' * 25)) == 'x' * 10 + '... [25 bytes]'
+
+    mocker.patch.dict(CONFIG_OVERRIDE, {'LOG_PAYLOAD_SAMPLE': '1'})
+    assert str(logs.Payload('x' * 25)) == 'x' * 25
+
+
+def test_queue_handler():
+    target = _Collect()
+    handler = logs.QueueHandler([target])
+    log = _logger(handler)
+
+    t = trace.begin()
+    t.id = 'id1'
+    t.name = 'compute.instance.activate'
+    data = {'state': 'before'}
+    try:
+        log.info('Request: %s', logs.Payload('{}'))
+        log.info('Data %s', data)
+        data['state'] = 'after'
+        try:
+            raise ValueError('bad')
+        except ValueError:
+            log.exception('Failed')
+    finally:
+        trace.end()
+    handler.flush()
+
+    first, second, third = target.records
+    assert first.eventId == 'id1'
+    assert isinstance(first.args[0], logs.Payload)
+    # Mutable arguments are formatted before they are queued
+    assert second.getMessage() == "Data {'state': 'before'}"
+    assert 'ValueError: bad' in third.exc_text
+
+    handler.close()
+
+
+def test_drops(mocker):
+    target = _Collect()
+    handler = logs.QueueHandler([target])
+    log = _logger(handler)
+    dropped = logs.DROPPED.get()
+
+    log.info('one')
+    handler.flush()
+    mocker.patch.object(handler._queue, 'put_nowait', side_effect=Queue.Full)
+    log.info('two')
+    log.info('three')
+    assert logs.DROPPED.get() == dropped + 2
+
+    mocker.stopall()
+    log.info('four')
+    handler.flush()
+    assert [r.getMessage() for r in target.records] == [
+        'one', 'Dropped 2 log records, the queue was full', 'four']
+    handler.close()
+
+
+def test_flush_root(mocker):
+    target = _Collect()
+    handler = logs.QueueHandler([target])
+    mocker.patch.object(logging.root, 'handlers', [handler])
+    log = logging.getLogger('test-logs-root')
+
+    log.error('Exiting')
+    logs.flush()
+    assert [r.getMessage() for r in target.records] == ['Exiting']
+    handler.close()
+
+
+def test_fork_with_handler_lock_held(tmpdir):
+    path = str(tmpdir.join('log'))
+    target = logging.FileHandler(path)
+    target.setFormatter(logging.Formatter('%(message)s'))
+    handler = logs.QueueHandler([target])
+    log = _logger(handler)
+    log.info('parent')
+    handler.flush()
+
+    # As if the parent's writer was in the middle of a record
+    target.acquire()
+    pid = os.fork()
+    if pid == 0:
+        log.info('child')
+        logs.flush(timeout=1)
+        handler.flush(timeout=1)
+        os._exit(0)
+    target.release()
+
+    end = time.time() + 5
+    while os.waitpid(pid, os.WNOHANG) == (0, 0):
+        assert time.time() < end
+        time.sleep(0.01)
+    with open(path) as f:
+        assert f.read().split() == ['parent', 'child']
+    handler.close()
+
+
+def test_flush_timeout(mocker):
+    stuck = _Collect()
+    mocker.patch.object(stuck, 'flush', side_effect=lambda: time.sleep(5))
+    mocker.patch.object(logging.root, 'handlers', [stuck])
+    start = time.time()
+    logs.flush(timeout=0.1)
+    assert time.time() - start < 1
+
+
+def test_json_formatter():
+    record = logging.LogRecord('agent', logging.INFO, 'event.py', 10,
+                               'Done %s', ('id1',), None)
+    record.eventId = 'id1'
+    record.eventName = 'ping'
+    data = json.loads(logs.JsonFormatter().format(record))
+    assert data['message'] == 'Done id1'
+    assert data['eventId'] == 'id1'
+    assert data['eventName'] == 'ping'
+    assert data['level'] == 'INFO'
+    assert data['line'] == 10
@@ -0,0 +1,90 @@
+from multiprocessing import Process
+
+from cattle import metrics
+from cattle.metrics import Callback, Counter, Gauge, Histogram
+
+
+def test_counter_and_gauge():
+    c = Counter('test_total', 'Things', 'kind', ['a', 'b'])
+    c.inc(label='a')
+    c.inc(2, label='a')
+    assert c.get('a') == 3
+    assert c.get('b') == 0
+    assert c.render() == ['# HELP test_total Things',
+                          '# TYPE test_total counter',
+                          'test_total{kind="a"} 3',
+                          'test_total{kind="b"} 0']
+
+    g = Gauge('test_in_flight', 'Running')
+    g.inc()
+    g.inc()
+    g.dec()
+    assert g.get() == 1
+    g.set(0.5)
+    assert g.render()[-1] == 'test_in_flight 0.5'
+
+
+def test_histogram():
+    h = Histogram('test_seconds', 'Time', 'method', ['get'],
+                  buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        h.observe(value, label='get')
+
+    snapshot = h.snapshot()['get']
+    assert snapshot['count'] == 4
+    assert snapshot['sum'] == 2.65
+    assert snapshot['buckets'] == [(0.1, 2), (1, 3)]
+    assert metrics.quantile(snapshot, 0.5) == 0.1
+    assert metrics.quantile(snapshot, 0.75) == 1
+    assert metrics.quantile(snapshot, 0.99) is None
+
+    assert h.render()[2:] == [
+        'test_seconds_bucket{method="get",le="0.1"} 2',
+        'test_seconds_bucket{method="get",le="1"} 3',
+        'test_seconds_bucket{method="get",le="+Inf"} 4',
+        'test_seconds_sum{method="get"} 2.65',
+        'test_seconds_count{method="get"} 4']
+
+
+def test_shared_across_processes():
+    c = Counter('test_shared_total', 'Shared')
+    h = Histogram('test_shared_seconds', 'Shared')
+
+    def work():
+        for _ in range(100):
+            c.inc()
+            h.observe(0.01)
+
+    workers = [Process(target=work) for _ in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+    assert c.get() == 400
+    assert h.snapshot()[None]['count'] == 400
+
+
+def test_registry_render():
+    c = metrics.counter('test_registry_total', 'Registered')
+    assert metrics.counter('test_registry_total', 'Registered') is c
+    c.inc()
+    assert 'test_registry_total 1\n' in metrics.render()
+
+
+def test_label_tuple():
+    h = Histogram('test_stage_seconds', 'Stages', ('event', 'stage'),
+                  [('ping', 'queue')], buckets=(1,))
+    h.observe(0.5, label=('ping', 'queue'))
+    assert h.render()[2] == \
+        'test_stage_seconds_bucket{event="ping",stage="queue",le="1"} 1'
+
+
+def test_callback():
+    values = {'b': 2, 'a': None}
+    c = Callback('test_child_rss_bytes', 'RSS', 'child', lambda: values)
+    assert c.render()[2:] == ['test_child_rss_bytes{child="b"} 2']
+
+    values['a'] = 1.5
+    assert c.render()[2:] == ['test_child_rss_bytes{child="a"} 1.5',
+                              'test_child_rss_bytes{child="b"} 2']
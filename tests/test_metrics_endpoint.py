@@ -0,0 +1,92 @@
+import socket
+import urllib2
+
+import portalocker
+import pytest
+
+from cattle import CONFIG_OVERRIDE, Config
+from cattle import lock as lock_module
+from cattle import metrics
+from cattle.lock import lock, FailedToLock
+from cattle.plugins.core.metrics_endpoint import MetricsEndpoint
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+@pytest.fixture
+def endpoint(mocker):
+    port = _free_port()
+    mocker.patch.dict(CONFIG_OVERRIDE, {
+        'METRICS_IP': '127.0.0.1',
+        'METRICS_PORT': str(port),
+    })
+    e = MetricsEndpoint()
+    e.on_startup()
+    yield 'http://127.0.0.1:{0}'.format(port)
+    e.stop()
+
+
+def test_scrape(endpoint):
+    c = metrics.counter('test_endpoint_total', 'Scraped')
+    c.inc()
+
+    r = urllib2.urlopen(endpoint + '/metrics')
+    assert r.info()['Content-Type'].startswith('text/plain')
+    body = r.read()
+    assert '# TYPE test_endpoint_total counter\n' in body
+    assert 'cattle_lock_failures_total ' in body
+
+    with pytest.raises(urllib2.HTTPError) as e:
+        urllib2.urlopen(endpoint + '/')
+    assert e.value.code == 404
+
+
+def test_disabled(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'METRICS_PORT': '0'})
+    e = MetricsEndpoint()
+    e.on_startup()
+    assert e.server is None
+
+
+def test_port_in_use(mocker):
+    taken = socket.socket()
+    taken.bind(('127.0.0.1', 0))
+    taken.listen(1)
+    try:
+        mocker.patch.dict(CONFIG_OVERRIDE, {
+            'METRICS_IP': '127.0.0.1',
+            'METRICS_PORT': str(taken.getsockname()[1]),
+        })
+        e = MetricsEndpoint()
+        e.on_startup()
+        assert e.server is None
+    finally:
+        taken.close()
+
+
+def test_default_port_not_console_agent():
+    assert Config.metrics_port() != Config.console_agent_port()
+
+
+def test_lock_contention(mocker, tmpdir):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'LOCK_DIR': str(tmpdir)})
+    acquired = lock_module.ACQUIRED.get()
+    failed = lock_module.FAILED.get()
+
+    with lock('volume-1'):
+        pass
+
+    mocker.patch('portalocker.Lock.__enter__',
+                 side_effect=portalocker.AlreadyLocked())
+    with pytest.raises(FailedToLock):
+        with lock('volume-1'):
+            pass
+
+    assert lock_module.ACQUIRED.get() == acquired + 1
+    assert lock_module.FAILED.get() == failed + 1
@@ -0,0 +1,120 @@
+import pytest
+
+from cattle import CONFIG_OVERRIDE, metrics, process_manager
+from cattle.process_manager import ProcessManager, Child, backoff
+from .common_fixtures import wait_for
+
+
+@pytest.fixture
+def manager(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {
+        'PROCESS_MAX_BACKOFF': '0.4',
+        'PROCESS_CRASH_LOOP_RESTARTS': '3',
+        'PROCESS_CRASH_LOOP_WINDOW': '60',
+    })
+    m = ProcessManager()
+    m.init()
+    yield m
+    m.stop()
+
+
+def test_backoff():
+    assert [backoff(i, 10) for i in range(1, 8)] == [0, 1, 2, 4, 8, 10, 10]
+
+
+def test_crash_loop_and_recovery(mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {
+        'PROCESS_MAX_BACKOFF': '60',
+        'PROCESS_CRASH_LOOP_RESTARTS': '3',
+        'PROCESS_CRASH_LOOP_WINDOW': '100',
+    })
+    m = ProcessManager()
+    child = Child('test', (['true'],), {})
+    child.started = 0
+
+    delays = []
+    for now in [1, 2, 3]:
+        m._exited(child, 1, now)
+        delays.append(child.next_start - now)
+        child.started = now
+
+    assert delays == [0, 1, 60]
+    assert child.state == process_manager.CRASH_LOOP
+    assert child.crash_loop
+
+    # Healthy for longer than the backoff ceiling and outside the window
+    child.started = 200
+    m._exited(child, 1, 300)
+    assert child.next_start == 300
+    assert child.state == process_manager.BACKOFF
+    assert not child.crash_loop
+
+
+def test_restart_on_exit(manager):
+    assert manager._sigchld
+    child = manager.supervise('exit', ['sh', '-c', 'exit 3'])
+
+    assert wait_for(lambda: child.crash_loop)
+    assert child.restarts >= 2
+    assert child.returncode == 3
+
+
+def test_stats(manager, mocker):
+    child = manager.supervise('sleep', ['sleep', '30'])
+    assert wait_for(lambda: child.pid is not None)
+
+    stats = manager.stats()
+    assert len(stats) == 1
+    assert stats[0]['name'] == 'sleep'
+    assert stats[0]['pid'] == child.pid
+    assert stats[0]['state'] == process_manager.RUNNING
+    assert stats[0]['restarts'] == 0
+    assert stats[0]['rss'] > 0
+    assert stats[0]['uptime'] >= 0
+
+    mocker.patch.object(process_manager, 'stats', manager.stats)
+    mocker.patch.dict(process_manager._SNAPSHOT, {'time': 0})
+    rendered = metrics.render()
+    assert 'cattle_child_restarts_total{child="sleep"} 0\n' in rendered
+    assert 'cattle_child_rss_bytes{child="sleep"} ' in rendered
+
+    pid = child.pid
+    child.process.kill()
+    assert wait_for(lambda: child.pid not in (None, pid))
+    assert child.restarts == 1
+    assert child.returncode == -9
+
+
+def test_launch_failure(manager):
+    child = manager.supervise('missing', ['/nonexistent/binary'])
+
+    assert wait_for(lambda: child.crash_loop)
+    assert child.pid is None
+    assert child.returncode is None
+
+
+def test_timeout(mocker):
+    m = ProcessManager()
+    m._sigchld = True
+    running = Child('running', (['true'],), {})
+    running.process = mocker.Mock()
+    m.children.append(running)
+
+    # Running children don't make the supervisor poll every second
+    m._last_reap = 100
+    assert m._timeout(100) == ProcessManager.FALLBACK_INTERVAL
+    assert m._timeout(200) == 0
+
+    # and with a pidfd they aren't polled at all
+    running.pidfd = 1
+    assert m._timeout(100) is None
+    running.pidfd = None
+
+    waiting = Child('waiting', (['true'],), {})
+    waiting.next_start = 105
+    m.children.append(waiting)
+    assert m._timeout(100) == 5
+
+    m._sigchld = False
+    m.children.remove(waiting)
+    assert m._timeout(100) == ProcessManager.POLL_INTERVAL
@@ -0,0 +1,139 @@
+import errno
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from cattle import CONFIG_OVERRIDE
+from cattle import profiler
+from cattle.plugins.core.event_handlers import ProfileHandler
+from cattle.utils import JsonObject
+
+
+@pytest.fixture
+def profile_dir(mocker, tmpdir):
+    mocker.patch.dict(CONFIG_OVERRIDE, {
+        'PROFILE_DIR': str(tmpdir),
+        'PROFILE_INTERVAL': '0.005',
+    })
+    return tmpdir
+
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+def test_sampler():
+    stop = threading.Event()
+    t = threading.Thread(target=_spin, args=(stop,), name='spinner')
+    t.start()
+    try:
+        sampler = profiler.Sampler('test', interval=0.001)
+        end = time.time() + 0.1
+        sampler.run(lambda: end)
+    finally:
+        stop.set()
+        t.join()
+
+    assert sampler.samples > 0
+    spinning = [k for k in sampler.stacks if k.startswith('test;spinner;')]
+    assert spinning
+    assert any('_spin (test_profiler.py:' in k for k in spinning)
+    for line in sampler.collapsed().splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+
+
+def test_stack_limit(mocker):
+    mocker.patch.object(profiler, 'MAX_STACKS', 1)
+    stop = threading.Event()
+    t = threading.Thread(target=stop.wait)
+    t.start()
+    try:
+        sampler = profiler.Sampler('test', interval=0.001)
+        sampler.sample()
+        sampler.sample()
+    finally:
+        stop.set()
+        t.join()
+    assert len([k for k in sampler.stacks
+                if not k.endswith(';[truncated]')]) == 1
+
+
+def test_event(profile_dir):
+    profiler.watch('test')
+    event = JsonObject({
+        'id': 'id1',
+        'name': 'agent.profile',
+        'replyTo': 'reply.1',
+        'resourceType': None,
+        'resourceId': None,
+        'data': {'duration': 0.2},
+    })
+
+    start = time.time()
+    resp = ProfileHandler().execute(event)
+    assert time.time() - start < 0.1
+    id = resp.data['session']
+    assert id
+    assert resp.data['until'] >= start + 0.2
+
+    # The watcher was woken and writes its samples at the end
+    for _ in range(100):
+        if profiler.files(id):
+            break
+        time.sleep(0.05)
+
+    event.data = JsonObject({'session': id})
+    resp = ProfileHandler().execute(event)
+    assert 'test;MainThread;' in resp.data['stacks']
+
+    event.data.file = True
+    resp = ProfileHandler().execute(event)
+    assert resp.data['files'] == [str(profile_dir.join(
+        'profile-{0}-{1}.txt'.format(id, os.getpid())))]
+
+
+def test_wake(mocker):
+    # A pipe of its own, away from the watchers of other tests
+    mocker.patch.dict(profiler._state, {'session': None})
+    profiler.init()
+    wait = threading.Thread(target=profiler._wait)
+    wait.setDaemon(True)
+    wait.start()
+    profiler._wake(1)
+    wait.join(1)
+    assert not wait.is_alive()
+    for fd in profiler._state['wake']:
+        os.close(fd)
+
+    # A full pipe doesn't block the caller
+    mocker.patch.object(os, 'write',
+                        side_effect=OSError(errno.EAGAIN, 'full'))
+    profiler._wake(1)
+
+
+def test_prune(profile_dir):
+    for session in range(1, 8):
+        profile_dir.join('profile-{0}-1.txt'.format(session)).write('')
+
+    profiler._prune('7')
+    assert sorted(p.basename for p in profile_dir.listdir()) == \
+        ['profile-{0}-1.txt'.format(s) for s in (3, 4, 5, 6, 7)]
+
+
+def test_signal(profile_dir, mocker):
+    mocker.patch.dict(CONFIG_OVERRIDE, {'PROFILE_SIGNAL': 'SIGUSR2',
+                                        'PROFILE_DURATION': '0.1'})
+    request = mocker.patch.object(profiler, 'request')
+    previous = signal.getsignal(signal.SIGUSR2)
+    try:
+        profiler.install_signal()
+        os.kill(os.getpid(), signal.SIGUSR2)
+    finally:
+        signal.signal(signal.SIGUSR2, previous)
+
+    request.assert_called_once_with(0.1)
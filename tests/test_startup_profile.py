@@ -0,0 +1,34 @@
+import json
+import os
+import time
+
+from cattle import startup_profile
+
+from .common_fixtures import SCRATCH_DIR
+
+
+def test_startup_profile_report(mocker):
+    mocker.patch.dict(startup_profile._PROFILE, records=[])
+    path = os.path.join(SCRATCH_DIR, 'startup-profile.json')
+
+    with startup_profile.timed('plugin', 'ignored'):
+        pass
+    assert startup_profile._PROFILE['records'] == []
+
+    start = time.time()
+    startup_profile.enable(path, start=start)
+    startup_profile.record('phase', 'plugins', start + 1, 0.5)
+    with startup_profile.timed('plugin', 'docker'):
+        pass
+    startup_profile.set_imports([{'name': 'arrow', 'duration': 0.1},
+                                 {'name': 'docker', 'duration': 0.2}])
+    startup_profile.finish()
+
+    assert not startup_profile.enabled()
+    with open(path) as f:
+        report = json.load(f)
+
+    assert report['timings']['phase'] == [
+        {'name': 'plugins', 'start': 1.0, 'duration': 0.5}]
+    assert [p['name'] for p in report['timings']['plugin']] == ['docker']
+    assert [i['name'] for i in report['imports']] == ['docker', 'arrow']
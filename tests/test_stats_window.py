@@ -0,0 +1,79 @@
+import json
+import os
+
+from cattle.plugins.host_info.stats_window import cpu_window, \
+    duration_seconds, percentile, samples_for_window
+from cattle.utils import CadvisorAPIClient
+
+TEST_DIR = os.path.dirname(__file__)
+
+
+def _sample(seconds, *per_cpu):
+    return {
+        'timestamp': int(seconds * 10 ** 9),
+        'cpu': {'usage': {'per_cpu_usage': [int(c * 10 ** 9)
+                                            for c in per_cpu]}},
+    }
+
+
+def _diff(a, b):
+    return float(a - b)
+
+
+def test_duration_seconds():
+    assert duration_seconds('1s') == 1
+    assert duration_seconds('500ms') == 0.5
+    assert duration_seconds('1m30s') == 90
+    assert samples_for_window(60, 1) == 61
+    assert samples_for_window(60, 0) == 2
+
+
+def test_percentile():
+    assert percentile([], 95) is None
+    assert percentile(range(1, 21), 95) == 19
+    assert percentile([5], 95) == 5
+
+
+def test_cpu_window():
+    samples = [_sample(0, 0, 0),
+               _sample(1, 0.5, 0.5),
+               _sample(2, 1.5, 1.5),
+               _sample(4, 1.5, 2.5)]
+
+    window = cpu_window(samples, _diff)
+    assert window == {
+        'seconds': 4,
+        'samples': 4,
+        'coresPercentages': [37.5, 62.5],
+        'min': 25,
+        'avg': 50,
+        'max': 100,
+        'p95': 100,
+    }
+
+    window = cpu_window(samples, _diff, window=2)
+    assert window['samples'] == 2
+    assert window['coresPercentages'] == [0, 50]
+
+    assert cpu_window(samples[:1], _diff) is None
+
+
+def test_cpu_window_core_count_change():
+    samples = [_sample(0, 0), _sample(1, 1, 0), _sample(2, 1.5, 0.5)]
+    window = cpu_window(samples, _diff)
+    assert window['samples'] == 2
+    assert window['coresPercentages'] == [50, 50]
+
+
+def test_cpu_window_cadvisor_stats():
+    with open(os.path.join(TEST_DIR, 'host_info/cadvisor_stats')) as f:
+        stats = json.load(f)['stats']
+
+    client = CadvisorAPIClient('127.0.0.1', '9344')
+    window = cpu_window(stats, client.timestamp_diff, window=30)
+
+    assert window['samples'] == 31
+    assert 29 < window['seconds'] <= 30
+    assert len(window['coresPercentages']) == 2
+    assert window['min'] <= window['avg'] <= window['max']
+    assert window['min'] <= window['p95'] <= window['max']
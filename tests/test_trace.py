@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from cattle import CONFIG_OVERRIDE
+from cattle import trace
+from cattle.lock import lock
+
+
+@pytest.fixture
+def tracer(mocker, tmpdir):
+    mocker.patch.dict(CONFIG_OVERRIDE, {
+        'TRACE_FILE': str(tmpdir.join('trace.jsonl')),
+        'TRACE_SAMPLE': '1',
+        'TRACE_PING_SAMPLE': '0',
+        'LOCK_DIR': str(tmpdir.join('locks')),
+    })
+    trace.init(['compute.instance.activate;agent=1', 'ping'])
+    return tmpdir.join('trace.jsonl')
+
+
+def _count(event, stage):
+    snapshot = trace._duration.snapshot().get((event, stage))
+    return snapshot['count'] if snapshot else 0
+
+
+def test_stages(tracer, mocker):
+    now = mocker.patch('time.time', return_value=100.0)
+    before = _count('compute.instance.activate', 'total')
+
+    t = trace.begin(received=99.5)
+    t.add('queue', 0.5)
+    t.id = 'id1'
+    t.name = 'compute.instance.activate;agent=1'
+    with trace.span('handler'):
+        now.return_value = 101.0
+        with lock('instance-1'):
+            pass
+        trace.add('docker', 0.25)
+        trace.add('docker', 0.25)
+    now.return_value = 101.5
+    trace.end()
+    assert trace.current() is None
+
+    record = json.loads(tracer.read())
+    assert record['id'] == 'id1'
+    assert record['stages'] == {'queue': 0.5, 'handler': 1, 'lock': 0,
+                                'docker': 0.5, 'total': 2}
+    assert _count('compute.instance.activate', 'total') == before + 1
+
+
+def test_ping_sampling(tracer):
+    before = _count('ping', 'total')
+    t = trace.begin()
+    t.name = 'ping'
+    trace.end()
+
+    assert not tracer.exists()
+    assert _count('ping', 'total') == before
+
+
+def test_no_trace():
+    trace.add('docker', 1)
+    with trace.span('publish'):
+        pass
+    trace.end()
+
+
+def test_unknown_event(tracer):
+    t = trace.begin()
+    t.name = 'storage.volume.remove'
+    assert t.event() == trace.OTHER
+    trace.end()
+    assert json.loads(tracer.read())['name'] == 'storage.volume.remove'
@@ -0,0 +1,37 @@
+import pytest
+
+from cattle.plugins.docker import DockerConfig, tracing
+
+
+class FakeClient(object):
+    def containers(self, all=False):
+        return ['c1']
+
+    def inspect_container(self, container):
+        assert tracing.IN_FLIGHT.get('inspect_container') == 1
+        raise KeyError(container)
+
+    def create_host_config(self):
+        return {}
+
+
+def test_traced_client():
+    tracing.install(FakeClient)
+    tracing.install(FakeClient)
+    before = tracing.stats().get('containers', {}).get('count', 0)
+
+    client = FakeClient()
+    assert client.containers(all=True) == ['c1']
+    with pytest.raises(KeyError):
+        client.inspect_container('c1')
+    assert not hasattr(FakeClient.create_host_config, 'traced')
+
+    stats = tracing.stats()
+    assert stats['containers']['count'] == before + 1
+    assert stats['inspect_container']['errors'] >= 1
+    assert stats['inspect_container']['inFlight'] == 0
+    assert stats['containers']['p50'] is not None
+
+
+def test_off_by_default():
+    assert not DockerConfig.docker_trace()
@@ -1,5 +1,16 @@
+import BaseHTTPServer
+import SocketServer
+import calendar
+import datetime
+import os
+import pickle
+import threading
+
 import pytest
-from cattle.utils import CadvisorAPIClient
+from cattle import utils
+from cattle.agent.event import _parse
+from cattle.plugins.core.marshaller import Marshaller
+from cattle.utils import CadvisorAPIClient, JsonObject, parse_timestamp
 
 
 @pytest.fixture
@@ -18,3 +29,171 @@ def test_cadvisor_time(cadvisor_client):
         val = cadvisor_client.timestamp_diff(time_val_key,
                                              time_vals[time_val_key])
         assert type(val) == float
+
+
+def test_cadvisor_time_diff(cadvisor_client):
+    assert cadvisor_client.timestamp_diff(
+        '2015-09-11T23:24:18.000000001Z',
+        '2015-09-11T23:24:17.465693131Z') == 534306870.0
+    assert cadvisor_client.timestamp_diff(
+        '2015-02-04T23:21:38.251266323-07:00',
+        '2015-02-05T06:21:38.251266323Z') == 0
+
+
+def test_parse_timestamp():
+    def expected(*args):
+        dt = datetime.datetime(*args[:6])
+        return calendar.timegm(dt.timetuple()) * 10 ** 9 + args[6]
+
+    assert parse_timestamp('1970-01-01T00:00:00Z') == 0
+    assert parse_timestamp('2015-09-11T23:24:17.465693131Z') == \
+        expected(2015, 9, 11, 23, 24, 17, 465693131)
+    assert parse_timestamp('2016-02-29T12:00:00.5Z') == \
+        expected(2016, 2, 29, 12, 0, 0, 500000000)
+    assert parse_timestamp('2015-01-01T01:30:00.000001+01:30') == \
+        expected(2015, 1, 1, 0, 0, 0, 1000)
+    assert parse_timestamp('1999-12-31T23:00:00-01:00') == \
+        expected(2000, 1, 1, 0, 0, 0, 0)
+
+
+def test_cadvisor_snapshot_per_cycle(mocker):
+    client = CadvisorAPIClient('127.0.0.1', '9344', num_stats=2)
+    stats = {'stats': [{'n': 1}, {'n': 2}]}
+    get = mocker.patch.object(client, '_get', return_value=stats)
+
+    client.new_cycle()
+    assert client.get_stats() == [{'n': 1}, {'n': 2}]
+    assert client.get_latest_stat() == {'n': 2}
+    get.assert_called_once_with(
+        'http://127.0.0.1:9344/api/v1.3/containers', {'num_stats': 2})
+
+    client.new_cycle()
+    client.get_stats()
+    assert get.call_count == 2
+
+
+def test_cadvisor_no_cycle_fetches_every_time(mocker):
+    client = CadvisorAPIClient('127.0.0.1', '9344')
+    get = mocker.patch.object(client, '_get', return_value=None)
+
+    assert client.get_stats() == []
+    assert client.get_latest_stat() == {}
+    assert get.call_count == 2
+    get.assert_called_with('http://127.0.0.1:9344/api/v1.3/containers', None)
+
+
+def _event(name, data=None):
+    return JsonObject({'id': '1', 'name': name, 'replyTo': 'reply.1',
+                       'resourceType': None, 'resourceId': None,
+                       'data': data or {}})
+
+
+def test_classify():
+    ping = _event('ping;agent=1')
+    assert utils.classify(ping) == utils.PING
+    assert utils.classify(utils.reply(ping)) == utils.PING
+    assert utils.classify(_event('delegate.request',
+                                 {'event': {'name': 'ping'}})) == utils.PING
+    assert utils.classify(JsonObject({
+        'name': 'reply.2',
+        'data': {'previousNames': ['ping;agent=1']}})) == utils.PING
+
+    work = _event('compute.instance.activate;agent=1',
+                  {'name': 'ping', 'previousNames': 'ping'})
+    assert utils.classify(work) == utils.WORK
+    assert utils.classify(_event('ping.other')) == utils.WORK
+    assert utils.classify(None) == utils.WORK
+
+    # Kept on the event, but not sent
+    work.name = 'ping'
+    assert utils.classify(work) == utils.WORK
+    assert '_kind' not in JsonObject.unwrap(utils.reply(ping))
+
+
+def test_parse_line():
+    marshaller = Marshaller()
+    req = _parse(marshaller, '{"name": "ping;agent=1"}')
+    assert req.name == 'ping;agent=1'
+    assert req._kind == utils.PING
+    req = _parse(marshaller, '{"name": "storage.volume.activate", '
+                             '"data": {"volume": {"name": "ping"}}}')
+    assert utils.classify(req) == utils.WORK
+    assert _parse(marshaller, '{"name": "ping') is None
+
+    # Workers in other processes get the request, kind included, pickled
+    req = pickle.loads(pickle.dumps(
+        _parse(marshaller, '{"name": "ping", "data": {"a": [1]}}'), 2))
+    assert req._kind == utils.PING
+    assert req.data.a == [1]
+
+
+def test_log_request(mocker):
+    log = mocker.Mock()
+    utils.log_request(_event('ping'), log, 'Request: %s', 'x')
+    log.debug.assert_called_once_with('Request: %s', 'x')
+
+    utils.log_request(_event('compute.instance.activate'), log, 'Request')
+    log.info.assert_called_once_with('Request')
+
+
+def test_cadvisor_session_per_process(mocker):
+    session, lock = utils._cadvisor_session()
+    assert utils._cadvisor_session()[0] is session
+
+    others = []
+    t = threading.Thread(target=lambda: others.append(
+        utils._cadvisor_session()))
+    t.start()
+    t.join()
+    assert others[0] == (session, lock)
+
+    # As seen by a forked worker
+    mocker.patch('os.getpid', return_value=os.getpid() + 1)
+    forked, forked_lock = utils._cadvisor_session()
+    assert forked is not session
+    assert forked_lock is not lock
+
+
+class _CountingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = []
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connections.append(self.client_address)
+
+    def do_GET(self):
+        body = '{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_cadvisor_connection_reused_across_pings():
+    server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0),
+                                             _CountingHandler)
+    server.daemon_threads = True
+    t = threading.Thread(target=server.serve_forever)
+    t.setDaemon(True)
+    t.start()
+    try:
+        client = CadvisorAPIClient('127.0.0.1', server.server_address[1])
+        # Each ping runs every collector on a new thread
+        for ping in range(2):
+            threads = [threading.Thread(target=client._get,
+                                        args=(client.url + '/machine',))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(_CountingHandler.connections) == 1